@@ -1,10 +1,11 @@
 """Get gridded prodcuts by station locations."""
 import xarray as xr
 import numpy as np
+import pandas as pd
 from google.cloud import secretmanager
 
 from nuthatch import cache, config_parameter
-from sheerwater.utils import dask_remote, get_grid, is_station_grid
+from sheerwater.utils import dask_remote, extract_at_stations, get_grid, is_station_grid
 from sheerwater.spatial_subdivisions import nonuniform_grid
 from sheerwater.interfaces import get_data
 
@@ -54,11 +55,6 @@ def data_at_stations(start_time, end_time, data='imerg', variable='precip', agg_
         if not is_station_grid(station_df):
             raise ValueError(f"Station grid {station_df} is not a station grid")
 
-        if nonuniform_grid(ds):
-            # Set the index for lat and lon in a nonuniform grid
-            # This requires xarray version 2025.07.01 - set this in the pyproject.toml file before running
-            ds = ds.set_xindex(("lat", "lon"), xr.indexes.NDPointIndex)
-
         # We want to get the nearest grid point to the station, so we set tolerance
         # in the sel to the half width of the grid wel. For nonuniform grids like
         # SMAP, we use a fixed tolerance that's bigger than the smap size.
@@ -66,13 +62,27 @@ def data_at_stations(start_time, end_time, data='imerg', variable='precip', agg_
             _, _, grid_size, _ = get_grid(grid)
         except NotImplementedError:
             grid_size = 0.1
+        tolerance = grid_size/2 + 1e-6
 
-        ds = ds.sel(
-            lat=station_df["lat"],
-            lon=station_df["lon"],
-            method="nearest",
-            tolerance=grid_size/2 + 1e-6
-        )
+        if nonuniform_grid(ds):
+            # Set the index for lat and lon in a nonuniform grid
+            # This requires xarray version 2025.07.01 - set this in the pyproject.toml file before running
+            ds = ds.set_xindex(("lat", "lon"), xr.indexes.NDPointIndex)
+            ds = ds.sel(
+                lat=station_df["lat"],
+                lon=station_df["lon"],
+                method="nearest",
+                tolerance=tolerance
+            )
+        else:
+            # Gather the grid cell of every station with the batch extraction engine, which logs
+            # the stations that fall outside the grid, and keep the station locations
+            table = extract_at_stations({variable: ds[variable]}, station_df['station_id'].values,
+                                        station_df['lat'].values, station_df['lon'].values, tolerance=tolerance)
+            tab = table.to_pandas().drop(columns=['product']).rename(columns={'value': variable})
+            locations = pd.DataFrame({'station_id': station_df['station_id'].values,
+                                      'lat': station_df['lat'].values, 'lon': station_df['lon'].values})
+            return tab.merge(locations, on='station_id', how='left')
 
     # Select those grid points from the satellite data
     tab = ds.to_dask_dataframe()
@@ -105,12 +115,17 @@ def scatter_data(start_time, end_time,
     # country_ds = clip_region(country_ds, grid=grid, region=region)
     # ds = ds.assign_coords(country=(('lat', 'lon'), country_ds['region'].values))
 
-    # stack into a table
-    ds = ds.stack(points=("time", "lat", "lon"))
-    # drop rows where 'tahmo_avg_precip' is NaN, so that we only have data where both TAHMO and the truth are available
-    ds = ds.dropna("points", subset=["tahmo_avg_precip"])
+    # Only grid cells with TAHMO data can be paired, so gather those cells with a vectorized isel
+    # rather than stacking the full grid. TAHMO is computed once, to find the cells and as data.
+    tahmo = ds['tahmo_avg_precip'].compute()
+    lat_idx, lon_idx = np.nonzero(tahmo.notnull().any('time').transpose('lat', 'lon').values)
+    points = {'lat': xr.DataArray(lat_idx, dims='points'), 'lon': xr.DataArray(lon_idx, dims='points')}
+    ds = ds.drop_vars('tahmo_avg_precip').isel(points)
+    ds['tahmo_avg_precip'] = tahmo.isel(points)
 
     # convert to dataframe
-    df = ds.to_dataframe()
-    df = df.drop(columns=['time', 'lat', 'lon']).reset_index()
-    return df
+    df = ds.to_dataframe().reset_index().drop(columns=['points'])
+    # drop rows where 'tahmo_avg_precip' is NaN, so that we only have data where both TAHMO and the truth are available
+    df = df.dropna(subset=["tahmo_avg_precip"])
+    df = df[['time', 'lat', 'lon'] + [col for col in df.columns if col not in ('time', 'lat', 'lon')]]
+    return df.reset_index(drop=True)
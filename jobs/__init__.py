@@ -1,5 +1 @@
 """Jobs package."""
-
-from .job_utils import parse_args, run_in_parallel, prune_metrics
-
-__all__ = ["parse_args", "run_in_parallel", "prune_metrics"]
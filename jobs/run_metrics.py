@@ -1,7 +1,9 @@
 """A combined runner utility that reads metrics.yaml, and allows the running and monitoring of multiple metrics."""
 #!/usr/bin/env python
 import argparse
-import dask
+import concurrent.futures
+import json
+import os
 import time
 import yaml
 import copy
@@ -10,86 +12,297 @@ import itertools
 import sheerwater.metrics as metrics
 import dashboard_data
 from sheerwater.utils import start_remote
+from dask.distributed import as_completed, get_client
 import multiprocessing
 
 
-def run_in_parallel(func, iterable, parallelism, skip=0, name=""):
-    """Run a function in parallel with dask delayed.
+def _run_combo(func, combo):
+    """Run func on one combination, returning its status and duration rather than its result."""
+    start = time.perf_counter()
+    try:
+        out = func(**combo)
+        status, error = ('succeeded' if out is not None else 'null'), None
+    except Exception as e:
+        status, error = 'failed', repr(e)
+    return {'status': status, 'duration': time.perf_counter() - start, 'error': error}
+
+
+# Arguments that control how a combination is run rather than what it computes
+RUN_ARGS = ['filepath_only', 'recompute', 'cache_mode', 'storage_backend', 'backend_kwargs',
+            'memoize_forecast', 'memoize_truth']
+# Arguments of the upstream forecast and truth caches read by a metric combination
+UPSTREAM_ARGS = ['forecast', 'truth', 'variable', 'grid', 'agg_days', 'start_time', 'end_time', 'mask', 'region']
+# Number of cache checks in flight when resuming a job
+PRECHECK_CONCURRENCY = 32
+
+
+def combo_key(combo):
+    """A key identifying what a combination computes, ignoring how it is run."""
+    return json.dumps({k: v for k, v in combo.items() if k not in RUN_ARGS}, sort_keys=True, default=str)
+
+
+def upstream_key(combo):
+    """A key identifying the upstream forecast and truth caches a combination reads."""
+    return json.dumps({k: combo.get(k) for k in UPSTREAM_ARGS}, sort_keys=True, default=str)
+
+
+def load_run_costs(log_paths):
+    """Load the mean duration of each combination from previous run logs written by run_in_parallel.
+
+    Failed runs are ignored, as they may have stopped early.
+
+    Returns:
+        dict: The mean duration in seconds of each combination, by combo_key.
+    """
+    durations = {}
+    for log_path in log_paths or []:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('status') == 'failed' or record.get('duration') is None:
+                    continue
+                durations.setdefault(combo_key(record['combo']), []).append(record['duration'])
+    return {key: sum(d) / len(d) for key, d in durations.items()}
+
+
+def plan_combos(combos, costs=None):
+    """Order combinations so each shared upstream is computed once, longest work first.
+
+    Duplicate combinations are dropped. The remaining ones are grouped by the upstream caches they
+    read. In each group, the cheapest combination runs first to warm the upstream caches, and the rest
+    of the group waits for it, so several workers do not compute the same missing upstream at once.
+    Groups are ordered by their total estimated cost, and combinations within a group by their own.
+
+    Costs are taken from previous runs of the same combination, or else the mean cost of its group,
+    or else the mean cost of all combinations.
 
     Args:
-        func(callable): A function to call. Must take one of iterable as an argument.
-        iterable (iterable): Any iterable object to pass to func.
-        parallelism (int): Number of func(iterables) to run in parallel at a time.
-        skip (int): Number of iterables to skip.
-        name (str): Name of the runner for printing.
+        combos (list): The combinations to run.
+        costs (dict): The estimated duration of combinations by combo_key, as returned by load_run_costs.
+
+    Returns:
+        (list, dict): The indices of the combinations to run in order, and the index of the warm
+            combination each dependent combination must wait for.
     """
-    iterable, copy = itertools.tee(iterable)
-    length = len(list(copy))
-    counter = 0
-    success_count = 0
-    failed = []
-    if parallelism <= 1:
-        for i, it in enumerate(iterable):
-            if i < skip:
-                continue
-
-            if name:
-                print(f"{name}: Running {i+1}/{length}")
-            else:
-                print(f"Running {i+1}/{length}")
+    costs = costs or {}
+    default_cost = sum(costs.values()) / len(costs) if costs else 0.0
+
+    groups = {}
+    seen = set()
+    for i, combo in enumerate(combos):
+        key = combo_key(combo)
+        if key in seen:
+            continue
+        seen.add(key)
+        groups.setdefault(upstream_key(combo), []).append(i)
+
+    group_costs = {}
+    combo_costs = {}
+    for key, indices in groups.items():
+        known = [costs[combo_key(combos[i])] for i in indices if combo_key(combos[i]) in costs]
+        group_default = sum(known) / len(known) if known else default_cost
+        for i in indices:
+            combo_costs[i] = costs.get(combo_key(combos[i]), group_default)
+        group_costs[key] = sum(combo_costs[i] for i in indices)
+
+    order = []
+    after = {}
+    for key in sorted(groups, key=lambda k: group_costs[k], reverse=True):
+        warm = min(groups[key], key=lambda i: combo_costs[i])
+        dependents = sorted((i for i in groups[key] if i != warm), key=lambda i: combo_costs[i], reverse=True)
+        order.append(warm)
+        for i in dependents:
+            order.append(i)
+            after[i] = warm
+    return order, after
+
+
+def load_succeeded_combos(log_paths):
+    """The combo_keys of the combinations that succeeded in previous run logs written by run_in_parallel."""
+    succeeded = set()
+    for log_path in log_paths or []:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get('status') == 'succeeded':
+                        succeeded.add(combo_key(record['combo']))
+    return succeeded
+
+
+def _cache_exists(func, combo):
+    """Whether the cache of a combination exists, asking the cache for its path without computing it."""
+    try:
+        return func(**{**combo, 'filepath_only': True, 'fail_if_no_cache': True}) is not None
+    except Exception:
+        return False
 
-            out = func(**it)
-            if out is not None:
-                success_count += 1
-            else:
-                failed.append(it)
-    else:
-        for it in itertools.batched(iterable, parallelism):
-            if counter < skip:
-                counter = counter + parallelism
-                continue
 
-            output = []
+def find_pending_combos(func, combos, log_paths=None, max_concurrency=PRECHECK_CONCURRENCY):
+    """Drop the combinations whose results are already cached, to resume an interrupted job.
 
-            if name:
-                print(f"{name}: Running {counter+1}...{counter+parallelism}/{length}")
-            else:
-                print(f"Running {counter+1}...{counter+parallelism}/{length}")
+    Combinations that succeeded in previous run logs are taken as done without touching the cache.
+    The caches of the rest are checked concurrently, before any cluster is started. Combinations run
+    with recompute are always pending.
 
-            sys.stdout.flush()
+    Args:
+        func (callable): The cached function the combinations are run with.
+        combos (list): The combinations to run.
+        log_paths (list): Run logs of previous runs of the job.
+        max_concurrency (int): The maximum number of cache checks in flight.
 
-            for i in it:
-                out = dask.delayed(func)(**i)
-                if out is None:
-                    failed.append(i)
+    Returns:
+        list: The combinations still to run, in order.
+    """
+    succeeded = load_succeeded_combos(log_paths)
+    done = [not combo.get('recompute') and combo_key(combo) in succeeded for combo in combos]
+    from_logs = sum(done)
+    to_check = [i for i, combo in enumerate(combos) if not done[i] and not combo.get('recompute')]
 
-                output.append(out)
+    start = time.perf_counter()
+    if to_check:
+        with concurrent.futures.ThreadPoolExecutor(max_concurrency) as pool:
+            for i, exists in zip(to_check, pool.map(lambda i: _cache_exists(func, combos[i]), to_check)):
+                done[i] = exists
 
-            start_time = time.perf_counter()
-            results = dask.compute(output)[0]
-            end_time = time.perf_counter()
-            execution_time = end_time - start_time
+    pending = [combo for combo, is_done in zip(combos, done) if not is_done]
+    print(f"Resuming: {len(combos) - len(pending)} runs already cached ({from_logs} from run logs), "
+          f"{len(pending)} pending. Checked {len(to_check)} caches in "
+          f"{time.perf_counter() - start:.0f}s.")
+    return pending
 
-            ls_count = 0
-            for i, r in enumerate(results):
-                if r is not None:
-                    ls_count += 1
-                    success_count += 1
-                else:
-                    failed.append(it[i])
-                    print(f" -- Failed metric: {it[i]} -- ")
 
-            if name:
-                print(f"{name}: {ls_count} succeeded in {(int)(execution_time/parallelism)}s per metric.")
-            else:
-                print(f"{ls_count} succeeded in {(int)(execution_time/parallelism)}s per metric.")
+def _work_queue(func, items, max_concurrency, after=None):
+    """Run func on (index, combo) items, keeping up to max_concurrency runs in flight.
+
+    A new run is submitted as soon as any run finishes, so a slow run does not hold back the others.
+    Items are submitted in order, except that an item waits until the run it depends on has finished.
+    Runs are submitted to the dask cluster if there is one, otherwise to a local thread pool.
 
-            counter = counter + parallelism
+    Args:
+        func (callable): The function to run on each combination.
+        items (list): The (index, combo) items to run, in order.
+        max_concurrency (int): The maximum number of runs in flight.
+        after (dict): The index of the run each index must wait for, if any.
+
+    Yields:
+        (index, record) for each run as it finishes, where record is returned by _run_combo.
+    """
+    after = after or {}
+    waiting = list(items)
+    finished = set()
 
-    if name:
-        print(f"{name}: {success_count}/{length} returned non-null values. Runs that failed: {failed}")
+    def take(n):
+        """Remove and return up to n waiting items whose dependencies have finished."""
+        ready = [item for item in waiting if after.get(item[0]) is None or after[item[0]] in finished][:n]
+        for item in ready:
+            waiting.remove(item)
+        return ready
+
+    try:
+        client = get_client()
+    except ValueError:
+        client = None
+
+    if client is not None:
+        indices = {}
+        queue = as_completed()
+
+        def submit(n):
+            for index, combo in take(n):
+                future = client.submit(_run_combo, func, combo, pure=False)
+                indices[future.key] = index
+                queue.add(future)
+
+        submit(max_concurrency)
+        for future in queue:
+            try:
+                record = future.result()
+            except Exception as e:
+                # The worker running the combination was lost
+                record = {'status': 'failed', 'duration': None, 'error': repr(e)}
+            index = indices.pop(future.key)
+            finished.add(index)
+            yield index, record
+            submit(max_concurrency - len(indices))
     else:
-        print(f"{success_count}/{length} returned non-null values. Runs that failed: {failed}")
+        with concurrent.futures.ThreadPoolExecutor(max_concurrency) as pool:
+            pending = {}
+
+            def submit(n):
+                for index, combo in take(n):
+                    pending[pool.submit(_run_combo, func, combo)] = index
+
+            submit(max_concurrency)
+            while pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    finished.add(index)
+                    yield index, future.result()
+                submit(max_concurrency - len(pending))
+
+
+def run_in_parallel(func, iterable, parallelism, skip=0, name="", log_path=None, plan=False, cost_logs=None):
+    """Run a function on each combination, with up to parallelism runs in flight at a time.
+
+    Args:
+        func(callable): A function to call. Must take one of iterable as an argument.
+        iterable (iterable): Any iterable object to pass to func.
+        parallelism (int): Maximum number of func(iterables) to run concurrently.
+        skip (int): Number of iterables to skip.
+        name (str): Name of the runner for printing.
+        log_path (str): A JSONL file to append the status and duration of each run to.
+        plan (bool): Whether to drop duplicates and order the runs with plan_combos, rather than run them in order.
+        cost_logs (list): Run logs of previous runs, to estimate the cost of each run when planning.
+
+    Returns:
+        list: The record of each run, with its combination, status, duration in seconds and error.
+    """
+    combos = list(iterable)
+    length = len(combos)
+    prefix = f"{name}: " if name else ""
+    items = [(i, combo) for i, combo in enumerate(combos) if i >= skip]
+    after = None
+    if plan:
+        order, after = plan_combos([combo for _, combo in items], load_run_costs(cost_logs))
+        print(f"{prefix}Planned {len(order)} runs over {len(set(after.values()))} shared upstreams, "
+              f"dropping {len(items) - len(order)} duplicates.")
+        after = {items[i][0]: items[warm][0] for i, warm in after.items()}
+        items = [items[i] for i in order]
+
+    def run_in_order():
+        for i, combo in items:
+            print(f"{prefix}Running {i+1}/{length}")
+            yield i, _run_combo(func, combo)
+
+    results = run_in_order() if parallelism <= 1 else _work_queue(func, items, parallelism, after=after)
+
+    records = []
+    start_time = time.perf_counter()
+    for i, record in results:
+        record = {'name': name, 'index': i, 'combo': combos[i], **record}
+        records.append(record)
+        duration = f"{record['duration']:.0f}s" if record['duration'] is not None else "unknown time"
+        print(f"{prefix}{len(records)}/{len(items)} done: run {i+1}/{length} {record['status']} in {duration}")
+        if record['status'] != 'succeeded':
+            print(f" -- {record['status'].capitalize()} metric: {combos[i]} {record['error'] or ''} -- ")
+        sys.stdout.flush()
+        if log_path is not None:
+            with open(log_path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    failed = [record['combo'] for record in records if record['status'] != 'succeeded']
+    success_count = len(records) - len(failed)
+    print(f"{prefix}{success_count}/{length} returned non-null values in {time.perf_counter() - start_time:.0f}s. "
+          f"Runs that failed: {failed}")
+    return records
 
 
 def extract_combos_from_args(args):
@@ -174,16 +387,21 @@ def extract_combos_from_file(file, metric_group):
     return function, combos
 
 
-def start_and_run_group(combos, parallelism, skip, remote_name, remote_config, function):
+def start_and_run_group(combos, parallelism, skip, remote_name, remote_config, function, log_path=None,
+                        plan=False, cost_logs=None):
     """Start a cluster and run a set of function combinations on that cluster."""
     iterable, combos_copy = itertools.tee(combos)
     length = len(list(combos_copy))
+    if length == 0:
+        print(f"No runs pending for {remote_name}, not starting a cluster.")
+        return
     print(f"Starting cluster {remote_name} to run {length} metrics with {parallelism} parallelism.\n \
             \tcluster_config: {remote_config}")
 
     start_remote(remote_name=remote_name, remote_config=remote_config)
     combos = copy.deepcopy(combos)
-    run_in_parallel(function, combos, parallelism, skip=skip, name=remote_name)
+    run_in_parallel(function, combos, parallelism, skip=skip, name=remote_name, log_path=log_path,
+                    plan=plan, cost_logs=cost_logs)
 
 
 if __name__ == "__main__":
@@ -229,9 +447,20 @@ if __name__ == "__main__":
     parser.add_argument("--remote-name", type=str, nargs='*',
                         help="Name of remote cluster to use. If using divide by can be passed \
                         once for all clusters or for each divide by group.")
-    parser.add_argument("--parallelism", type=int, nargs='*',
-                        help="Number of runs to run in parallel. If using divide by can be passed \
+    parser.add_argument("--parallelism", "--max-concurrency", type=int, nargs='*',
+                        help="Maximum number of runs in flight at a time. If using divide by can be passed \
                         once for all clusters or for each divide by group.")
+    parser.add_argument("--run-log", type=str, default=None,
+                        help="A JSONL file to append the status and duration of each run to.")
+    parser.add_argument("--plan", action=argparse.BooleanOptionalAction, default=True,
+                        help="Whether to drop duplicate runs, warm each shared forecast and truth once before \
+                        the runs that read it and run the longest work first. Otherwise runs in order.")
+    parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=False,
+                        help="Whether to skip runs that are already cached, or that succeeded in the run logs, \
+                        before starting any cluster. Skip then counts pending runs only.")
+    parser.add_argument("--previous-log", "--cost-log", type=str, nargs='*',
+                        help="Run logs of previous runs, to estimate run costs when planning and to find \
+                        finished runs when resuming. Defaults to the run log.")
     parser.add_argument("--remote-config", type=str, action='append', nargs='*',
                         help="Remote configuration to use. If using divide by can be passed \
                         once for all clusters or for each divide by group.")
@@ -240,6 +469,8 @@ if __name__ == "__main__":
                         once for all clusters or for each divide by group.")
     args = parser.parse_args()
 
+    previous_logs = args.previous_log if args.previous_log is not None else [args.run_log] if args.run_log else []
+
     # Get all the combinations of metrics to run -
     # either through a product of passed options - or by resolving the yaml file
     combos_to_run = []
@@ -334,6 +565,11 @@ if __name__ == "__main__":
         except AttributeError:
             raise ValueError(f"Function {function} not found in metrics or dashboard_data modules")
 
+    # Drop the runs that are already cached before starting any cluster
+    if args.resume:
+        for key in dict_of_combos_to_run:
+            dict_of_combos_to_run[key] = find_pending_combos(function, dict_of_combos_to_run[key], previous_logs)
+
     # Start threads for each divide by group
         # In each thread start a cluster for each divide by group
         # Run in parallel for each group
@@ -362,11 +598,13 @@ if __name__ == "__main__":
             remote_config = args.remote_config[0]
 
         if parallelism <= 1:
-            start_and_run_group(combos, parallelism, skip, remote_name, remote_config, function)
+            start_and_run_group(combos, parallelism, skip, remote_name, remote_config, function, args.run_log,
+                                args.plan, previous_logs)
         else:
             processes.append(multiprocessing.Process(target=start_and_run_group,
                                                      args=(combos, parallelism, skip,
-                                                           remote_name, remote_config, function)))
+                                                           remote_name, remote_config, function, args.run_log,
+                                                           args.plan, previous_logs)))
     else:
         for key, value in dict_of_combos_to_run.items():
             if args.parallelism is None:
@@ -414,11 +652,13 @@ if __name__ == "__main__":
                                  passed to index the remote_config arguments.")
 
             if parallelism <= 1:
-                start_and_run_group(value, parallelism, skip, remote_name, remote_config, function)
+                start_and_run_group(value, parallelism, skip, remote_name, remote_config, function, args.run_log,
+                                    args.plan, previous_logs)
             else:
                 processes.append(multiprocessing.Process(target=start_and_run_group,
                                                          args=(value, parallelism, skip,
-                                                               remote_name, remote_config, function)))
+                                                               remote_name, remote_config, function,
+                                                               args.run_log, args.plan, previous_logs)))
 
     # Start all the processes
     for process in processes:
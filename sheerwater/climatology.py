@@ -1,5 +1,4 @@
 """A climatology baseline forecast for benchmarking."""
-import dask
 from datetime import datetime
 import dateparser
 import numpy as np
@@ -18,6 +17,9 @@ from sheerwater.utils import (
     get_dates,
     dask_remote, groupby_time,
     pad_with_leapdays)
+from sheerwater.utils.climatology_utils import (doy_accumulate, doy_accumulator_mean, doy_blocks_by_year,
+                                                doy_linear_trend, doy_lookup, doy_rolling_mean,
+                                                histogram_quantile, merge_doy_accumulators, sketch_edges)
 
 
 @dask_remote
@@ -114,6 +116,44 @@ def quantile_ranks(variable, data='imerg_final', first_year=1998, last_year=2015
     return qs
 
 
+@dask_remote
+@spatial()
+@cache(cache_args=['variable', 'data', 'first_year', 'last_year', 'agg_days',
+                   'time_grouping', 'n_quantiles', 'n_bins', 'grid'],
+       backend_kwargs={'chunking': {"lat": 300, "lon": 300, "group": 20, 'quantile': 50}
+                       })
+def quantile_ranks_sketch(variable, data='imerg_final', first_year=1998, last_year=2015, agg_days=1,
+                          time_grouping=None, n_quantiles=20, n_bins=512,
+                          grid="global1_5", mask=None, region='global'):  # noqa: ARG001
+    """Estimate the quantile ranks of a dataset from histogram sketches.
+
+    Unlike quantile_ranks, this sketches the data chunk by chunk in time instead of rechunking
+    the whole time axis into one chunk. The bins are fixed per variable by sketch_edges, so the data
+    is read once. Each quantile is within the width of the bins around the exact quantile.
+    """
+    start_time = f"{first_year}-01-01"
+    end_time = f"{last_year}-12-31"
+
+    data_fn = get_data(data)
+    ds = data_fn(start_time, end_time, variable=variable, agg_days=agg_days, grid=grid, mask=None, region='global')
+
+    # Select only the variable of interest
+    ds = ds[[variable]]
+
+    # Add one to account for the end point in the quantile calculation
+    ranks = np.linspace(0, 1, n_quantiles+1, endpoint=True)  # Includes 1
+    ranks = np.round(ranks, 5)  # round to 5 decimal places for more stable merging
+
+    edges = sketch_edges(variable, n_bins=n_bins)
+
+    ds = groupby_time(ds, time_grouping, agg_fn=None)
+    if time_grouping is not None:
+        qs = ds.groupby('group').map(lambda group: histogram_quantile(group.drop_vars('group'), ranks, edges))
+    else:
+        qs = histogram_quantile(ds, ranks, edges)
+    return qs.transpose('quantile', ...)
+
+
 @dask_remote
 @spatial()
 @cache(cache_args=['variable', 'first_year', 'last_year', 'grid'],
@@ -138,20 +178,8 @@ def climatology_raw(variable, first_year=1985, last_year=2014, grid='global1_5',
     return ds
 
 
-@dask_remote
-@spatial()
-@cache(cache_args=['variable', 'data', 'first_year', 'last_year', 'prob_type', 'agg_days', 'grid'],
-       backend_kwargs={
-           'chunking': {"lat": 40, "lon": 40, "dayofyear": 366, "member": 50},
-           'chunk_by_arg': {
-               'grid': {
-                   'global0_25': {"lat": 40, "lon": 40, 'dayofyear': 366, 'member': 50}
-               }
-           }
-})
-def climatology_agg_raw(variable, data='era5', first_year=1985, last_year=2014,
-                        prob_type='deterministic', agg_days=7, grid="global1_5", mask=None, region='global'):
-    """Generates aggregated climatology."""
+def _climatology_year_blocks(variable, data, first_year, last_year, agg_days, grid, mask, region):
+    """Read the climatology period once and split it into one day of year block per year."""
     data_fn = get_data(data)
     start_time = f"{first_year}-01-01"
     end_time = f"{last_year}-12-31"
@@ -166,14 +194,67 @@ def climatology_agg_raw(variable, data='era5', first_year=1985, last_year=2014,
     except KeyError:
         raise ValueError(f"Underlying data source {data} does not have full coverage "
                          f"of the climatology period {first_year}-{last_year}.")
-    # Take average over the period to produce climatology
+    return doy_blocks_by_year(ds)
+
+
+@dask_remote
+@spatial()
+@cache(cache_args=['variable', 'data', 'first_year', 'last_year', 'agg_days', 'grid'],
+       backend_kwargs={
+           'chunking': {"lat": 121, "lon": 240, "dayofyear": 366},
+           'chunk_by_arg': {
+               'grid': {
+                   'global0_25': {"lat": 300, "lon": 300, 'dayofyear': 366}
+               }
+           }
+})
+def climatology_doy_accumulator(variable, data='era5', first_year=1985, last_year=2014,
+                                agg_days=7, grid="global1_5", mask=None, region='global'):
+    """Running day of year sum and count of a dataset over a period of years. Years are inclusive.
+
+    If the accumulator up to the previous year is already cached, only the last year is read
+    and merged into it, so a climatology can be extended without recomputing the whole period.
+    """
+    previous = None
+    if last_year > first_year:
+        try:
+            previous = climatology_doy_accumulator(variable, data=data, first_year=first_year,
+                                                   last_year=last_year - 1, agg_days=agg_days, grid=grid,
+                                                   mask=mask, region=region, fail_if_no_cache=True)
+        except RuntimeError:
+            previous = None
+
+    read_from = last_year if previous is not None else first_year
+    _, blocks = _climatology_year_blocks(variable, data, read_from, last_year, agg_days, grid, mask, region)
+    acc = doy_accumulate(blocks)
+    if previous is not None:
+        acc = merge_doy_accumulators([previous, acc])
+    return acc
+
+
+@dask_remote
+@spatial()
+@cache(cache_args=['variable', 'data', 'first_year', 'last_year', 'prob_type', 'agg_days', 'grid'],
+       backend_kwargs={
+           'chunking': {"lat": 40, "lon": 40, "dayofyear": 366, "member": 50},
+           'chunk_by_arg': {
+               'grid': {
+                   'global0_25': {"lat": 40, "lon": 40, 'dayofyear': 366, 'member': 50}
+               }
+           }
+})
+def climatology_agg_raw(variable, data='era5', first_year=1985, last_year=2014,
+                        prob_type='deterministic', agg_days=7, grid="global1_5", mask=None, region='global'):
+    """Generates aggregated climatology."""
+    # Take average over the period to produce climatology, streaming over years
     if prob_type == 'deterministic':
-        return ds.groupby('dayofyear').mean(dim='time', skipna=True)
+        acc = climatology_doy_accumulator(variable, data=data, first_year=first_year, last_year=last_year,
+                                          agg_days=agg_days, grid=grid, mask=mask, region=region)
+        return doy_accumulator_mean(acc)
     elif prob_type == 'probabilistic':
         # Each year's day-of-year trajectory is one ensemble member.
-        ds = ds.assign_coords(year=('time', ds.time.dt.year.data))
-        ds = ds.set_index(time=['year', 'dayofyear']).unstack('time')
-        ds = ds.rename({'year': 'member'})
+        _, blocks = _climatology_year_blocks(variable, data, first_year, last_year, agg_days, grid, mask, region)
+        ds = xr.concat(blocks, dim='member')
         ds = ds.assign_coords(member=('member', np.arange(ds.sizes['member'])))
         ds = ds.chunk({'member': -1, 'dayofyear': -1})
         return ds
@@ -219,14 +300,9 @@ def climatology_rolling_agg(start_time, end_time, variable, clim_years=30,
     ds = add_dayofyear(ds)
     ds = pad_with_leapdays(ds)
 
-    def doy_rolling(sub_ds, years):
-        return sub_ds.rolling(time=years, min_periods=years, center=False).mean()
-
-    # Rechunk the data to have a single time chunk for efficient rolling
-    ds = ds.chunk(time=1)
-    ds = ds.groupby('dayofyear').map(doy_rolling, years=clim_years)
+    # Roll each day of year over the preceding years with prefix sums, keeping the time chunks
+    ds = doy_rolling_mean(ds, years=clim_years)
     ds = ds.dropna('time', how='all')
-    ds = ds.drop('dayofyear')
     return ds
 
 
@@ -294,10 +370,8 @@ def climatology_linear_weights(variable, first_year=1985, last_year=2014,
                                agg_days=agg_days, grid=grid, mask=mask,
                                region=region)
 
-    def fit_trend(sub_ds):
-        return sub_ds.swap_dims({"time": "year"}).polyfit(dim='year', deg=1)
-    # Fit the trend for each day of the year
-    ds = ds.groupby('dayofyear').map(fit_trend)
+    # Fit the trend for every day of the year at once, in closed form
+    ds = doy_linear_trend(ds)
     return ds
 
 
@@ -331,22 +405,19 @@ def climatology_daily_trend(start_time, end_time, variable, data='era5', first_y
         mask: Spatial mask to apply.
         region: Region to compute climatology for.
     """
-    # Create a target date dataset
-    target_dates = get_dates(start_time, end_time, stride='day', return_string=False)
-    time_ds = xr.Dataset({'time': target_dates})
-    time_ds = add_dayofyear(time_ds)
+    # Create the target dates
+    target_dates = pd.DatetimeIndex(get_dates(start_time, end_time, stride='day', return_string=False))
 
     if prob_type == 'probabilistic':
         raise NotImplementedError("Probabilistic trend forecasts are not supported.")
     if data != 'era5':
         raise NotImplementedError("Only era5 data is supported for trend forecasts.")
 
-    time_ds = time_ds.assign_coords(year=time_ds['time'].dt.year)
     coeff = climatology_linear_weights(variable, first_year=first_year, last_year=last_year,
                                        agg_days=1, grid=grid, mask=mask, region=region)
-    with dask.config.set(**{'array.slicing.split_large_chunks': True}):
-        coeff = coeff.sel(dayofyear=time_ds.dayofyear)
-        coeff = coeff.drop('dayofyear')
+    # Gather the coefficients for the day of year of each target date
+    coeff = doy_lookup(coeff, target_dates)
+    coeff = coeff.assign_coords(year=('time', target_dates.year))
 
     def linear_fit(coeff):
         """Compute the linear fit y = a * year + b for the given coefficients."""
@@ -390,18 +461,14 @@ def climatology_daily(start_time, end_time, variable, data='era5', first_year=19
         mask: Spatial mask to apply.
         region: Region to compute climatology for.
     """
-    # Create a target date dataset
+    # Create the target dates
     target_dates = get_dates(start_time, end_time, stride='day', return_string=False)
-    time_ds = xr.Dataset({'time': target_dates})
-    time_ds = add_dayofyear(time_ds)
 
     # Get climatology on the corresponding global grid
     ds = climatology_agg_raw(variable, data=data, first_year=first_year, last_year=last_year,
                              prob_type=prob_type, agg_days=1, grid=grid, mask=mask, region=region)
-    # Select the climatology data for the target dates, and split large chunks
-    with dask.config.set(**{'array.slicing.split_large_chunks': True}):
-        ds = ds.sel(dayofyear=time_ds.dayofyear)
-        ds = ds.drop_vars('dayofyear')
+    # Gather the climatology data for the day of year of each target date
+    ds = doy_lookup(ds, target_dates)
     return ds
 
 
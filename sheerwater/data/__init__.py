@@ -1,14 +1,29 @@
 """Data functions for all parts of the data pipeline."""
-from .chirps import chirp_v2, chirp_v3, chirps, chirps_v2, chirps_v3
-from .ghcn import ghcn, ghcn_avg
-from .imerg import imerg, imerg_final, imerg_late
-from .tahmo import tahmo, tahmo_avg
-from .knust import knust, knust_avg
-from .stations import stations
-from .rain_over_africa import rain_over_africa
-from .tamsat import tamsat
-from .smap import smap_l3, smap_l4
-from .oya import oya
+from sheerwater.utils.lazy_utils import lazy_exports
+
+# Data source modules are imported when one of their functions is first used
+lazy_exports(__name__, {
+    "chirp_v2": ".chirps",
+    "chirp_v3": ".chirps",
+    "chirps": ".chirps",
+    "chirps_v2": ".chirps",
+    "chirps_v3": ".chirps",
+    "ghcn": ".ghcn",
+    "ghcn_avg": ".ghcn",
+    "imerg": ".imerg",
+    "imerg_final": ".imerg",
+    "imerg_late": ".imerg",
+    "tahmo": ".tahmo",
+    "tahmo_avg": ".tahmo",
+    "knust": ".knust",
+    "knust_avg": ".knust",
+    "stations": ".stations",
+    "rain_over_africa": ".rain_over_africa",
+    "tamsat": ".tamsat",
+    "smap_l3": ".smap",
+    "smap_l4": ".smap",
+    "oya": ".oya",
+})
 
 # Use __all__ to define what is part of the public API.
 __all__ = [
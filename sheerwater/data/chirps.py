@@ -1,5 +1,6 @@
 """CHIRPS data product."""
 import datetime
+import re
 
 import fsspec
 import pandas as pd
@@ -9,9 +10,39 @@ from dateutil import parser
 from nuthatch import cache
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, regrid
+from sheerwater.utils import dask_remote, finer_grid_cache, regrid, list_directory, run_concurrently, IngestionLedger
 from sheerwater.interfaces import data as sheerwater_data, spatial
 
+CHIRPS_BASE_URL = 'https://data.chc.ucsb.edu/products'
+
+
+def chirps_manifest(directory, prefix, suffix, base_url=CHIRPS_BASE_URL, ttl=3600):
+    """Map dates to the URLs of the CHIRPS files available in a remote directory.
+
+    The directory index is fetched once and cached for ttl seconds, rather than checking
+    for each file individually.
+
+    Args:
+        directory (str): The directory path relative to base_url.
+        prefix (str): The file name prefix before the date, e.g. 'chirp-v3.0.'.
+        suffix (str): The file name suffix after the date, e.g. '.tif'.
+        base_url (str): The root of the CHIRPS products server.
+        ttl (float): Seconds a cached listing stays valid.
+
+    Returns:
+        A dict of pd.Timestamp to URL. Monthly files are keyed by the first of the month.
+    """
+    url = f"{base_url}/{directory.strip('/')}/"
+    pattern = re.escape(prefix) + r'(\d{4})\.(\d{2})(?:\.(\d{2}))?' + re.escape(suffix)
+
+    manifest = {}
+    for name in list_directory(url, ttl=ttl):
+        match = re.fullmatch(pattern, name)
+        if match:
+            year, month, day = match.groups()
+            manifest[pd.Timestamp(int(year), int(month), int(day or 1))] = url + name
+    return dict(sorted(manifest.items()))
+
 
 @dask_remote
 @cache(cache=True,
@@ -22,7 +53,8 @@ from sheerwater.interfaces import data as sheerwater_data, spatial
 def chirps_raw_live_daily(date):  # noqa: ARG001
     """CHIRPS live from this year."""
     dt = pd.to_datetime(date)
-    prelim_url = f'https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/prelim/sat/{dt.year}/chirps-v3.0.prelim.{dt.year}.{dt.month:02}.{dt.day:02}.tif'
+    prelim_url = (f'{CHIRPS_BASE_URL}/CHIRPS/v3.0/daily/prelim/sat/{dt.year}/'
+                  f'chirps-v3.0.prelim.{dt.year}.{dt.month:02}.{dt.day:02}.tif')
     fs = fsspec.filesystem("https", timeout=7200)
     fprelim = fs.open(prelim_url)
     ds = xr.open_dataset(fprelim, chunks={}, engine='rasterio')
@@ -46,14 +78,20 @@ def chirps_raw_live(start_time=None, end_time=None, grid='source', mask=None, re
     """CHIRPS live from this year."""
     days = pd.date_range(start_time, end_time)
 
-    datasets = []
+    # List the available prelim files once per year and only fetch those days
+    manifest = {}
+    for year in range(days[0].year, days[-1].year + 1):
+        manifest.update(chirps_manifest(f'CHIRPS/v3.0/daily/prelim/sat/{year}', 'chirps-v3.0.prelim.', '.tif'))
     for day in days:
-        try:
-            ds = chirps_raw_live_daily(day, filepath_only=True)
-            datasets.append(ds)
-        except FileNotFoundError:
+        if day not in manifest:
             print(f"No data available for {day}.")
+    days = [day for day in days if day in manifest]
+
+    def fetch_day(day):
+        return chirps_raw_live_daily(day, filepath_only=True)
 
+    # Prelim files are replaced upstream, so they're read through their cache rather than the ledger
+    datasets = run_concurrently(fetch_day, days, max_workers=8)
     datasets = [d for d in datasets if d is not None]
 
     ds = xr.open_mfdataset(datasets,
@@ -76,23 +114,13 @@ def chirps_raw(year, grid, stations=True, version=2):  # noqa: ARG001
     """CHIRPS raw by year."""
     # Open the datastore
     if not stations and version == 3:
-        base_url = f'https://data.chc.ucsb.edu/products/CHIRP-v3.0/daily/global/tifs/{year}/chirp-v3.0.'
-        urls = []
         if year < 2000:
             print("Chirp v3 not valid before 2000. Returning none.")
             return None
-        elif year == 2000:
-            for date in pd.date_range(f"{year}-06-01", f"{year}-12-31"):
-                date = date.date()
-                full_url = base_url + f"{year}.{date.month:02}.{date.day:02}.tif"
-                urls.append(full_url)
-        else:
-            fs = fsspec.filesystem("https")
-            for date in pd.date_range(f"{year}-01-01", f"{year}-12-31"):
-                date = date.date()
-                full_url = base_url + f"{year}.{date.month:02}.{date.day:02}.tif"
-                if fs.exists(full_url):
-                    urls.append(full_url)
+
+        # Drive the download from the directory listing rather than checking each day
+        manifest = chirps_manifest(f'CHIRP-v3.0/daily/global/tifs/{year}', 'chirp-v3.0.', '.tif')
+        urls = [url for date, url in manifest.items() if date.year == year]
 
         def preprocess(ds):
             """Preprocess the dataset to add the member dimension."""
@@ -105,7 +133,7 @@ def chirps_raw(year, grid, stations=True, version=2):  # noqa: ARG001
             return ds
 
         ds = xr.open_mfdataset(
-            urls, engine='rasterio', preprocess=preprocess,
+            urls, engine='rasterio', preprocess=preprocess, parallel=True,
             chunks={'y': 1200, 'x': 1200, 'time': 365},
             concat_dim=["time"], compat="override", coords="minimal", combine="nested")
         # remove nodata values and negatives, replacing with nan
@@ -137,28 +165,16 @@ def chirps_raw(year, grid, stations=True, version=2):  # noqa: ARG001
             # Rename to lat/lon
             ds = ds.rename({'latitude': 'lat', 'longitude': 'lon'})
     elif stations and version == 3:
-        base_url = f"https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/final/sat/netcdf/byMonth/chirps-v3.0.{year}"
-        urls = []
         if year < 2000:
             print("Chirps v3 not valid before 2000. Returning none.")
             return None
-        elif year == 2000:
-            for month in range(6, 13):
-                full_url = base_url + f".{month:02}.days_p05.nc"
-                urls.append(full_url)
-        else:
-            for month in range(1, 13):
-                full_url = base_url + f".{month:02}.days_p05.nc"
-                urls.append(full_url)
+
+        manifest = chirps_manifest('CHIRPS/v3.0/daily/final/sat/netcdf/byMonth', 'chirps-v3.0.', '.days_p05.nc')
+        urls = [url for date, url in manifest.items() if date.year == year]
 
         fs = fsspec.filesystem("https", timeout=7200, block_size=10*10*1024*1024)
-        files = []
-        for url in urls:
-            try:
-                f = fs.open(url)
-                files.append(f)
-            except FileNotFoundError:
-                pass
+        # Every month was listed at the source, so a failed open fails the year rather than leaving a gap
+        files = run_concurrently(fs.open, urls, max_workers=12)
 
         ds = xr.open_mfdataset(files, chunks={'lat': 300, 'lon': 300, 'time': 365})
 
@@ -197,13 +213,20 @@ def chirps_raw(year, grid, stations=True, version=2):  # noqa: ARG001
 def chirps_gridded(start_time, end_time, grid, stations=True, version=2,
                    mask=None, region='global'):  # noqa: ARG001
     """CHIRPS regridded by year."""
-    years = range(parser.parse(start_time).year, parser.parse(end_time).year + 1)
+    # Derive coarse grids from a cached finer grid rather than re-reading the source
+    ds = finer_grid_cache(chirps_gridded, grid, start_time, end_time, stations=stations, version=version)
+    if ds is not None:
+        return regrid(ds, grid, base='base180', method='conservative', region=region)
 
-    datasets = []
-    for year in years:
-        ds = chirps_raw(year, 'chirps', stations=stations, version=version, filepath_only=True)
-        if ds is not None:
-            datasets.append(ds)
+    years = [pd.Timestamp(year, 1, 1)
+             for year in range(parser.parse(start_time).year, parser.parse(end_time).year + 1)]
+
+    def fetch_year(year):
+        return chirps_raw(year.year, 'chirps', stations=stations, version=version, filepath_only=True)
+
+    ledger = IngestionLedger(f"{'chirps' if stations else 'chirp'}_v{version}")
+    datasets = ledger.run(years, fetch_year, max_workers=1, functions=['chirps_raw'])
+    datasets = [d for d in datasets if d is not None]
 
     ds = xr.open_mfdataset(datasets,
                            engine='zarr',
@@ -234,7 +257,7 @@ def _chirps_unified(start_time, end_time, variable, grid='global0_25',
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'])
 def chirp_v2(start_time=None, end_time=None, variable='precip', agg_days=1,  # noqa: ARG001
@@ -247,7 +270,7 @@ def chirp_v2(start_time=None, end_time=None, variable='precip', agg_days=1,  # n
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                    'grid', 'mask', 'region'])
@@ -261,7 +284,7 @@ def chirp_v3(start_time=None, end_time=None, variable='precip', agg_days=1,  # n
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'])
 def chirps_v2(start_time=None, end_time=None, variable='precip', agg_days=1,  # noqa: ARG001
@@ -274,7 +297,7 @@ def chirps_v2(start_time=None, end_time=None, variable='precip', agg_days=1,  #
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={
@@ -290,7 +313,7 @@ def chirps_v3(start_time=None, end_time=None, variable='precip', agg_days=1,  #
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -3,16 +3,33 @@ import xarray as xr
 from nuthatch import cache
 
 from sheerwater.utils.secrets import earthaccess_username, earthaccess_password
-from sheerwater.utils import dask_remote
+from sheerwater.utils import dask_remote, run_concurrently, StagedDownloader
 
 import dask
 import os
 import earthaccess
 
 
+def earthaccess_login():
+    """Log in to earthaccess with the credentials from the secret manager."""
+    if 'EARTHDATA_USERNAME' not in os.environ:
+        os.environ["EARTHDATA_USERNAME"] = earthaccess_username()
+    if 'EARTHDATA_PASSWORD' not in os.environ:
+        os.environ["EARTHDATA_PASSWORD"] = earthaccess_password()
+
+    earthaccess.login(strategy="environment", persist=True)
+
+
+def earthaccess_downloader(staging_dir='./eafiles', max_workers=4):
+    """Get a staged downloader sharing a single authenticated earthaccess session."""
+    earthaccess_login()
+    return StagedDownloader(earthaccess.get_requests_https_session(), staging_dir, max_workers=max_workers)
+
+
 @dask_remote
 @cache(cache_args=['filename', 'preprocessor_key'])
-def earthaccess_single_file(filename, earthaccess_result, preprocessor=None, preprocessor_key=None):  # noqa: ARG001
+def earthaccess_single_file(filename, earthaccess_result, preprocessor=None, preprocessor_key=None,  # noqa: ARG001
+                            downloader=None):
     """Download single earthaccess file.
 
        Intended to be used by earthaccess_dataset.
@@ -22,18 +39,18 @@ def earthaccess_single_file(filename, earthaccess_result, preprocessor=None, pre
     preprocessor (callable): A function to preprocess the file before caching
     preprocessor_key (str): A unique key used to cache result. Necessary for accessing the same file
         with different preprocessors. Most basically the preprocessor function name.
+    downloader (StagedDownloader): A downloader to fetch the file with over a shared session. If None,
+        logs in and downloads with earthaccess.
     """
-    if 'EARTHDATA_USERNAME' not in os.environ:
-        os.environ["EARTHDATA_USERNAME"] = earthaccess_username()
-    if 'EARTHDATA_PASSWORD' not in os.environ:
-        os.environ["EARTHDATA_PASSWORD"] = earthaccess_password()
-
-    earthaccess.login(strategy="environment", persist=True)
-
     # Takes a single earthaccess result, fetches the file, opens it in xarray, the returns it to be cached
-    earthaccess.download([earthaccess_result], local_path="./eafiles")
+    if downloader is None:
+        earthaccess_login()
+        earthaccess.download([earthaccess_result], local_path="./eafiles")
+        path = './eafiles/' + filename
+    else:
+        path = downloader.fetch(earthaccess_result.data_links()[0], filename)
 
-    ds = xr.open_datatree('./eafiles/' + filename, engine='h5netcdf', phony_dims='access')
+    ds = xr.open_datatree(path, engine='h5netcdf', phony_dims='access')
 
     if preprocessor:
         ds = preprocessor(ds)
@@ -41,25 +58,25 @@ def earthaccess_single_file(filename, earthaccess_result, preprocessor=None, pre
     if ds:
         ds = ds.compute()
 
-    os.remove('./eafiles/' + filename)
+    os.remove(path)
 
     return ds
 
 
 @dask_remote
 def earthaccess_dataset(start_time, end_time, shortname, preprocessor=None, open_mfdataset_kwargs={},
-                        delayed=False, limit=None):
+                        delayed=False, limit=None, max_workers=1):
     """A generic interface to an earthaccess dataset.
 
     Opens data by shortname, and processes each file with the preprocessor before opening with mfdataset.
     NOT CACHED - make sure you cache the result!
-    """
-    if 'EARTHDATA_USERNAME' not in os.environ:
-        os.environ["EARTHDATA_USERNAME"] = earthaccess_username()
-    if 'EARTHDATA_PASSWORD' not in os.environ:
-        os.environ["EARTHDATA_PASSWORD"] = earthaccess_password()
 
-    earthaccess.login(strategy="environment", persist=True)
+    With max_workers > 1, uncached files are downloaded concurrently over a single authenticated
+    session, and each file is decoded and cached as soon as its download completes while the
+    remaining downloads are still in flight. A failed file fails the call whatever the number of workers,
+    so a partial dataset is never returned.
+    """
+    earthaccess_login()
 
     results = earthaccess.search_data(short_name=shortname, cloud_hosted=True, temporal=(start_time, end_time))
     results = results[:limit]
@@ -72,18 +89,30 @@ def earthaccess_dataset(start_time, end_time, shortname, preprocessor=None, open
     else:
         preprocessor_key = None
 
-    files = []
-    for result in results:
-        fname = result.data_links()[0].split('/')[-1]
+    if max_workers > 1 and not delayed:
+        downloader = earthaccess_downloader(max_workers=max_workers)
+
+        def fetch_file(result):
+            fname = result.data_links()[0].split('/')[-1]
+            return earthaccess_single_file(fname, result, preprocessor=preprocessor,
+                                           preprocessor_key=preprocessor_key, downloader=downloader,
+                                           filepath_only=True)
+
+        files = run_concurrently(fetch_file, results, max_workers=max_workers)
+    else:
+        files = []
+        for result in results:
+            fname = result.data_links()[0].split('/')[-1]
+            if delayed:
+                files.append(dask.delayed(earthaccess_single_file)(fname, result, preprocessor=preprocessor,
+                                                                   preprocessor_key=preprocessor_key,
+                                                                   filepath_only=True))
+            else:
+                files.append(earthaccess_single_file(fname, result, preprocessor=preprocessor,
+                                                     preprocessor_key=preprocessor_key, filepath_only=True))
+
         if delayed:
-            files.append(dask.delayed(earthaccess_single_file)(fname, result, preprocessor=preprocessor,
-                                                               preprocessor_key=preprocessor_key, filepath_only=True))
-        else:
-            files.append(earthaccess_single_file(fname, result, preprocessor=preprocessor,
-                                                 preprocessor_key=preprocessor_key, filepath_only=True))
-
-    if delayed:
-        files = dask.compute(*files)
+            files = dask.compute(*files)
 
     files = [f for f in files if f is not None]
 
@@ -1,15 +1,24 @@
 """Imerg data product."""
+import sys
+
 import gcsfs
+import pandas as pd
 import xarray as xr
 from dateutil import parser
 from nuthatch import cache
+from nuthatch.config import NuthatchConfig
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, regrid
+from sheerwater.utils import dask_remote, finer_grid_cache, regrid, IngestionLedger
+from sheerwater.utils.reference_utils import (build_reference_index, open_reference_index, read_reference_index,
+                                              referenced_urls, write_reference_index)
 from sheerwater.interfaces import data as sheerwater_data, spatial
 
 from .earthaccess_generic import earthaccess_dataset
 
+# Version of the reference indexes, bumped when what they index changes so stale indexes are not reused
+REFERENCE_INDEX_VERSION = 'v2'
+
 
 @dask_remote
 @spatial()
@@ -33,6 +42,49 @@ def imerg_raw_live(start_time, end_time, version='late', delayed=False, grid='so
     return ds
 
 
+def reference_index_root():
+    """The folder and storage options for reference indexes, under the configured root cache.
+
+    Returns:
+        tuple: The folder URL and the fsspec storage options of the root cache filesystem.
+    """
+    root = NuthatchConfig(wrapped_module=sys.modules[__name__])['root']
+    options = dict(root['filesystem_options'].items()) if 'filesystem_options' in root else {}
+    return f"{root['filesystem'].rstrip('/')}/references", options
+
+
+def imerg_reference_index(year, folder, fs):
+    """Get the reference index of a year of IMERG netcdfs in the datalake.
+
+    The index is stored under the root cache, not next to the source files, and rebuilt
+    only when the set of files for the year changes. Every variable of the files is
+    indexed, so imerg_raw exposes the same variables as opening the files directly.
+
+    Args:
+        year (int): The year of files to index.
+        folder (str): The datalake folder containing the IMERG netcdfs.
+        fs (gcsfs.GCSFileSystem): The filesystem of the datalake.
+    """
+    urls = sorted('gs://' + x for x in fs.glob(f'{folder}/{year}*.nc'))
+    if len(urls) == 0:
+        raise RuntimeError(f"No IMERG files found for {year} in {folder}.")
+
+    storage_options = {'project': 'sheerwater', 'token': 'google_default'}
+    index_root, index_options = reference_index_root()
+    index_url = f"{index_root}/{folder.rstrip('/').split('/')[-1]}/{REFERENCE_INDEX_VERSION}/{year}.json"
+    try:
+        index = read_reference_index(index_url, storage_options=index_options)
+        if referenced_urls(index) == set(urls):
+            return index
+    except FileNotFoundError:
+        pass
+
+    print(f"Building IMERG reference index for {year} from {len(urls)} files.")
+    index = build_reference_index(urls, concat_dim='time', storage_options=storage_options)
+    write_reference_index(index, index_url, storage_options=index_options)
+    return index
+
+
 @dask_remote
 @cache(cache_args=['year', 'version'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -49,11 +101,16 @@ def imerg_raw(year, version='final'):
     fs = gcsfs.GCSFileSystem(project='sheerwater', token='google_default')
 
     if version == 'final':
-        gsf = [fs.open(x) for x in fs.glob(f'gs://sheerwater-datalake/imerg/{year}*.nc')]
+        folder = 'gs://sheerwater-datalake/imerg'
     elif version == 'late':
-        gsf = [fs.open(x) for x in fs.glob(f'gs://sheerwater-datalake/imerg_late/{year}*.nc')]
+        folder = 'gs://sheerwater-datalake/imerg_late'
+    else:
+        raise ValueError(f"Invalid version: {version}")
 
-    ds = xr.open_mfdataset(gsf, engine='h5netcdf', parallel=True)
+    # Open the whole year as one virtual zarr store rather than opening every file
+    index = imerg_reference_index(year, folder, fs)
+    ds = open_reference_index(index, remote_protocol='gcs',
+                              remote_options={'project': 'sheerwater', 'token': 'google_default'})
 
     return ds
 
@@ -66,12 +123,19 @@ def imerg_raw(year, version='final'):
 def imerg_gridded(start_time, end_time, grid, version, mask=None,  # noqa: ARG001
                   region='global'):
     """Regridded version of whole imerg dataset."""
-    years = range(parser.parse(start_time).year, parser.parse(end_time).year + 1)
+    # Derive coarse grids from a cached finer grid rather than re-reading the source
+    ds = finer_grid_cache(imerg_gridded, grid, start_time, end_time, version=version)
+    if ds is not None:
+        return regrid(ds, grid, base='base180', method='conservative', region=region)
+
+    years = [pd.Timestamp(year, 1, 1)
+             for year in range(parser.parse(start_time).year, parser.parse(end_time).year + 1)]
+
+    def fetch_year(year):
+        return imerg_raw(year.year, version, filepath_only=True)
 
-    datasets = []
-    for year in years:
-        ds = imerg_raw(year, version, filepath_only=True)
-        datasets.append(ds)
+    datasets = IngestionLedger(f'imerg_{version}').run(years, fetch_year, max_workers=1, functions=['imerg_raw'])
+    datasets = [d for d in datasets if d is not None]
 
     ds = xr.open_mfdataset(datasets,
                            engine='zarr',
@@ -100,7 +164,7 @@ def _imerg_unified(start_time, end_time, variable, grid, version, mask=None, reg
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -113,7 +177,7 @@ def imerg_final(start_time=None, end_time=None, variable='precip', agg_days=1,
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -126,7 +190,7 @@ def imerg_late(start_time=None, end_time=None, variable='precip', agg_days=1,  #
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -9,7 +9,7 @@ from nuthatch import cache
 from nuthatch.processors import timeseries
 
 from sheerwater.interfaces import data as sheerwater_data, spatial
-from sheerwater.utils import dask_remote, regrid, run_in_parallel
+from sheerwater.utils import dask_remote, finer_grid_cache, regrid, run_in_parallel
 
 
 class Plugin(dask.distributed.diagnostics.plugin.WorkerPlugin):
@@ -127,6 +127,11 @@ def oya_raw(start_time, end_time, delayed=False):
 def oya_gridded(start_time, end_time, grid, mask=None,  # noqa: ARG001
                   region='global'):
     """Regridded version of whole oya dataset."""
+    # Derive coarse grids from a cached finer grid rather than re-reading the source
+    ds = finer_grid_cache(oya_gridded, grid, start_time, end_time)
+    if ds is not None:
+        return regrid(ds, grid, base='base180', method='conservative', region=region)
+
     ds = oya_raw(start_time, end_time)
 
     # There are both infs and really large numbers in the dataset
@@ -141,7 +146,7 @@ def oya_gridded(start_time, end_time, grid, mask=None,  # noqa: ARG001
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -3,11 +3,10 @@ import gcsfs
 import xarray as xr
 import pandas as pd
 import numpy as np
-import dask
 from nuthatch import cache
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, regrid, run_in_parallel
+from sheerwater.utils import dask_remote, finer_grid_cache, regrid, IngestionLedger
 
 from sheerwater.interfaces import data as sheerwater_data, spatial
 
@@ -56,20 +55,19 @@ def roa_raw(date):
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
 def roa_gridded(start_time, end_time, grid, mask=None, region='global'):  # noqa: ARG001
     """Regridded version of whole roa dataset."""
+    # Derive coarse grids from a cached finer grid rather than re-reading the source
+    ds = finer_grid_cache(roa_gridded, grid, start_time, end_time)
+    if ds is not None:
+        return regrid(ds, grid, base='base180', method='conservative', region=region)
+
     days = pd.date_range(start_time, end_time)
 
     def run_day(day):
         ds = roa_raw(day, filepath_only=True)
         return ds
 
-    run_in_parallel(run_day, days, 20)
-
-    datasets = []
-    for day in days:
-        ds = dask.delayed(roa_raw)(day, filepath_only=True)
-        datasets.append(ds)
-
-    datasets = dask.compute(*datasets)
+    # Only fetch the days the ledger doesn't already have
+    datasets = IngestionLedger('rain_over_africa').run(days, run_day, max_workers=20, functions=['roa_raw'])
     datasets = [d for d in datasets if d is not None]
 
     ds = xr.open_mfdataset(datasets,
@@ -85,7 +83,7 @@ def roa_gridded(start_time, end_time, grid, mask=None, region='global'):  # noqa
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
@@ -1,12 +1,11 @@
 """Get Tahmo data."""
 import numpy as np
-import dask
 import dask.dataframe as dd
 import xarray as xr
 from nuthatch import cache
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, get_grid, get_grid_ds, snap_point_to_grid, get_dates
+from sheerwater.utils import dask_remote, get_grid, get_grid_ds, snap_point_to_grid, get_dates, run_concurrently
 from sheerwater.interfaces import data as sheerwater_data
 
 
@@ -24,17 +23,20 @@ def tahmo_station_cleaned(station_id):  # noqa: ARG001
 
 @dask_remote
 @cache(cache_args=[])
-def tahmo_raw_daily():
-    """Tahmo data combined and aggregated into days."""
+def tahmo_raw_daily(max_workers=16):
+    """Tahmo data combined and aggregated into days.
+
+    Args:
+        max_workers (int): Number of station caches to look up concurrently.
+    """
     # Get the station list
     stations = tahmo_deployment().compute()
 
-    datasets = []
-    for station in stations.to_dict(orient='records'):
-        ds = dask.delayed(tahmo_station_cleaned)(station['code'], filepath_only=True)
-        datasets.append(ds)
+    def station_path(code):
+        return tahmo_station_cleaned(code, filepath_only=True)
 
-    datasets = dask.compute(*datasets)
+    # A station whose cache can't be read fails the whole call rather than being dropped from the cache
+    datasets = run_concurrently(station_path, stations['code'], max_workers=max_workers)
     datasets = [item for item in datasets if item is not None]
     obs = dd.read_parquet(datasets)
 
@@ -3,7 +3,7 @@ import xarray as xr
 from nuthatch import cache
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, regrid, get_grid
+from sheerwater.utils import dask_remote, finer_grid_cache, regrid, get_grid
 from sheerwater.interfaces import data as sheerwater_data, spatial
 
 
@@ -24,6 +24,11 @@ def tamsat_raw():
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
 def tamsat_gridded(start_time, end_time, grid, mask=None, region='global'):  # noqa: ARG001
     """Regridded version of whole TAMSAT dataset."""
+    # Derive coarse grids from a cached finer grid rather than re-reading the source
+    ds = finer_grid_cache(tamsat_gridded, grid, start_time, end_time)
+    if ds is not None:
+        return regrid(ds, grid, base='base180', method='conservative', region=region)
+
     ds = tamsat_raw()
 
     # Rename variable and select precip
@@ -44,7 +49,7 @@ def tamsat_gridded(start_time, end_time, grid, mask=None, region='global'):  # n
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
        backend_kwargs={'chunking': {'lat': 300, 'lon': 300, 'time': 365}})
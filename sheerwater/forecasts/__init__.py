@@ -1,14 +1,21 @@
 """Forecasting models for the Sheerwater benchmarking project."""
-from .ecmwf_er import ecmwf_ifs_er, ecmwf_ifs_er_debiased
-from .ecmwf_ifs_ens import ecmwf_ifs_ens
-from .ecmwf_hres import ecmwf_hres
-from .ecmwf_aifs import ecmwf_aifs
-from .gfs import gfs
-from .fuxi import fuxi
-from .gencast import gencast
-from .graphcast import graphcast
-from .salient import salient, salient_gem
-from .cumulus_ai import cumulus_ai
+from sheerwater.utils.lazy_utils import lazy_exports
+
+# Forecast modules are imported when one of their functions is first used
+lazy_exports(__name__, {
+    "ecmwf_ifs_er": ".ecmwf_er",
+    "ecmwf_ifs_er_debiased": ".ecmwf_er",
+    "ecmwf_ifs_ens": ".ecmwf_ifs_ens",
+    "ecmwf_hres": ".ecmwf_hres",
+    "ecmwf_aifs": ".ecmwf_aifs",
+    "gfs": ".gfs",
+    "fuxi": ".fuxi",
+    "gencast": ".gencast",
+    "graphcast": ".graphcast",
+    "salient": ".salient",
+    "salient_gem": ".salient",
+    "cumulus_ai": ".cumulus_ai",
+})
 
 __all__ = ["salient", "ecmwf_ifs_er_debiased", "ecmwf_ifs_er", "fuxi", "graphcast", "gencast",
            "ecmwf_ifs_ens", "ecmwf_hres", "ecmwf_aifs", "gfs", "salient_gem", "cumulus_ai"]
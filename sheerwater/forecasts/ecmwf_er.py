@@ -203,56 +203,57 @@ def ifs_extended_range_rechunked(start_time, end_time, variable=None, forecast_t
     return ds
 
 
-@dask_remote
-@timeseries(timeseries='model_issuance_date')
-@spatial()
-@cache(cache_args=['variable', 'lead', 'run_type', 'time_group', 'grid'],
-       backend_kwargs={'chunking': {"lat": 121, "lon": 240, "lead_time": 1, "model_issuance_date": 200, "member": 50}})
-def ifs_er_reforecast_lead_bias(start_time, end_time, variable, lead=0, run_type='average',
-                                time_group='daily', grid="global1_5", mask=None, region='global'):
-    """Computes the bias of ECMWF reforecasts for a specific lead."""
-    # Fetch the reforecast data; get's the past 20 years associated with each start date
-    ds_deb = ifs_extended_range(start_time, end_time, variable, forecast_type="reforecast",
-                                run_type=run_type, time_group=time_group, grid=grid, mask=mask, region=region)
-
-    # Get the appropriate lead
-    n_leads = len(ds_deb.lead_time)
-    if lead >= n_leads:
-        # Lead does not exist
-        return None
-    ds_deb = ds_deb.sel(lead_time=np.timedelta64(lead, 'D'))
+def reforecast_valid_dates(issuance_dates, start_years, leads):
+    """Get the valid date of every reforecast issuance date, hindcast year and lead.
 
-    first_date = ds_deb.model_issuance_date.min().values
-    last_date = ds_deb.model_issuance_date.max().values
-    # We need ERA5 data from the start_time to 20 years before the first date
-    new_start = (pd.Timestamp(first_date) - relativedelta(years=20)).strftime("%Y-%m-%d")
-    # We need ERA5 data from the end time to the end time plus last lead in days
-    new_end = (pd.Timestamp(last_date + ds_deb.lead_time.values) - relativedelta(years=1)).strftime("%Y-%m-%d")
+    Args:
+        issuance_dates (array-like): The model issuance dates.
+        start_years (array-like): The hindcast years, as integer offsets in years from the issuance date.
+        leads (array-like): The lead times, as timedeltas.
 
-    # Get the pre-aggregated ERA5 data
-    agg = {'daily': 1, 'weekly': 7, 'biweekly': 14}[time_group]
-    ds_truth = era5(new_start, new_end, variable, agg_days=agg, grid=grid, mask=mask, region=region)
+    Returns:
+        np.ndarray: The valid dates, with shape (issuance date, hindcast year, lead).
+    """
+    issuance_dates = pd.DatetimeIndex(issuance_dates)
+    # Leap days are moved to February 28th in non-leap hindcast years, as with relativedelta
+    dates = np.stack([(issuance_dates + pd.DateOffset(years=int(x))).values for x in start_years], axis=1)
+    return dates[:, :, None] + np.asarray(leads, dtype='timedelta64[ns]')[None, None, :]
 
-    def get_bias(ds_sub):
-        """Get the 20-year estimated bias of the reforecast data."""
-        # The the corresponding forecast dates for the reforecast data
-        dates = [np.datetime64(pd.Timestamp(ds_sub['model_issuance_date'].values[0] + relativedelta(years=x)))
-                 for x in ds_sub.start_year]
 
-        # Adjust each forecast date by the lead time (0, 1, 2, ... days)
-        lead_td = ds_deb.lead_time.values
-        lead_dates = [x + lead_td for x in dates]
+def reforecast_bias(ds_deb, ds_truth):
+    """Get the 20-year estimated bias of reforecasts for all issuance dates and leads at once.
 
-        # Select the subset of the ground truth matching this lead
-        ds_truth_lead = ds_truth.sel(time=lead_dates)
+    Args:
+        ds_deb (xr.Dataset): Reforecasts with model_issuance_date, start_year and lead_time dimensions.
+        ds_truth (xr.Dataset): Ground truth with a time dimension covering every valid date.
+    """
+    valid = reforecast_valid_dates(ds_deb.model_issuance_date.values, ds_deb.start_year.values,
+                                   ds_deb.lead_time.values)
+    valid = xr.DataArray(valid, dims=['model_issuance_date', 'start_year', 'lead_time'],
+                         coords={'model_issuance_date': ds_deb.model_issuance_date,
+                                 'start_year': ds_deb.start_year, 'lead_time': ds_deb.lead_time})
+
+    # Gather the ground truth at every valid date in a single vectorized selection
+    ds_truth_leads = ds_truth.sel(time=valid).drop_vars('time')
+    bias = (ds_truth_leads - ds_deb).mean(dim='start_year')
+    return bias
 
-        # # Assign the time coordinate to match the forecast dataframe for alignment and subtract
-        ds_truth_lead = ds_truth_lead.assign_coords(time=ds_sub.start_year.values).rename(time='start_year')
-        bias = (ds_truth_lead - ds_sub).mean(dim='start_year')
-        return bias
 
-    bias = ds_deb.groupby('model_issuance_date').map(get_bias)
-    return bias
+@dask_remote
+@timeseries(timeseries='model_issuance_date')
+@spatial()
+@cache(cache=False,
+       cache_args=['variable', 'lead', 'run_type', 'time_group', 'grid'])
+def ifs_er_reforecast_lead_bias(start_time, end_time, variable, lead=0, run_type='average',
+                                time_group='daily', grid="global1_5", mask=None, region='global'):
+    """Computes the bias of ECMWF reforecasts for a specific lead, read from the all-lead bias."""
+    ds = ifs_er_reforecast_bias(start_time, end_time, variable, run_type=run_type,
+                                time_group=time_group, grid=grid, mask=mask, region=region)
+    lead_td = np.timedelta64(lead, 'D')
+    if lead_td not in ds.lead_time.values:
+        # Lead does not exist
+        return None
+    return ds.sel(lead_time=lead_td)
 
 
 @dask_remote
@@ -264,7 +265,6 @@ def ifs_er_reforecast_bias(start_time, end_time, variable, run_type='average',
                            time_group='weekly', grid="global1_5", mask=None,
                            region='global'):
     """Computes the bias of ECMWF reforecasts for all leads."""
-    # Fetch the reforecast data to calculate how many leads we need
     if time_group == 'weekly':
         leads = [0, 7, 14, 21, 28, 35]
     elif time_group == 'biweekly':
@@ -274,15 +274,29 @@ def ifs_er_reforecast_bias(start_time, end_time, variable, run_type='average',
     else:
         raise NotImplementedError(f"Time group {time_group} not implemented for ECMWF reforecasts.")
 
-    # Accumulate all the per lead biases
-    biases = []
-    for i in leads:
-        biases.append(ifs_er_reforecast_lead_bias(
-            start_time, end_time, variable, lead=i,
-            run_type=run_type, time_group=time_group, grid=grid,
-            mask=mask, region=region))
-    # Concatenate leads and unstack
-    ds_biases = xr.concat(biases, dim='lead_time')
+    # Fetch the reforecast data; get's the past 20 years associated with each start date
+    ds_deb = ifs_extended_range(start_time, end_time, variable, forecast_type="reforecast",
+                                run_type=run_type, time_group=time_group, grid=grid, mask=mask, region=region)
+
+    # Get the leads that exist in the reforecast
+    leads = [np.timedelta64(lead, 'D') for lead in leads]
+    leads = [lead for lead in leads if lead in ds_deb.lead_time.values]
+    ds_deb = ds_deb.sel(lead_time=leads)
+
+    first_date = ds_deb.model_issuance_date.min().values
+    last_date = ds_deb.model_issuance_date.max().values
+    # We need ERA5 data from the start_time to 20 years before the first date
+    new_start = (pd.Timestamp(first_date) - relativedelta(years=20)).strftime("%Y-%m-%d")
+    # We need ERA5 data from the end time to the end time plus last lead in days
+    new_end = (pd.Timestamp(last_date + max(leads)) - relativedelta(years=1)).strftime("%Y-%m-%d")
+
+    # Get the pre-aggregated ERA5 data
+    agg = {'daily': 1, 'weekly': 7, 'biweekly': 14}[time_group]
+    ds_truth = era5(new_start, new_end, variable, agg_days=agg, grid=grid, mask=mask, region=region)
+
+    # Compute the bias for all leads in one pass
+    ds_biases = reforecast_bias(ds_deb, ds_truth)
+    ds_biases = ds_biases.transpose('lead_time', ...)
     return ds_biases
 
 
@@ -418,7 +432,7 @@ def _ecmwf_ifs_er_unified(start_time, end_time, variable, prob_type='determinist
 
 
 @dask_remote
-@sheerwater_forecast()
+@sheerwater_forecast(valid_time_store=True)
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                    'lookback_source', 'densify',
@@ -437,7 +451,7 @@ def ecmwf_ifs_er(start_time=None, end_time=None, variable="precip", agg_days=1,
 
 
 @dask_remote
-@sheerwater_forecast()
+@sheerwater_forecast(valid_time_store=True)
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                    'lookback_source', 'densify',
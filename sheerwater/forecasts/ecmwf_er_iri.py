@@ -4,11 +4,8 @@ NOTE: these are legacy functions and no longer actively maintained.
 """
 import os
 import ssl
-import sys
-import time
 from datetime import datetime
 
-import dask
 import dateparser
 import pandas as pd
 import requests
@@ -18,14 +15,17 @@ from nuthatch.processors import timeseries
 from urllib3 import poolmanager
 
 from sheerwater.utils import (
+    StagedDownloader,
     dask_remote,
     ecmwf_secret,
     get_dates,
     get_grid,
+    get_session,
     is_valid_forecast_date,
     lon_base_change,
     regrid,
     roll_and_agg,
+    run_concurrently,
 )
 from sheerwater.interfaces import spatial
 
@@ -48,23 +48,23 @@ class TLSAdapter(requests.adapters.HTTPAdapter):
             ssl_context=ctx)
 
 
-def download_url(url, timeout=600, retry=3, cookies={}):
-    """Download URL, waiting some time between retries."""
-    r = None
-    session = requests.session()
-    session.mount('https://', TLSAdapter())
+def iri_downloader(session=None, staging_dir='./temp', max_workers=8):
+    """Get a downloader for the IRI data library.
 
-    for i in range(retry):
-        try:
-            r = session.get(url, timeout=timeout, cookies=cookies)
-            return r
-        except requests.exceptions.Timeout as e:
-            # Wait until making another request
-            if i == retry - 1:
-                raise e
-            print(f"Request to url {url} has timed out. Trying again...")
-            time.sleep(3)
-    print(f"Failed to retrieve file after {retry} attempts. Stopping...")
+    Downloads go through one pooled TLS session carrying the IRI auth cookie, with range
+    resume of partial files and jittered exponential backoff. Create one per batch of
+    downloads and pass it down, so every download in the batch shares the session.
+
+    Args:
+        session (requests.Session): A session to download with instead of a new IRI session.
+        staging_dir (str): The directory to download into.
+        max_workers (int): The connection pool size.
+    """
+    if session is None:
+        session = get_session(adapter=TLSAdapter(pool_connections=max_workers, pool_maxsize=max_workers))
+        session.cookies.set("__dlauth_id", ecmwf_secret())
+    return StagedDownloader(session, staging_dir, max_workers=max_workers, retry=3,
+                            content_type="application/x-netcdf")
 
 
 ########################################################################
@@ -76,7 +76,7 @@ def download_url(url, timeout=600, retry=3, cookies={}):
                                     'start_date': 969, 'model_issuance_date': 1}})
 def single_iri_ecmwf(time, variable, forecast_type,
                      run_type="average", grid="global1_5",
-                     verbose=True):
+                     verbose=True, downloader=None):
     """Fetches forecast data from the IRI ECMWF dataset.
 
     Args:
@@ -91,6 +91,8 @@ def single_iri_ecmwf(time, variable, forecast_type,
         grid (str): The grid resolution to fetch the data at. One of:
             - global1_5: 1.5 degree global grid
         verbose (bool): Whether to print verbose output.
+        downloader (StagedDownloader): The downloader to fetch with. Defaults to a new IRI downloader.
+            Not part of the cache key.
     """
     if variable == "tmp2m":
         weather_variable_name_on_server = "2m_above_ground/.2t"
@@ -104,7 +106,7 @@ def single_iri_ecmwf(time, variable, forecast_type,
     average_model_runs_url = "[M]average/" if run_type == "average" else ""
     single_model_run_url = f"M/({run_type})VALUES/" if isinstance(run_type, int) else ""
 
-    lons, lats, grid_size = get_grid(grid)
+    lons, lats, grid_size, _ = get_grid(grid)
     restrict_lat_url = f"Y/{lats[0]}/{grid_size}/{lats[-1]}/GRID/"
     restrict_lon_url = f"X/{lons[0]}/{grid_size}/{lons[-1]}/GRID/"
 
@@ -144,22 +146,25 @@ def single_iri_ecmwf(time, variable, forecast_type,
         f"data.nc"
     )
 
-    os.makedirs('./temp', exist_ok=True)
-    file = f"./temp/{variable}-{grid}-{run_type}-{forecast_type}-{time}.nc"
-    r = download_url(URL, cookies={"__dlauth_id": ecmwf_secret()})
-    if r.status_code == 200 and r.headers["Content-Type"] == "application/x-netcdf":
-        if verbose:
-            print(f"Downloading: {day} {month} {year}.")
-        with open(file, "wb") as f:
-            f.write(r.content)
-
-        if verbose:
-            print(f"-done (downloaded {sys.getsizeof(r.content) / 1024:.2f} KB).\n")
-    elif r.status_code == 404:
-        print(f"Data for {day} {month} {year} is not available for model ecmwf.\n")
-        return None
-    else:
-        raise ValueError(f"Failed to download data for {day} {month} {year} for model ecmwf.")
+    if downloader is None:
+        downloader = iri_downloader()
+    filename = f"{variable}-{grid}-{run_type}-{forecast_type}-{time}.nc"
+    if verbose:
+        print(f"Downloading: {day} {month} {year}.")
+    try:
+        file = downloader.fetch(URL, filename)
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            print(f"Data for {day} {month} {year} is not available for model ecmwf.\n")
+            return None
+        raise ValueError(f"Failed to download data for {day} {month} {year} for model ecmwf.") from e
+    except ValueError as e:
+        raise ValueError(f"Failed to download data for {day} {month} {year} for model ecmwf.") from e
+
+    # Files already staged by an earlier run were not downloaded, so have no stats
+    stats = downloader.stats.get(filename)
+    if verbose and stats is not None:
+        print(f"-done (downloaded {stats['bytes'] / 1024:.2f} KB in {stats['seconds']:.1f}s).\n")
 
     rename_dict = {
         "S": "start_date",
@@ -205,21 +210,23 @@ def single_iri_ecmwf(time, variable, forecast_type,
             # Reforecast-specific renaming
             rename_dict["hdate"] = "start_date"
             rename_dict["S"] = "model_issuance_date"
-    except OSError:
-        print(f"Failed to load data for: {day} {month} {year} (a valid {forecast_type} date).")
-        return None
 
-    # Deal with model runs
-    if "M" in ds and ds.sizes["M"] == 1:
-        ds = ds.squeeze("M")
-    elif "M" in ds:
-        rename_dict["M"] = "model_run"
+        # Deal with model runs
+        if "M" in ds and ds.sizes["M"] == 1:
+            ds = ds.squeeze("M")
+        elif "M" in ds:
+            rename_dict["M"] = "model_run"
 
-    # Rename columns to standard names
-    ds = ds.rename(rename_dict)
+        # Rename columns to standard names
+        ds = ds.rename(rename_dict)
 
-    ds = ds.compute()
-    os.remove(file)
+        ds = ds.compute()
+    except OSError:
+        print(f"Failed to load data for: {day} {month} {year} (a valid {forecast_type} date).")
+        return None
+    finally:
+        # Remove the staged file on every path, so a corrupt download is fetched again next time
+        os.remove(file)
     return ds
 
 
@@ -229,7 +236,7 @@ def single_iri_ecmwf(time, variable, forecast_type,
                                     'start_year': 20, 'model_issuance_date': 1}})
 def single_iri_ecmwf_dense(time, variable, forecast_type,
                            run_type="average", grid="global1_5",
-                           verbose=True):
+                           verbose=True, downloader=None):
     """Fetches a single IRI ECMWF forecast and then converts to dense format.
 
     Converts the start_date to start date year. This allows a dense array post merging because
@@ -238,7 +245,7 @@ def single_iri_ecmwf_dense(time, variable, forecast_type,
 
     Interface is the same as single_iri_ecmwf.
     """
-    ds = single_iri_ecmwf(time, variable, forecast_type, run_type, grid, verbose)
+    ds = single_iri_ecmwf(time, variable, forecast_type, run_type, grid, verbose, downloader=downloader)
 
     if ds is None:
         return None
@@ -257,7 +264,7 @@ def single_iri_ecmwf_dense(time, variable, forecast_type,
        backend_kwargs={'chunking': {'lat': 121, 'lon': 240, 'lead_time': 46, 'start_date': 969,
                                     'model_run': 1, 'start_year': 29, 'model_issuance_date': 1}})
 def iri_ecmwf(start_time, end_time, variable, forecast_type,
-              run_type="average", grid="global1_5", verbose=False):
+              run_type="average", grid="global1_5", verbose=False, max_workers=8):
     """Fetches forecast data from the ECMWF IRI dataset.
 
     Args:
@@ -273,6 +280,7 @@ def iri_ecmwf(start_time, end_time, variable, forecast_type,
         grid (str): The grid resolution to fetch the data at. One of:
             - global1_5: 1.5 degree global grid
         verbose (bool): Whether to print verbose output.
+        max_workers (int): Maximum number of issuance dates to download at once.
     """
     # Read and combine all the data into an array
     target_dates = get_dates(start_time, end_time,
@@ -280,12 +288,13 @@ def iri_ecmwf(start_time, end_time, variable, forecast_type,
 
     # Get correct single function
     fn = single_iri_ecmwf if forecast_type == "forecast" else single_iri_ecmwf_dense
-    datasets = []
-    for date in target_dates:
-        ds = dask.delayed(fn)(
-            date, variable, forecast_type, run_type, grid, verbose, filepath_only=True)
-        datasets.append(ds)
-    datasets = dask.compute(*datasets)
+    downloader = iri_downloader(max_workers=max_workers)
+
+    def fetch_date(date):
+        return fn(date, variable, forecast_type, run_type, grid, verbose, downloader=downloader, filepath_only=True)
+
+    # Dates not available at the source are None, and any other failed download fails the call
+    datasets = run_concurrently(fetch_date, target_dates, max_workers=max_workers)
     data = [d for d in datasets if d is not None]
     if len(data) == 0:
         return None
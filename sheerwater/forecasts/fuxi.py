@@ -14,7 +14,7 @@ from huggingface_hub.utils import EntryNotFoundError
 from nuthatch import cache
 from nuthatch.processors import timeseries
 
-from sheerwater.utils import dask_remote, lon_base_change, shift_by_days
+from sheerwater.utils import dask_remote, lon_base_change, shift_by_days, IngestionLedger
 from sheerwater.utils.secrets import huggingface_read_token
 from sheerwater.interfaces import forecast as sheerwater_forecast, spatial
 
@@ -94,17 +94,19 @@ def fuxi_raw(start_time, end_time, grid='global1_5', mask=None, region='global',
     """
     dates = pd.date_range(start_time, end_time)
 
-    datasets = []
-    for date in dates:
-        date = date.date()
-        if delayed:
-            ds = dask.delayed(fuxi_single_forecast)(date, filepath_only=True)
-        else:
-            ds = fuxi_single_forecast(date, filepath_only=True)
-        datasets.append(ds)
-
     if delayed:
+        datasets = []
+        for date in dates:
+            ds = dask.delayed(fuxi_single_forecast)(date.date(), filepath_only=True)
+            datasets.append(ds)
         datasets = dask.compute(*datasets)
+    else:
+        # Only fetch the forecasts the ledger doesn't already have
+        def fetch_date(date):
+            return fuxi_single_forecast(date, filepath_only=True)
+
+        datasets = IngestionLedger('fuxi').run([date.date() for date in dates], fetch_date, max_workers=1,
+                                                       functions=['fuxi_single_forecast'])
 
     data = [d for d in datasets if d is not None]
     if len(data) == 0:
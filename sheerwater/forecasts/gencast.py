@@ -171,7 +171,7 @@ def gencast_processed(start_time, end_time, variable,
 
 
 @dask_remote
-@sheerwater_forecast()
+@sheerwater_forecast(valid_time_store=True)
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'lookback_source', 'densify',
                    'prob_type', 'grid', 'mask', 'region'],
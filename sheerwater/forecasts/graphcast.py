@@ -189,7 +189,7 @@ def graphcast_daily_regrid(start_time, end_time, variable, init_hour=0,
 
 
 @dask_remote
-@sheerwater_forecast()
+@sheerwater_forecast(valid_time_store=True)
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                    'lookback_source', 'densify', 'prob_type', 'grid', 'mask', 'region'],
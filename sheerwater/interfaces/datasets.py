@@ -1,6 +1,12 @@
 """A decorator for identifying data sources."""
 import math
 import copy
+import functools
+import importlib
+import inspect
+import json
+import os
+import numpy as np
 import xarray as xr
 import pandas as pd
 from nuthatch.processor import NuthatchProcessor
@@ -9,8 +15,9 @@ from nuthatch import cache
 import warnings
 from sheerwater.utils import (convert_init_time_to_pred_time, convert_pred_time_to_init_time,
                               add_spatial_attrs, check_spatial_attr, shift_by_days,
-                              densify_fcst, detect_in_time, get_dates, roll_and_agg)
-from sheerwater.spatial_subdivisions import clip_region, apply_mask
+                              densify_fcst, detect_in_time, get_dates, plan_chunks, roll_and_agg, select_pred_time,
+                              span)
+from sheerwater import spatial_subdivisions
 
 from .events import get_event_fn
 from .processors import get_processor_fn
@@ -23,6 +30,15 @@ logger = logging.getLogger(__name__)
 DATA_REGISTRY = {}
 FORECAST_REGISTRY = {}
 
+# Static manifest mapping the name of each forecast and data source of the package to the module:function
+# defining it, so that only the module of a requested source is imported. Regenerate it with
+# write_registry_manifest when sources are added, renamed or moved.
+REGISTRY_MANIFEST_PATH = os.path.join(os.path.dirname(__file__), 'registry_manifest.json')
+
+# Modules whose imports register all of the forecasts and data sources of the package
+SOURCE_PACKAGES = ['sheerwater.forecasts', 'sheerwater.data', 'sheerwater.reanalysis']
+SOURCE_MODULES = ['sheerwater.climatology']
+
 
 class SheerwaterDataset(NuthatchProcessor):
     """Processor for a Sheerwater dataset, either forecast or data of a standard format.
@@ -32,17 +48,33 @@ class SheerwaterDataset(NuthatchProcessor):
     It only supports xarray datasets.
     """
 
-    def __init__(self, region_dim=None, **kwargs):
+    def __init__(self, region_dim=None, sliceable=False, **kwargs):
         """Initialize the spatial processor.
 
         Args:
             region_dim (str): The name of the region dimension. If None, the returned dataset will not be
                 assumed to have a region dimesion and region data will be fetched from the region registry
                 before clipping.
+            sliceable (bool): Whether the values of the dataset at each grid cell and time are independent
+                of the rest of the dataset, so the region and time window can be selected from the lazily
+                read data before any other processing.
             kwargs: Additional keyword arguments to pass to the NuthatchProcessor.
         """
         NuthatchProcessor.__init__(self, **kwargs)
         self.region_dim = region_dim
+        self.sliceable = sliceable
+
+    def __call__(self, func):
+        """Wrap the function, tracing each call as a span when tracing is enabled."""
+        wrapped = NuthatchProcessor.__call__(self, func)
+
+        @functools.wraps(wrapped)
+        def traced_wrapper(*args, **kwargs):
+            with span(func.__name__) as s:
+                ds = wrapped(*args, **kwargs)
+                s.record(ds)
+            return ds
+        return traced_wrapper
 
     def process_arguments(self, sig, *args, **kwargs):
         """Process the arguments for the datasets decorator."""
@@ -58,6 +90,8 @@ class SheerwaterDataset(NuthatchProcessor):
 
         # Set other arguments to reasonable defaults
         self.region = bound_args.arguments.get('region', 'global')
+        self.start_time = None
+        self.end_time = None
         self.mask = bound_args.arguments.get('mask', None)
         self.variable = bound_args.arguments.get('variable', None)
         self.missing_thresh = bound_args.arguments.get('missing_thresh', 1)
@@ -119,12 +153,44 @@ class SheerwaterDataset(NuthatchProcessor):
 
         return args, kwargs
 
+    def pushdown(self, ds):
+        """Select the bounding box of the region and the time window from a sliceable dataset.
+
+        The selection is made on the lazily read dataset, so only the chunks that are needed are read.
+        It is skipped when processors are run, as they may need the whole dataset.
+        """
+        if not self.sliceable or len(self.processors) > 0 or 'post_processed' in ds.attrs:
+            return ds
+        nbytes = ds.nbytes
+
+        if self.start_time is not None and 'time' in ds.dims:
+            ds = ds.sel(time=slice(self.start_time, self.end_time))
+
+        if ('lat' in ds.dims and 'lon' in ds.dims and not check_spatial_attr(ds, region=self.region)
+                and self.grid is not None):
+            bounds = spatial_subdivisions.region_bounds(ds, self.region, self.grid)
+            if bounds is not None:
+                lat_min, lat_max, lon_min, lon_max = bounds
+                lat_idx = np.flatnonzero((ds.lat.values >= lat_min) & (ds.lat.values <= lat_max))
+                lon_idx = np.flatnonzero((ds.lon.values >= lon_min) & (ds.lon.values <= lon_max))
+                ds = ds.isel(lat=slice(lat_idx.min(), lat_idx.max() + 1),
+                             lon=slice(lon_idx.min(), lon_idx.max() + 1))
+
+        logger.info(f"Pushed down region {self.region} and time window into {self.func_name}: "
+                    f"{nbytes} bytes before, {ds.nbytes} bytes after.")
+        return ds
+
     def post_process(self, ds):
         """Clip and mask the dataset."""
         if not isinstance(ds, xr.Dataset):
             raise RuntimeError(
                 f"Sheerwater data and forecast decorators must return xarray datasets. Received {type(ds)}.")
 
+        # Select the region and time window before any computation, if the dataset allows it
+        with span('pushdown') as s:
+            ds = self.pushdown(ds)
+            s.record(ds)
+
         # Run the processors on the dataset
         # We do this before clipping and masking to allow processors
         # to properly change resolution.
@@ -146,7 +212,9 @@ class SheerwaterDataset(NuthatchProcessor):
                     end = ds.init_time.values.max()
                 packed_processor_kwargs['start_time'] = start
                 packed_processor_kwargs['end_time'] = end
-                ds = processor_fn(ds, **packed_processor_kwargs)
+                with span('processor', processor=self.processors[i]) as s:
+                    ds = processor_fn(ds, **packed_processor_kwargs)
+                    s.record(ds)
             ds = ds.assign_attrs({'post_processed': True})
             # If we have a new grid after this make sure we assign it
             # this makes sure the we get the lookback on the correct grid
@@ -156,10 +224,14 @@ class SheerwaterDataset(NuthatchProcessor):
         # Clip to specified region
         if not check_spatial_attr(ds, region=self.region):
             # Only clip region if the dataframe hasn't already been clipped
-            ds = clip_region(ds, grid=self.grid, region=self.region)
+            with span('clip_region', region=self.region) as s:
+                ds = spatial_subdivisions.clip_region(ds, grid=self.grid, region=self.region)
+                s.record(ds)
         if not check_spatial_attr(ds, mask=self.mask):
             # Only apply mask if this dataframe has not already been masked
-            ds = apply_mask(ds, self.mask, grid=self.grid)
+            with span('apply_mask', mask=self.mask) as s:
+                ds = spatial_subdivisions.apply_mask(ds, self.mask, grid=self.grid)
+                s.record(ds)
 
         # Assign attributes, preserving any existing ones (especially 'prob_type')
         ds = ds.assign_attrs({
@@ -194,8 +266,8 @@ class SheerwaterDataset(NuthatchProcessor):
     def validate(self, ds):
         """Validate the cached data to ensure it has data within the region."""
         # Check to see if the dataset extends roughly the full time series set
-        test = clip_region(ds, grid=self.grid, region=self.region)
-        test = apply_mask(test, self.mask, grid=self.grid)
+        test = spatial_subdivisions.clip_region(ds, grid=self.grid, region=self.region)
+        test = spatial_subdivisions.apply_mask(test, self.mask, grid=self.grid)
         if test.notnull().count().compute() == 0:
             logger.warning(f"""The cached array does not have data within
                         the region {self.region}. Triggering recompute.
@@ -233,6 +305,8 @@ class data(SheerwaterDataset):
             end_time = shift_by_days(end_time, duration-1)
         args, kwargs = self.update_args_or_kwargs(
             values={'end_time': end_time}, args=args, kwargs=kwargs, bound_args=bound_args)
+        self.start_time = bound_args.arguments.get('start_time', None)
+        self.end_time = end_time
         return args, kwargs
 
     def post_process(self, ds):
@@ -252,7 +326,9 @@ class data(SheerwaterDataset):
                     f"The following dates are missing: {missing_dates} "
                     "Please reindex your data source in time.")
 
-            ds = self.event_fn(ds, **self.event_kwargs)
+            with span('event', event=self.event) as s:
+                ds = self.event_fn(ds, **self.event_kwargs)
+                s.record(ds)
             # Add an attribute to the dataset to indicate the event name
             ds = ds.assign_attrs({'event': self.event})
         elif self.event is not None and 'event' in ds.attrs and ds.attrs['event'] != self.event:
@@ -261,7 +337,9 @@ class data(SheerwaterDataset):
         elif self.agg_days != 1 and (('agg_days' not in ds.attrs) or
                                      ('agg_days' in ds.attrs and ds.attrs['agg_days'] == 1)):
             agg_thresh = max(math.ceil(self.agg_days*self.missing_thresh), 1)
-            ds = roll_and_agg(ds, agg=self.agg_days, agg_col="time", agg_fn='mean', agg_thresh=agg_thresh)
+            with span('roll_and_agg', agg_days=self.agg_days) as s:
+                ds = roll_and_agg(ds, agg=self.agg_days, agg_col="time", agg_fn='mean', agg_thresh=agg_thresh)
+                s.record(ds)
             ds = ds.assign_attrs({
                 'agg_days': float(self.agg_days),
             })
@@ -295,7 +373,7 @@ def obs_with_lookback(start_time, end_time, lookback_source, variable, grid,  ma
     ds_obs = ds_obs.expand_dims({"prediction_timedelta": lookbacks.values})
     ds_obs = convert_pred_time_to_init_time(ds_obs)
     # Seems to help to enforce chunks if we chunk in the call; otherwise, sometimes the backend seems to ignore?
-    ds_obs = ds_obs.chunk({'lat': 15, 'lon': 15, 'init_time': 3000, 'prediction_timedelta': 50})
+    ds_obs = ds_obs.chunk(plan_chunks(ds_obs, access='timeseries', full_dims=['prediction_timedelta']))
     return ds_obs
 
 
@@ -319,17 +397,65 @@ def dense_fcst(start_time, end_time, fcst, prob_type, variable, grid,  mask='lsm
     ds = densify_fcst(ds)
 
     # Seems to help to enforce chunks if we chunk in the call; otherwise, sometimes the backend seems to ignore?
-    if prob_type == 'probabilistic':
-        chunks = {'lat': 2, 'lon': 2, 'init_time': 3000, 'prediction_timedelta': 50, 'member': 50}
-    else:
-        chunks = {'lat': 15, 'lon': 15, 'init_time': 3000, 'prediction_timedelta': 50}
-    ds = ds.chunk(chunks)
+    ds = ds.chunk(plan_chunks(ds, access='timeseries', full_dims=['prediction_timedelta', 'member']))
+    return ds
+
+
+# Target size of the chunks of forecasts stored in valid time layout
+VALID_TIME_CHUNK_MB = 100
+
+
+def _valid_time_chunks(ds, target_mb=VALID_TIME_CHUNK_MB):
+    """Chunks for a forecast in valid time layout, sized for metric access.
+
+    Each chunk holds all members and as much of the time series as fits in target_mb,
+    over a square spatial tile.
+    """
+    return plan_chunks(ds, target_mb=target_mb, access='timeseries', full_dims=['member'])
+
+
+@spatial()
+@timeseries(timeseries='time')
+@cache(cache=True, cache_args=['fcst', 'prob_type', 'variable', 'agg_days', 'lookback_source', 'missing_thresh',
+                               'grid'],
+       backend_kwargs={'chunking': {}})
+def valid_time_fcst(start_time, end_time, fcst, prob_type, variable, agg_days, grid,  # noqa: ARG001
+                    lookback_source=None, missing_thresh=1, mask='lsm', region='global'):  # noqa: ARG001
+    """A forecast stored in valid time layout, indexed by time and prediction_timedelta.
+
+    This is an optional cache stage. Once it has been written, reads of forecasts that support it
+    and pass valid_time_store=True are served from it instead of converting from init time at query
+    time. Chunks are sized by _valid_time_chunks.
+    """
+    # Only forecasts that take a missing threshold can be read with one; the others aggregate with the default
+    fcst_fn = get_forecast(fcst)
+    thresh_kwargs = {}
+    if 'missing_thresh' in inspect.signature(fcst_fn).parameters:
+        thresh_kwargs['missing_thresh'] = missing_thresh
+
+    # Get the forecast on the global grid and with no mask; spatial decorator will handle the rest
+    ds = fcst_fn(start_time=start_time, end_time=end_time,
+                 prob_type=prob_type, variable=variable, agg_days=agg_days, grid=grid,
+                 lookback_source=lookback_source, mask=None, region='global', **thresh_kwargs)
+    ds = ds.chunk(_valid_time_chunks(ds))
     return ds
 
 
 class forecast(SheerwaterDataset):
     """Processor for a Sheerwater forecast. It supports xarray datasets."""
 
+    def __init__(self, valid_time_store=False, **kwargs):
+        """Initialize the forecast processor.
+
+        Args:
+            valid_time_store (bool): Whether the forecast supports the valid_time_fcst cache stage. Reads are
+                only served from the stage when they also pass valid_time_store=True and it has been written.
+            kwargs: Additional keyword arguments to pass to the SheerwaterDataset.
+        """
+        SheerwaterDataset.__init__(self, **kwargs)
+        self.valid_time_store = valid_time_store
+        self.read_valid_time = False
+
     def __call__(self, func):
         """Call the forecast decorator and register it in the global forecast registry."""
         wrapped = SheerwaterDataset.__call__(self, func)
@@ -339,12 +465,51 @@ class forecast(SheerwaterDataset):
 
     def process_arguments(self, sig, *args, **kwargs):
         """Process the arguments for the data decorator."""
+        # Whether this read requests the valid time store; not an argument of the forecast function
+        self.read_valid_time = kwargs.pop('valid_time_store', False)
         args, kwargs = SheerwaterDataset.process_arguments(self, sig, *args, **kwargs)
         bound_args = self.bind_signature(sig, *args, **kwargs)
         self.lookback_source = bound_args.arguments.get('lookback_source', None)
         self.densify = bound_args.arguments.get('densify', False)
         return args, kwargs
 
+    def read_valid_time_store(self, ds):
+        """Read the forecast from the valid_time_fcst stage, if it was requested, applies and has been written.
+
+        Only plain reads that pass valid_time_store=True, for a forecast that supports the stage, are served
+        from the store: no events, processors or densification.
+
+        Args:
+            ds (xr.Dataset): The forecast returned by the forecast function, indexed by init time.
+
+        Returns:
+            xr.Dataset: The forecast in valid time layout for the init times of ds, or None.
+        """
+        if not (self.valid_time_store and self.read_valid_time):
+            return None
+        if self.event is not None or len(self.processors) > 0 or self.densify:
+            return None
+        if 'init_time' not in ds.dims or 'prediction_timedelta' not in ds.dims:
+            return None
+
+        init_times = ds.init_time.values
+        lead_times = ds.prediction_timedelta.values
+        start_time = pd.Timestamp(init_times.min() + lead_times.min()).strftime('%Y-%m-%d')
+        end_time = pd.Timestamp(init_times.max() + lead_times.max()).strftime('%Y-%m-%d')
+        # Fall back to the init time layout if the store is missing, or lacks the variable, leads or times
+        try:
+            stored = valid_time_fcst(start_time, end_time, fcst=self.func_name, prob_type=self.prob_type,
+                                     variable=self.variable, agg_days=self.agg_days, grid=self.grid,
+                                     lookback_source=self.lookback_source, missing_thresh=self.missing_thresh,
+                                     mask=self.mask, region=self.region, fail_if_no_cache=True)
+            if stored is None or self.variable not in stored:
+                return None
+            if not np.isin(lead_times, stored.prediction_timedelta.values).all():
+                return None
+            return select_pred_time(stored, init_times, lead_times)
+        except (RuntimeError, KeyError, ValueError):
+            return None
+
     def blend_fcst_and_obs(self, fcst, lookback_source, lookback_days=0):
         """Blend the forecast and observations.
 
@@ -386,6 +551,20 @@ class forecast(SheerwaterDataset):
         Enables blending the forecast and observations, event definition, conversion of init time to valid time,
         and general spatial postprocessing, including region clipping and masking.
         """
+        # Serve plain reads from the stored valid time layout if it exists
+        with span('valid_time_store') as s:
+            stored = self.read_valid_time_store(ds)
+            s.record(stored)
+        if stored is not None:
+            ds = SheerwaterDataset.post_process(self, stored)
+            return ds.drop_vars([var for var in ds.coords if
+                                 var not in ['time', 'prediction_timedelta', 'lat', 'lon', 'member', 'group']])
+
+        # Select the region before blending, events and conversion to valid time, if the forecast allows it
+        with span('pushdown') as s:
+            ds = self.pushdown(ds)
+            s.record(ds)
+
         # Run the events on the forecast: requires blending in lookback obs and renaming time labels
         if self.event is not None and 'event' not in ds.attrs and self.densify:
             #################################################################################################
@@ -427,7 +606,9 @@ class forecast(SheerwaterDataset):
             ##################################################################################################
             # For the first event, rename prediction timedelta to time to act along leads
             ds = ds.rename({'prediction_timedelta': 'time'})
-            ds = self.event_fn(ds, **self.event_kwargs)
+            with span('event', event=self.event) as s:
+                ds = self.event_fn(ds, **self.event_kwargs)
+                s.record(ds)
 
             # Add an attribute to the dataset to indicate the event name
             ds = ds.rename({'time': 'prediction_timedelta'})
@@ -439,8 +620,10 @@ class forecast(SheerwaterDataset):
         elif self.agg_days != 1 and (('agg_days' not in ds.attrs) or
                                      ('agg_days' in ds.attrs and ds.attrs['agg_days'] == 1)):
             agg_thresh = max(math.ceil(self.agg_days*self.missing_thresh), 1)
-            ds = roll_and_agg(ds, agg=self.agg_days, agg_col="prediction_timedelta",
-                              agg_fn='mean', agg_thresh=agg_thresh)
+            with span('roll_and_agg', agg_days=self.agg_days) as s:
+                ds = roll_and_agg(ds, agg=self.agg_days, agg_col="prediction_timedelta",
+                                  agg_fn='mean', agg_thresh=agg_thresh)
+                s.record(ds)
             ds = ds.assign_attrs({
                 'agg_days': float(self.agg_days),
             })
@@ -449,7 +632,9 @@ class forecast(SheerwaterDataset):
                              aggregated to {ds.attrs['agg_days']}")
 
         if 'init_time' in ds.coords and 'prediction_timedelta' in ds.coords:
-            ds = convert_init_time_to_pred_time(ds)
+            with span('init_to_valid_time') as s:
+                ds = convert_init_time_to_pred_time(ds)
+                s.record(ds)
 
         if self.detect_in_time is not None and 'detect_in_time' not in ds.attrs:
             ds = detect_in_time(ds, **self.detect_in_time)
@@ -462,28 +647,71 @@ class forecast(SheerwaterDataset):
         return ds
 
 
+@functools.cache
+def registry_manifest():
+    """The static registry manifest, with a 'forecast' and a 'data' mapping of names to module:function."""
+    with open(REGISTRY_MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def import_all_sources():
+    """Import every module defining a forecast or data source, registering all of them."""
+    for package_name in SOURCE_PACKAGES:
+        package = importlib.import_module(package_name)
+        for module_name in sorted(set(package._EXPORTS.values())):
+            importlib.import_module(module_name, package_name)
+    for module_name in SOURCE_MODULES:
+        importlib.import_module(module_name)
+
+
+def write_registry_manifest(path=REGISTRY_MANIFEST_PATH):
+    """Import all of the sources and write the registry manifest.
+
+    Args:
+        path (str): Where to write the manifest. Defaults to the manifest shipped with the package.
+    """
+    import_all_sources()
+    manifest = {
+        'forecast': {name: f"{fn.__module__}:{name}" for name, fn in FORECAST_REGISTRY.items()},
+        'data': {name: f"{fn.__module__}:{name}" for name, fn in DATA_REGISTRY.items()},
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def _load_source(name, registry, kind):
+    """Import the module defining a source of a kind, if it is not registered yet.
+
+    Sources missing from the manifest, e.g. registered outside the package, are looked up by importing
+    all of the sources. Sources of the other kind are not, so looking them up stays cheap.
+    """
+    if name in registry:
+        return
+    manifest = registry_manifest()
+    if name in manifest[kind]:
+        importlib.import_module(manifest[kind][name].split(':')[0])
+    elif not any(name in names for names in manifest.values()):
+        import_all_sources()
+
+
 def get_forecast(forecast_name):
     """Get a forecast from the global forecast registry."""
-    # The imports below ensure that all forecast modules are registered when this is called.
-    import sheerwater.forecasts  # noqa: F401
-    import sheerwater.climatology  # noqa: F401
+    # Only the module defining the forecast is imported, to register it
+    _load_source(forecast_name, FORECAST_REGISTRY, 'forecast')
     return FORECAST_REGISTRY[forecast_name]
 
 
 def list_forecasts():
     """List all forecasts in the global forecast registry."""
-    # The imports below ensure that all forecast modules are registered when this is called.
-    import sheerwater.forecasts  # noqa: F401
-    import sheerwater.climatology  # noqa: F401
-    return list(FORECAST_REGISTRY.keys())
+    names = list(registry_manifest()['forecast'])
+    return names + [name for name in FORECAST_REGISTRY if name not in names]
 
 
 def get_data(data_name):
     """Get a data source from the global data registry."""
-    # The imports below ensure that all forecast modules are registered when this is called.
-    import sheerwater.data  # noqa: F401
-    import sheerwater.climatology  # noqa: F401
-    import sheerwater.reanalysis  # noqa: F401
+    # Only the module defining the data source is imported, to register it
+    _load_source(data_name, DATA_REGISTRY, 'data')
     if data_name not in DATA_REGISTRY:
         raise ValueError(f"Data source {data_name} not found in the global data registry.")
     return DATA_REGISTRY[data_name]
@@ -491,11 +719,8 @@ def get_data(data_name):
 
 def list_data():
     """List all data sources in the global data registry."""
-    # The imports below ensure that all forecast modules are registered when this is called.
-    import sheerwater.data  # noqa: F401
-    import sheerwater.climatology  # noqa: F401
-    import sheerwater.reanalysis  # noqa: F401
-    return list(DATA_REGISTRY.keys())
+    names = list(registry_manifest()['data'])
+    return names + [name for name in DATA_REGISTRY if name not in names]
 
 
 def get_forecast_or_data(forecast_or_data_name):
@@ -3,7 +3,7 @@ import xarray as xr
 
 from nuthatch.processor import NuthatchProcessor
 
-from sheerwater.spatial_subdivisions import clip_region, apply_mask
+from sheerwater import spatial_subdivisions
 from .datasets import add_spatial_attrs, check_spatial_attr
 
 import logging
@@ -54,10 +54,10 @@ class spatial(NuthatchProcessor):
             # Clip to specified region
             if not check_spatial_attr(ds, region=self.region):
                 # Only clip region if the dataframe hasn't already been clipped
-                ds = clip_region(ds, grid=self.grid, region=self.region)
+                ds = spatial_subdivisions.clip_region(ds, grid=self.grid, region=self.region)
             if not check_spatial_attr(ds, mask=self.mask):
                 # Only apply mask if this dataframe has not already been masked
-                ds = apply_mask(ds, self.mask, grid=self.grid)
+                ds = spatial_subdivisions.apply_mask(ds, self.mask, grid=self.grid)
             ds = add_spatial_attrs(ds, grid=self.grid, mask=self.mask, region=self.region)
         else:
             raise RuntimeError(f"Cannot clip by region and mask for data type {type(ds)}")
@@ -68,8 +68,8 @@ class spatial(NuthatchProcessor):
         """Validate the cached data to ensure it has data within the region."""
         if isinstance(ds, xr.Dataset):
             # Check to see if the dataset extends roughly the full time series set
-            test = clip_region(ds, grid=self.grid, region=self.region)
-            test = apply_mask(test, self.mask, grid=self.grid)
+            test = spatial_subdivisions.clip_region(ds, grid=self.grid, region=self.region)
+            test = spatial_subdivisions.apply_mask(test, self.mask, grid=self.grid)
             if test.notnull().count().compute() == 0:
                 print("""WARNING: The cached array does not have data within
                           the region {self.region}. If you want to continue, set `validate_data=False`""")
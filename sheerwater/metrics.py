@@ -7,24 +7,17 @@ from sheerwater.metrics_library import metric_factory
 from sheerwater.interfaces import get_data
 from sheerwater.spatial_subdivisions import space_grouping_labels, clip_region
 from sheerwater.masks import spatial_mask
-from sheerwater.utils import dask_remote, groupby_region, groupby_time
+from sheerwater.utils import check_graph, dask_remote, groupby_region, groupby_time, plan_chunks, traced
 
 
 @dask_remote
+@traced('metric')
 @cache(cache_args=['start_time', 'end_time', 'variable', 'agg_days',
                    'forecast', 'truth',
                    'metric_name', 'metric_kwargs',
                    'event', 'event_kwargs', 'filter_event', 'filter_event_kwargs',
                    'time_grouping', 'space_grouping', 'spatial', 'grid', 'mask', 'region'],
-       backend_kwargs={
-           'chunking': {"lat": 121, "lon": 240, "time": 100, 'region': 300,
-                        'prediction_timedelta': -1, 'member': -1},
-           'chunk_by_arg': {
-               'grid': {
-                   'global0_25': {"lat": 721, "lon": 1440, "time": 30}
-               },
-           }
-})
+       backend_kwargs={'chunking': {}})
 def metric(start_time, end_time, variable, forecast, truth,
            metric_name, metric_kwargs=None,
            event=None, event_kwargs=None, filter_event=None, filter_event_kwargs=None,
@@ -53,7 +46,12 @@ def metric(start_time, end_time, variable, forecast, truth,
                                 time_grouping=time_grouping,
                                 space_grouping=space_grouping, spatial=spatial, grid=grid, mask=mask, region=region,
                                 memoize_forecast=memoize_forecast, memoize_truth=memoize_truth)
-    return metric_obj.compute()
+    ds = metric_obj.compute()
+    # Metrics are read as maps or regional summaries, so keep whole spatial fields in a chunk
+    ds = ds.chunk(plan_chunks(ds, access='spatial', full_dims=['prediction_timedelta', 'member']))
+    # Report graphs too large to schedule before the cache write computes them
+    check_graph(ds, name=f"metric {metric_name} of {forecast} vs {truth}")
+    return ds
 
 
 @dask_remote
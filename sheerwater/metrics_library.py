@@ -10,7 +10,7 @@ from sheerwater.climatology import climatology, seeps_dry_fraction, seeps_wet_th
 from sheerwater.interfaces import get_data, get_forecast, get_event_fn
 from sheerwater.masks import spatial_mask
 from sheerwater.statistics_library import statistic_factory
-from sheerwater.utils import groupby_time, latitude_weights
+from sheerwater.utils import groupby_time, latitude_weights, plan_chunks, span
 from sheerwater.spatial_subdivisions import space_grouping_labels, clip_region
 
 from .advanced_metrics import get_experiment_kwargs
@@ -320,11 +320,7 @@ class Metric(ABC):
             ds = ds.sel(time=valid_times)
             if self.event is not None:
                 """For events, chunk the data to ensure that events calculated over long time period are fast."""
-                if self.prob_type == 'probabilistic':
-                    event_chunks = {'lat': 2, 'lon': 2, 'time': 3000, 'prediction_timedelta': 50, 'member': 50}
-                else:
-                    event_chunks = {'lat': 15, 'lon': 15, 'time': 3000, 'prediction_timedelta': 50}
-                ds = ds.chunk({k: event_chunks[k] for k in ds.dims if k in event_chunks})
+                ds = ds.chunk(plan_chunks(ds, access='timeseries', full_dims=['prediction_timedelta', 'member']))
             else:
                 # Old chunking strategy for non-event metrics
                 # ds = ds.chunk({'time': 3000, 'lat': 100, 'lon': 100})
@@ -570,13 +566,21 @@ class Metric(ABC):
             raise ValueError(f"Variable {self.variable} is not valid for metric {self.name}")
 
         # Prepare the forecasting, observation, and auxiliary data for the metric
-        self.prepare_data()
+        with span('prepare_data') as s:
+            self.prepare_data()
+            s.record(self.metric_data)
         # Gather the statistics
-        self.gather_statistics()
+        with span('gather_statistics') as s:
+            self.gather_statistics()
+            s.record(self.statistic_values)
         # Group and mean the statistics
-        self.group_statistics()
+        with span('group_statistics') as s:
+            self.group_statistics()
+            s.record(self.grouped_statistics)
         # Apply nonlinearly and compute the metric
-        da = self.compute_metric()
+        with span('compute_metric') as s:
+            da = self.compute_metric()
+            s.record(da)
         # Convert from dataarray to dataset and return.
         if not isinstance(da, xr.Dataset):
             ds = da.to_dataset(name=self.name)
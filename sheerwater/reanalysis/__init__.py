@@ -1,6 +1,13 @@
 """Data functions for all parts of the data pipeline."""
-from .cbam import cbam
-from .era5 import era5, era5_daily, era5_land
+from sheerwater.utils.lazy_utils import lazy_exports
+
+# Reanalysis modules are imported when one of their functions is first used
+lazy_exports(__name__, {
+    "cbam": ".cbam",
+    "era5": ".era5",
+    "era5_daily": ".era5",
+    "era5_land": ".era5",
+})
 
 # Use __all__ to define what is part of the public API.
 __all__ = [
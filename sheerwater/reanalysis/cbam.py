@@ -51,7 +51,7 @@ def cbam_gridded(start_time, end_time, variable, grid="global1_5", mask=None, re
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @timeseries()
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
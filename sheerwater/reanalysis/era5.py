@@ -170,7 +170,7 @@ def era5_land_daily_regrid(start_time, end_time, variable, grid="global0_1", mas
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @timeseries()
 @cache(cache=False,
        cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
@@ -334,7 +334,7 @@ def era5_daily_regrid(start_time, end_time, variable, grid="global0_25", mask=No
 
 
 @dask_remote
-@sheerwater_data()
+@sheerwater_data(sliceable=True)
 @timeseries()
 @cache(cache=False, cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors', 'processor_kwargs',
                                 'grid', 'mask', 'region'],
@@ -1,10 +1,24 @@
 """Spatial subdivision modulel."""
+from sheerwater.utils.lazy_utils import lazy_exports
 
-from .utils import (masks_to_polygons, regrid_region_masks, clip_region, clip_by_geometry,
-                    apply_mask, clip_with_mask, clip_station_grid, nonuniform_grid)
-from .spatial_subdivisions import (clean_spatial_subdivision_name, get_spatial_subdivision_level,
-                                   polygon_subdivision_geodataframe, polygon_subdivision_labels,
-                                   space_grouping_labels, reconcile_country_name)
+# The geospatial dependencies are imported when one of these functions is first used
+lazy_exports(__name__, {
+    "masks_to_polygons": ".utils",
+    "regrid_region_masks": ".utils",
+    "clip_region": ".utils",
+    "clip_by_geometry": ".utils",
+    "apply_mask": ".utils",
+    "clip_with_mask": ".utils",
+    "clip_station_grid": ".utils",
+    "nonuniform_grid": ".utils",
+    "region_bounds": ".utils",
+    "clean_spatial_subdivision_name": ".spatial_subdivisions",
+    "get_spatial_subdivision_level": ".spatial_subdivisions",
+    "polygon_subdivision_geodataframe": ".spatial_subdivisions",
+    "polygon_subdivision_labels": ".spatial_subdivisions",
+    "space_grouping_labels": ".spatial_subdivisions",
+    "reconcile_country_name": ".spatial_subdivisions",
+})
 
 __all__ = [
     "masks_to_polygons",
@@ -21,4 +35,5 @@ __all__ = [
     "space_grouping_labels",
     "reconcile_country_name",
     "nonuniform_grid",
+    "region_bounds",
 ]
@@ -115,6 +115,43 @@ def clip_region(ds, region, grid, coords_to_clip=None, drop=True):
     return ds
 
 
+# Region bounds already found, by region and grid coordinates
+_REGION_BOUNDS = {}
+
+
+def region_bounds(ds, region, grid):
+    """Get the bounding box of a region on the lat/lon grid of a dataset.
+
+    Only the grid coordinates of the dataset are used, so this is cheap to call on lazily opened data.
+
+    Args:
+        ds (xr.Dataset): The dataset whose grid to find the region on.
+        region (str, list): The region. A str or list of strs.
+        grid (str): The grid of the dataset.
+
+    Returns:
+        tuple: The (lat_min, lat_max, lon_min, lon_max) of the grid cells in the region, or None
+            for the global region or if the region has no cells on the grid.
+    """
+    if region == 'global' or region is None or 'global' in region:
+        return None
+    lat = ds.lat.values
+    lon = ds.lon.values
+    key = (str(region), grid, len(lat), len(lon), lat[0], lat[-1], lon[0], lon[-1])
+    if key not in _REGION_BOUNDS:
+        template = xr.Dataset({'_bounds': (['lat', 'lon'], np.ones((len(lat), len(lon)), dtype=np.float32))},
+                              coords={'lat': lat, 'lon': lon})
+        clipped = clip_region(template, region=region, grid=grid)
+        valid = clipped['_bounds'].notnull()
+        lats = clipped.lat.values[valid.any('lon').values]
+        lons = clipped.lon.values[valid.any('lat').values]
+        if len(lats) == 0 or len(lons) == 0:
+            _REGION_BOUNDS[key] = None
+        else:
+            _REGION_BOUNDS[key] = (lats.min(), lats.max(), lons.min(), lons.max())
+    return _REGION_BOUNDS[key]
+
+
 def clip_by_geometry(ds, geometry=None, lon_dim='lon', lat_dim='lat', drop=True):
     """Clip a dataset to a passed geometry.
 
@@ -49,6 +49,13 @@ def pytest_addoption(parser):
         default="sheerwater_testing",
         help="Coiled cluster name (remote_name). Always uses xlarge_cluster/xlarge_node presets.",
     )
+    parser.addoption(
+        "--benchmark-size",
+        action="store",
+        default="small",
+        choices=["small", "medium", "large"],
+        help="Size preset of the synthetic datasets used by the offline benchmarks.",
+    )
 
 
 @pytest.hookimpl(trylast=True)
@@ -108,6 +115,22 @@ def remote_dask_cluster(request):
     client.close()
 
 
+# Scope to module so the same local scheduler is used throughout the benchmarks
+@pytest.fixture(scope='module')
+def local_dask_cluster():
+    """Start a local Dask cluster for the offline benchmarks, so no Coiled cluster is needed."""
+    from dask.distributed import Client, LocalCluster
+
+    cluster = LocalCluster(n_workers=2, threads_per_worker=2)
+    client = Client(cluster)
+
+    yield client
+
+    clear_memoizer()
+    client.close()
+    cluster.close()
+
+
 @pytest.fixture
 def start_iri_ecmwf():
     """The start date for the IRI ECMWF data."""
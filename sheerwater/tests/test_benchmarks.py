@@ -0,0 +1,353 @@
+"""Offline benchmarks for the metrics stack on synthetic data.
+
+Unlike test_metrics_performance.py, these need no Coiled cluster and no remote caches: the forecast and
+truth are synthesized lazily, registered as temporary forecast and data sources, and computed on a local
+Dask scheduler. The cached masks, space groupings and regions the pipeline reads are replaced by synthetic
+ones, and name lookups and connections for anything but the local machine are refused, so an unpatched
+remote read fails fast rather than reaching, or retrying against, the network.
+
+Run only the benchmarks: pytest -m benchmark -v -s
+Exclude from default runs: pytest -m "not benchmark"
+Choose the dataset size: pytest -m benchmark -v -s --benchmark-size medium
+
+Each benchmark runs once to warm up and then ROUNDS times. The best and median timings are printed, compared
+against the last run recorded in the baseline file, and the file is updated with the latest run. The baseline
+is kept out of the tree, in .benchmarks/baseline.json at the repository root, or at the path given by the
+SHEERWATER_BENCHMARK_BASELINE environment variable.
+"""
+import ipaddress
+import json
+import os
+import socket
+import statistics
+import time
+from pathlib import Path
+
+import dask.array as da
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+import xarray as xr
+from nuthatch import cache
+
+import sheerwater.metrics_library as metrics_library
+import sheerwater.spatial_subdivisions.utils as subdivision_utils
+from sheerwater.interfaces import DATA_REGISTRY, FORECAST_REGISTRY, data, forecast
+from sheerwater.metrics import metric
+from sheerwater.metrics_library import metric_factory
+from sheerwater.spatial_subdivisions import clip_region
+from sheerwater.utils import convert_init_time_to_pred_time, get_grid, get_grid_ds, roll_and_agg, shift_by_days
+
+pytestmark = pytest.mark.benchmark
+
+
+# Baseline file: stores last run timings; new runs compare against it then overwrite. Gitignored.
+BASELINE_PATH = Path(os.environ.get("SHEERWATER_BENCHMARK_BASELINE",
+                                    Path(__file__).resolve().parents[2] / ".benchmarks" / "baseline.json"))
+
+# Number of timed rounds per benchmark, after one warm up round.
+ROUNDS = 3
+# Fail if the best time of the current run is more than this many times slower than baseline.
+SLOWDOWN_THRESHOLD = 10.0
+
+# Sizes of the synthetic datasets, selected with --benchmark-size.
+BENCHMARK_SIZES = {
+    'small': {'grid': 'global1_5', 'start_time': '2020-01-01', 'end_time': '2020-01-31',
+              'n_leads': 8, 'n_members': 2},
+    'medium': {'grid': 'global1_5', 'start_time': '2020-01-01', 'end_time': '2020-12-31',
+               'n_leads': 32, 'n_members': 11},
+    'large': {'grid': 'global1_0', 'start_time': '2018-01-01', 'end_time': '2020-12-31',
+              'n_leads': 46, 'n_members': 51},
+}
+
+
+def synthetic_obs(start_time, end_time, grid, variable='precip', seed=0):
+    """A lazily generated daily observation dataset covering the grid.
+
+    Args:
+        start_time (str): The first day of the dataset.
+        end_time (str): The last day of the dataset.
+        grid (str): The grid to generate the dataset on.
+        variable (str): The name of the data variable.
+        seed (int): The random seed.
+    """
+    lons, lats, _, _ = get_grid(grid)
+    times = pd.date_range(start_time, end_time, freq='D')
+    shape = (len(times), len(lats), len(lons))
+    values = da.random.RandomState(seed).gamma(0.5, 4.0, size=shape, chunks='auto').astype(np.float32)
+    return xr.Dataset({variable: (['time', 'lat', 'lon'], values)},
+                      coords={'time': times, 'lat': lats, 'lon': lons})
+
+
+def synthetic_forecast(start_time, end_time, grid, n_leads, n_members, prob_type='deterministic',
+                       variable='precip', seed=1):
+    """A lazily generated weekly initialized forecast dataset covering the grid.
+
+    Init times start n_leads days before start_time, so every day between start_time and end_time is
+    covered by all leads.
+
+    Args:
+        start_time (str): The first valid day of the dataset.
+        end_time (str): The last init day of the dataset.
+        grid (str): The grid to generate the dataset on.
+        n_leads (int): The number of daily leads.
+        n_members (int): The number of ensemble members.
+        prob_type (str): 'deterministic' for the ensemble mean, otherwise the ensemble.
+        variable (str): The name of the data variable.
+        seed (int): The random seed.
+    """
+    lons, lats, _, _ = get_grid(grid)
+    init_times = pd.date_range(shift_by_days(start_time, -n_leads), end_time, freq='7D')
+    leads = pd.timedelta_range('0D', periods=n_leads, freq='D')
+    shape = (len(init_times), len(leads), n_members, len(lats), len(lons))
+    values = da.random.RandomState(seed).gamma(0.5, 4.0, size=shape, chunks='auto').astype(np.float32)
+    ds = xr.Dataset({variable: (['init_time', 'prediction_timedelta', 'member', 'lat', 'lon'], values)},
+                    coords={'init_time': init_times, 'prediction_timedelta': leads,
+                            'member': np.arange(n_members), 'lat': lats, 'lon': lons})
+    if prob_type == 'deterministic':
+        ds = ds.mean('member')
+        return ds.assign_attrs(prob_type='deterministic')
+    return ds.assign_attrs(prob_type='ensemble')
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    """Refuse name lookups and connections for anything but the local machine, which the local Dask cluster uses.
+
+    Failing the lookup as well as the connection keeps remote clients from waiting on DNS or retrying with backoff.
+    """
+    connect = socket.socket.connect
+    getaddrinfo = socket.getaddrinfo
+
+    def _is_local(host):
+        if host in (None, '', 'localhost') or host == socket.gethostname():
+            return True
+        try:
+            address = ipaddress.ip_address(host)
+            return address.is_loopback or address.is_unspecified
+        except ValueError:
+            return False
+
+    def local_getaddrinfo(host, *args, **kwargs):
+        if not _is_local(host):
+            raise socket.gaierror(socket.EAI_NONAME, f"Benchmarks must run offline, refusing to resolve {host}.")
+        return getaddrinfo(host, *args, **kwargs)
+
+    def local_connect(sock, address):
+        if sock.family in (socket.AF_INET, socket.AF_INET6):
+            host = address[0]
+            if not _is_local(host):
+                raise ConnectionRefusedError(f"Benchmarks must run offline, refusing connection to {host}.")
+        return connect(sock, address)
+    monkeypatch.setattr(socket.socket, "connect", local_connect)
+    monkeypatch.setattr(socket, "getaddrinfo", local_getaddrinfo)
+
+
+@pytest.fixture(scope='module')
+def benchmark_size(request):
+    """The size preset of the synthetic datasets."""
+    return request.config.getoption("--benchmark-size")
+
+
+@pytest.fixture
+def synthetic_sources():
+    """Register synthetic forecast and truth sources, removing them from the registries afterwards.
+
+    Yields a function register(name, n_leads, n_members) that returns the registered forecast and
+    truth names, which can be passed to metric() like any other forecast and data source.
+    """
+    registered = []
+
+    def register(name, n_leads, n_members):
+        def fcst_fn(start_time=None, end_time=None, variable='precip', agg_days=1,  # noqa: ARG001
+                    prob_type='deterministic', event=None, event_kwargs=None,  # noqa: ARG001
+                    processors=None, processor_kwargs=None,  # noqa: ARG001
+                    lookback_source=None, densify=False,  # noqa: ARG001
+                    grid='global1_5', mask=None, region='global'):  # noqa: ARG001
+            return synthetic_forecast(start_time, end_time, grid, n_leads, n_members,
+                                      prob_type=prob_type, variable=variable)
+
+        def obs_fn(start_time=None, end_time=None, variable='precip', agg_days=1,  # noqa: ARG001
+                   event=None, event_kwargs=None,  # noqa: ARG001
+                   processors=None, processor_kwargs=None,  # noqa: ARG001
+                   grid='global1_5', mask=None, region='global'):  # noqa: ARG001
+            return synthetic_obs(start_time, end_time, grid, variable=variable)
+
+        fcst_fn.__name__ = fcst_fn.__qualname__ = f"{name}_fcst"
+        obs_fn.__name__ = obs_fn.__qualname__ = f"{name}_obs"
+        forecast()(cache(cache=False,
+                         cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors',
+                                     'processor_kwargs', 'lookback_source', 'densify',
+                                     'prob_type', 'grid', 'mask', 'region'])(fcst_fn))
+        data()(cache(cache=False,
+                     cache_args=['variable', 'agg_days', 'event', 'event_kwargs', 'processors',
+                                 'processor_kwargs', 'grid', 'mask', 'region'])(obs_fn))
+        registered.append((fcst_fn.__name__, obs_fn.__name__))
+        return fcst_fn.__name__, obs_fn.__name__
+
+    yield register
+
+    for fcst_name, obs_name in registered:
+        FORECAST_REGISTRY.pop(fcst_name, None)
+        DATA_REGISTRY.pop(obs_name, None)
+
+
+@pytest.fixture
+def synthetic_space_grouping(monkeypatch):
+    """Serve a single global space grouping label, instead of reading the region labels from the cache."""
+    def _space_grouping_labels(grid='global1_5', space_grouping=None):  # noqa: ARG001
+        ds = get_grid_ds(grid)
+        labels = np.full((ds.lat.size, ds.lon.size), 'global', dtype='U100')
+        return ds.assign_coords(region=(('lat', 'lon'), labels))
+    monkeypatch.setattr(metrics_library, "space_grouping_labels", _space_grouping_labels)
+
+
+@pytest.fixture
+def synthetic_mask(monkeypatch):
+    """Serve a mask that keeps every grid cell, instead of reading the land-sea mask from the cache."""
+    def _spatial_mask(mask, grid='global1_5', region='global', **kwargs):  # noqa: ARG001
+        ds = get_grid_ds(grid)
+        ds['mask'] = ds['mask'] > 0
+        return ds
+    monkeypatch.setattr(metrics_library, "spatial_mask", _spatial_mask)
+
+
+@pytest.fixture
+def synthetic_region(monkeypatch):
+    """Register a synthetic geometry region, 'benchmark_box', covering Kenya.
+
+    Returns:
+        str: The name of the region.
+    """
+    gdf = gpd.GeoDataFrame({'region_name': ['benchmark_box']},
+                           geometry=[shapely.geometry.box(33.0, -5.0, 42.0, 5.0)], crs="EPSG:4326")
+    monkeypatch.setitem(subdivision_utils.spatial_subdivisions, 'benchmark_zone',
+                        [lambda grid: None, lambda: gdf])  # noqa: ARG005
+    monkeypatch.setattr(subdivision_utils, "get_spatial_subdivision_level",
+                        lambda name, grid: ('benchmark_zone', 1))  # noqa: ARG005
+    return 'benchmark_box'
+
+
+def _load_baseline():
+    """Load baseline timings from file, or return empty dict."""
+    if not BASELINE_PATH.exists():
+        return {}
+    try:
+        return json.loads(BASELINE_PATH.read_text())
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
+def _save_baseline(baseline):
+    """Write baseline timings to file."""
+    BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BASELINE_PATH.write_text(json.dumps(baseline, indent=2))
+
+
+def _run_benchmark(test_key, fn, rounds=ROUNDS):
+    """Time fn, print and record the best and median times, and fail on a large slowdown against baseline."""
+    fn()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    best_sec, median_sec = min(times), statistics.median(times)
+
+    print(f"\n--- {test_key} ---")
+    print(f"  best of {rounds}: {best_sec:.3f}s, median: {median_sec:.3f}s")
+
+    baseline = _load_baseline()
+    prev = baseline.get(test_key)
+    if prev and prev.get("best_sec"):
+        delta = (best_sec - prev["best_sec"]) / prev["best_sec"]
+        print(f"  vs baseline: {best_sec:.3f}s (was {prev['best_sec']:.3f}s, {delta:+.1%})")
+        if best_sec > SLOWDOWN_THRESHOLD * prev["best_sec"]:
+            raise AssertionError(f"Performance regression: {best_sec:.3f}s is more than "
+                                 f"{SLOWDOWN_THRESHOLD}x baseline {prev['best_sec']:.3f}s (test_key={test_key})")
+    else:
+        print("  (no baseline yet for this test)")
+
+    baseline[test_key] = {"best_sec": round(best_sec, 6), "median_sec": round(median_sec, 6)}
+    _save_baseline(baseline)
+
+
+@pytest.mark.parametrize("metric_name", ["mae", "rmse", "crps"])
+def test_benchmark_metric(metric_name, benchmark_size, synthetic_sources, synthetic_space_grouping,  # noqa: ARG001
+                          synthetic_mask, local_dask_cluster):  # noqa: ARG001
+    """Benchmark the full metric pipeline, from the forecast and truth reads to the grouped metric."""
+    size = BENCHMARK_SIZES[benchmark_size]
+    fcst, obs = synthetic_sources(f"benchmark_{metric_name}", size['n_leads'], size['n_members'])
+
+    def run():
+        ds = metric(size['start_time'], size['end_time'], 'precip', fcst, obs, metric_name,
+                    agg_days=7, grid=size['grid'], mask=None, region='global',
+                    time_grouping=None, space_grouping=None,
+                    memoize_forecast=False, memoize_truth=False, cache=False)
+        ds = ds.compute()
+        assert metric_name in ds
+    _run_benchmark(f"metric-{metric_name}-{benchmark_size}", run)
+
+
+@pytest.mark.parametrize("time_grouping", [None, "month"])
+def test_benchmark_group_statistics(time_grouping, benchmark_size, synthetic_sources,
+                                    synthetic_space_grouping, synthetic_mask, local_dask_cluster):  # noqa: ARG001
+    """Benchmark grouping the statistics in time and space, from persisted statistics."""
+    size = BENCHMARK_SIZES[benchmark_size]
+    fcst, obs = synthetic_sources("benchmark_group", size['n_leads'], size['n_members'])
+    metric_obj = metric_factory('mae', start_time=size['start_time'], end_time=size['end_time'],
+                                variable='precip', agg_days=7, forecast=fcst, truth=obs,
+                                time_grouping=time_grouping, space_grouping=None, spatial=False,
+                                grid=size['grid'], mask=None, region='global',
+                                memoize_forecast=False, memoize_truth=False)
+    metric_obj.prepare_data()
+    metric_obj.gather_statistics()
+    metric_obj.statistic_values = metric_obj.statistic_values.persist()
+    metric_obj.filter = metric_obj.filter.persist()
+
+    def run():
+        metric_obj.group_statistics()
+        metric_obj.grouped_statistics.compute()
+    _run_benchmark(f"group_statistics-{time_grouping}-{benchmark_size}", run)
+
+
+@pytest.mark.parametrize("source", ["obs", "forecast"])
+def test_benchmark_roll_and_agg(source, benchmark_size, local_dask_cluster):  # noqa: ARG001
+    """Benchmark a 7 day rolling mean, over time for observations and over leads for forecasts."""
+    size = BENCHMARK_SIZES[benchmark_size]
+    if source == "obs":
+        ds = synthetic_obs(size['start_time'], size['end_time'], size['grid'])
+        agg_col = 'time'
+    else:
+        ds = synthetic_forecast(size['start_time'], size['end_time'], size['grid'],
+                                size['n_leads'], size['n_members'], prob_type='probabilistic')
+        agg_col = 'prediction_timedelta'
+
+    def run():
+        roll_and_agg(ds, agg=7, agg_col=agg_col, agg_fn='mean').compute()
+    _run_benchmark(f"roll_and_agg-{source}-{benchmark_size}", run)
+
+
+def test_benchmark_convert_init_time_to_pred_time(benchmark_size, local_dask_cluster):  # noqa: ARG001
+    """Benchmark the conversion of an ensemble forecast from init time to valid time."""
+    size = BENCHMARK_SIZES[benchmark_size]
+    ds = synthetic_forecast(size['start_time'], size['end_time'], size['grid'],
+                            size['n_leads'], size['n_members'], prob_type='probabilistic')
+
+    def run():
+        out = convert_init_time_to_pred_time(ds).compute()
+        assert 'time' in out.dims
+    _run_benchmark(f"convert_init_time_to_pred_time-{benchmark_size}", run)
+
+
+def test_benchmark_clip_region(benchmark_size, synthetic_region, local_dask_cluster):  # noqa: ARG001
+    """Benchmark clipping observations to a geometry region."""
+    size = BENCHMARK_SIZES[benchmark_size]
+    ds = synthetic_obs(size['start_time'], size['end_time'], size['grid'])
+
+    def run():
+        out = clip_region(ds, synthetic_region, grid=size['grid']).compute()
+        assert out.lat.size < ds.lat.size
+    _run_benchmark(f"clip_region-{benchmark_size}", run)
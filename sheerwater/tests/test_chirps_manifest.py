@@ -0,0 +1,74 @@
+"""Test the CHIRPS directory listing manifest against a local HTTP server."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from sheerwater.data.chirps import chirps_manifest
+
+pytestmark = pytest.mark.default
+
+INDEX_PAGE = """<html><body><h1>Index of /CHIRP-v3.0/daily/global/tifs/2001</h1>
+<a href="?C=N;O=D">Name</a>
+<a href="/CHIRP-v3.0/daily/global/tifs/">Parent Directory</a>
+<a href="chirp-v3.0.2001.01.01.tif">chirp-v3.0.2001.01.01.tif</a>
+<a href="chirp-v3.0.2001.01.02.tif">chirp-v3.0.2001.01.02.tif</a>
+<a href="chirp-v3.0.2001.01.04.tif">chirp-v3.0.2001.01.04.tif</a>
+<a href="chirp-v3.0.2001.01.04.tif.md5">chirp-v3.0.2001.01.04.tif.md5</a>
+<a href="old/">old/</a>
+</body></html>"""
+
+
+class _IndexHandler(BaseHTTPRequestHandler):
+    """Serve a fake CHIRPS directory index and count the requests made."""
+
+    requests = []
+
+    def do_GET(self):
+        """Respond with the index page for the one known directory."""
+        self.requests.append(self.path)
+        if self.path != "/CHIRP-v3.0/daily/global/tifs/2001/":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = INDEX_PAGE.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: ARG002
+        """Silence request logging."""
+        pass
+
+
+@pytest.fixture
+def index_server():
+    """Run a local HTTP server serving a fake CHIRPS index."""
+    _IndexHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _IndexHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_chirps_manifest(index_server):
+    """Test that the manifest lists available days from one cached index request."""
+    manifest = chirps_manifest("CHIRP-v3.0/daily/global/tifs/2001", "chirp-v3.0.", ".tif", base_url=index_server)
+    assert list(manifest.keys()) == [pd.Timestamp("2001-01-01"), pd.Timestamp("2001-01-02"),
+                                     pd.Timestamp("2001-01-04")]
+    assert manifest[pd.Timestamp("2001-01-04")] == \
+        f"{index_server}/CHIRP-v3.0/daily/global/tifs/2001/chirp-v3.0.2001.01.04.tif"
+
+    # A second lookup within the ttl is served from the cache
+    chirps_manifest("CHIRP-v3.0/daily/global/tifs/2001", "chirp-v3.0.", ".tif", base_url=index_server)
+    assert len(_IndexHandler.requests) == 1
+
+    # Expired listings are refetched, and missing directories are empty
+    chirps_manifest("CHIRP-v3.0/daily/global/tifs/2001", "chirp-v3.0.", ".tif", base_url=index_server, ttl=0)
+    assert len(_IndexHandler.requests) == 2
+    assert chirps_manifest("CHIRP-v3.0/daily/global/tifs/2002", "chirp-v3.0.", ".tif", base_url=index_server) == {}
@@ -0,0 +1,150 @@
+"""Test the streaming day of year climatology building blocks on synthetic data."""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from sheerwater.utils import add_dayofyear, get_anomalies, pad_with_leapdays
+from sheerwater.utils.climatology_utils import (doy_accumulate, doy_accumulator_mean, doy_blocks_by_year, doy_codes,
+                                                doy_linear_trend, doy_lookup, doy_rolling_mean, geometric_edges,
+                                                histogram_quantile, histogram_sketch, merge_doy_accumulators,
+                                                merge_sketches, sketch_edges, sketch_quantile)
+
+pytestmark = pytest.mark.default
+
+
+def _synthetic_record(first_year=2000, last_year=2004):
+    """A daily, chunked, gappy record on a small grid with a dayofyear coordinate."""
+    times = pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq="D")
+    rng = np.random.default_rng(0)
+    precip = rng.gamma(0.7, 3.0, size=(len(times), 3, 4)).astype(np.float32)
+    precip[rng.random(precip.shape) < 0.05] = np.nan
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)},
+                    coords={"time": times, "lat": np.arange(3.0), "lon": np.arange(4.0)})
+    ds = ds.chunk({"time": 365})
+    ds = add_dayofyear(ds)
+    return pad_with_leapdays(ds)
+
+
+def test_streaming_doy_mean_matches_groupby():
+    """Test that the streamed and incrementally extended climatologies match a groupby mean."""
+    ds = _synthetic_record()
+    expected = ds.groupby("dayofyear").mean(dim="time", skipna=True)
+
+    years, blocks = doy_blocks_by_year(ds)
+    assert list(years) == [2000, 2001, 2002, 2003, 2004]
+    assert all(block.sizes["dayofyear"] == 366 for block in blocks)
+
+    result = doy_accumulator_mean(doy_accumulate(blocks))
+    assert result.precip.dtype == np.float32
+    xr.testing.assert_allclose(result.precip.transpose(*expected.precip.dims).compute(), expected.precip.compute())
+
+    # Extending the first four years with the fifth gives the same climatology
+    extended = merge_doy_accumulators([doy_accumulate(blocks[:4]), doy_accumulate(blocks[4:])])
+    xr.testing.assert_allclose(doy_accumulator_mean(extended).compute(), result.compute())
+
+
+def test_doy_blocks_as_members():
+    """Test that stacking the year blocks gives each year's trajectory as a member."""
+    ds = _synthetic_record()
+    _, blocks = doy_blocks_by_year(ds)
+    members = xr.concat(blocks, dim="member")
+
+    np.testing.assert_array_equal(members.precip.isel(member=1).sel(dayofyear="1904-03-01").values,
+                                  ds.precip.sel(time="2001-03-01").values)
+    # Non-leap years carry the padded leap day
+    np.testing.assert_array_equal(members.precip.isel(member=1).sel(dayofyear="1904-02-29").values,
+                                  ds.precip.sel(time="2001-02-28").isel(time=0).values)
+
+
+def test_doy_rolling_mean_matches_groupby_rolling():
+    """Test that the prefix sum rolling climatology matches the groupby rolling it replaces."""
+    ds = _synthetic_record()
+    ds = ds.isel(time=slice(40, -20))  # partial first and last years
+
+    def doy_rolling(sub_ds, years):
+        return sub_ds.rolling(time=years, min_periods=years, center=False).mean()
+
+    expected = ds.compute().groupby("dayofyear").map(doy_rolling, years=3)
+    expected = expected.dropna("time", how="all").drop_vars("dayofyear")
+
+    result = doy_rolling_mean(ds, years=3).dropna("time", how="all")
+    assert result.precip.dims == expected.precip.dims
+    np.testing.assert_array_equal(result.time.values, expected.time.values)
+    xr.testing.assert_allclose(result.compute(), expected.compute(), rtol=1e-5)
+
+
+def test_sketch_quantiles_match_exact():
+    """Test that sketched quantiles of gamma precipitation are within the documented bound of exact ones."""
+    rng = np.random.default_rng(1)
+    precip = rng.gamma(0.5, 8.0, size=(3000, 4, 5))
+    precip[rng.random(precip.shape) < 0.3] = 0.0
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)},
+                    coords={"time": pd.date_range("2000-01-01", periods=3000), "lat": np.arange(4.0),
+                            "lon": np.arange(5.0)}).chunk({"time": 250})
+
+    edges = geometric_edges(high=precip.max(), n_bins=512)
+    sketch = histogram_sketch(ds, edges)
+    assert int(sketch.precip.sum("bin").min()) == 3000
+
+    # Sketches of parts of the record merge into the sketch of the whole
+    parts = [histogram_sketch(ds.isel(time=slice(i, i + 1000)), edges) for i in range(0, 3000, 1000)]
+    xr.testing.assert_equal(merge_sketches(parts).compute(), sketch.compute())
+
+    q = [0.1, 0.5, 2/3, 0.9, 0.99]
+    estimate = sketch_quantile(sketch, q).precip.transpose("quantile", ...).values
+    exact = ds.precip.quantile(q, dim="time").values
+    ratio = edges[2] / edges[1]
+    assert np.all(np.abs(estimate - exact) <= np.maximum(exact * (ratio - 1), 0.01) + 1e-9)
+
+
+def test_histogram_quantile():
+    """Test that few samples get exact quantiles, and many get sketched ones on fixed edges."""
+    rng = np.random.default_rng(2)
+    precip = rng.gamma(0.5, 8.0, size=(600, 3, 2))
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)}).chunk({"time": 100})
+    edges = sketch_edges("precip", n_bins=256)
+
+    few = ds.isel(time=slice(0, 30))
+    xr.testing.assert_allclose(histogram_quantile(few, 2/3, edges, method="nearest").precip.compute(),
+                               few.precip.quantile(2/3, dim="time", method="nearest").compute())
+
+    estimate = histogram_quantile(ds, 2/3, edges).precip.values
+    exact = ds.precip.quantile(2/3, dim="time").values
+    ratio = edges[2] / edges[1]
+    assert np.all(np.abs(estimate - exact) <= np.maximum(exact * (ratio - 1), 0.01) + 1e-9)
+
+    with pytest.raises(ValueError):
+        sketch_edges("unknown")
+
+
+def test_doy_linear_trend_matches_polyfit():
+    """Test that the closed form trend fit matches a per day of year polyfit."""
+    ds = _synthetic_record()
+    ds = ds.assign_coords(year=ds.time.dt.year)
+
+    def fit_trend(sub_ds):
+        return sub_ds.swap_dims({"time": "year"}).polyfit(dim="year", deg=1)
+
+    expected = ds.compute().groupby("dayofyear").map(fit_trend)
+    result = doy_linear_trend(ds)
+    assert result.precip_polyfit_coefficients.dims == expected.precip_polyfit_coefficients.dims
+    xr.testing.assert_allclose(result.compute(), expected, atol=1e-8)
+
+
+def test_doy_lookup_matches_sel():
+    """Test that the gathered climatology matches selecting by day of year label."""
+    ds = _synthetic_record()
+    clim = ds.groupby("dayofyear").mean(dim="time").chunk({"dayofyear": 30, "lat": 2})
+    assert list(doy_codes(pd.to_datetime(["2001-02-28", "2001-03-01", "2004-02-29", "2004-03-01"]))) == [58, 60,
+                                                                                                       59, 60]
+
+    times = pd.date_range("2010-12-15", "2012-03-15")
+    result = doy_lookup(clim, times, time_chunk=100)
+    assert result.precip.chunks[0][0] == 100
+    expected = clim.sel(dayofyear=add_dayofyear(xr.Dataset({"time": times})).dayofyear).drop_vars("dayofyear")
+    xr.testing.assert_equal(result.compute(), expected.compute())
+
+    obs = ds.drop_vars("dayofyear").isel(time=slice(0, 400)).drop_duplicates("time")
+    anom = get_anomalies(obs, clim, "precip")
+    xr.testing.assert_allclose(anom.precip, obs.precip - doy_lookup(clim, obs.time.values).precip)
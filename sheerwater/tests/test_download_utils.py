@@ -0,0 +1,105 @@
+"""Test the staged downloader against a local file server."""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from sheerwater.utils import StagedDownloader, get_session
+
+pytestmark = pytest.mark.default
+
+FILES = {
+    "a.h5": bytes(range(256)) * 64,
+    "b.h5": b"b" * 5000,
+    "flaky.h5": bytes(range(200)) * 50,
+}
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """Serve files with range support. The first request for flaky.h5 is cut off halfway."""
+
+    ranges = []
+    cut_off = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        """Respond with the whole file or the requested byte range."""
+        name = self.path.strip('/')
+        if name not in FILES:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = FILES[name]
+        start = 0
+        range_header = self.headers.get('Range')
+        with self.lock:
+            self.ranges.append((name, range_header))
+            cut = name == "flaky.h5" and name not in self.cut_off
+            self.cut_off.add(name)
+        if range_header:
+            start = int(range_header.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if cut:
+            self.wfile.write(data[start:len(data) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:])
+
+    def log_message(self, format, *args):  # noqa: ARG002
+        """Silence request logging."""
+        pass
+
+
+@pytest.fixture
+def file_server():
+    """Run a local HTTP file server."""
+    _FileHandler.ranges = []
+    _FileHandler.cut_off = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FileHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_staged_downloader(file_server, tmp_path):
+    """Test concurrent downloads, resuming of partial files and interrupted transfers."""
+    # Leave a partial download behind for a.h5
+    with open(tmp_path / "a.h5.part", "wb") as f:
+        f.write(FILES["a.h5"][:1000])
+
+    downloader = StagedDownloader(get_session(), str(tmp_path), max_workers=3, backoff=0.01, chunk_size=1000)
+    names = ["a.h5", "b.h5", "flaky.h5"]
+    paths = downloader.fetch_all([f"{file_server}/{name}" for name in names])
+
+    for name, path in zip(names, paths):
+        assert path == os.path.join(str(tmp_path), name)
+        with open(path, "rb") as f:
+            assert f.read() == FILES[name]
+        assert not os.path.exists(path + ".part")
+
+    # The partial file and the interrupted transfer were both resumed with range requests
+    assert ("a.h5", "bytes=1000-") in _FileHandler.ranges
+    assert ("flaky.h5", f"bytes={len(FILES['flaky.h5']) // 2}-") in _FileHandler.ranges
+
+    # Completed files aren't downloaded again
+    n_requests = len(_FileHandler.ranges)
+    downloader.fetch(f"{file_server}/b.h5")
+    assert len(_FileHandler.ranges) == n_requests
+
+
+def test_staged_downloader_missing(file_server, tmp_path):
+    """Test that a failed download fails the whole batch."""
+    downloader = StagedDownloader(get_session(), str(tmp_path), max_workers=3, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        downloader.fetch_all([f"{file_server}/b.h5", f"{file_server}/missing.h5"])
+    assert not os.path.exists(tmp_path / "missing.h5")
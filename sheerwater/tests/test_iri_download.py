@@ -0,0 +1,119 @@
+"""Test the concurrent IRI downloader against a local server of synthetic netCDFs."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+import requests
+import xarray as xr
+
+from sheerwater.forecasts.ecmwf_er_iri import iri_downloader
+from sheerwater.utils import get_session, run_concurrently
+
+pytestmark = pytest.mark.default
+
+DATES = pd.date_range("2020-01-02", periods=6, freq="3D")
+
+
+def _synthetic_forecast(date):
+    """A small IRI-like forecast netCDF for a single issuance date."""
+    ds = xr.Dataset(
+        {"2t": (["S", "L", "Y", "X"], np.full((1, 3, 4, 5), date.day, dtype=np.float32))},
+        coords={"S": [date], "L": [0.5, 1.5, 2.5], "Y": np.arange(4.0), "X": np.arange(5.0)},
+    )
+    return ds.to_netcdf(engine="scipy")
+
+
+class _IRIHandler(BaseHTTPRequestHandler):
+    """Serve synthetic forecasts. Every file is cut off halfway on its first request."""
+
+    files = {}
+    ranges = []
+    served = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        """Respond with the forecast for the requested date, honoring range requests."""
+        name = self.path.strip('/')
+        if name not in self.files:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get('Cookie') != "__dlauth_id=key":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(b"<html>Please log in</html>")
+            return
+
+        data = self.files[name]
+        range_header = self.headers.get('Range')
+        with self.lock:
+            self.ranges.append(range_header)
+            cut = name not in self.served
+            self.served.add(name)
+        start = int(range_header.split('=')[1].split('-')[0]) if range_header else 0
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Type", "application/x-netcdf")
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        end = len(data) // 2 if cut else len(data)
+        self.wfile.write(data[start:end])
+        if cut:
+            self.close_connection = True
+
+    def log_message(self, format, *args):  # noqa: ARG002
+        """Silence request logging."""
+        pass
+
+
+@pytest.fixture
+def iri_server():
+    """Run a local stand-in for the IRI data library."""
+    _IRIHandler.files = {f"{date:%Y%m%d}.nc": _synthetic_forecast(date) for date in DATES}
+    _IRIHandler.ranges = []
+    _IRIHandler.served = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _IRIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_iri_downloader(iri_server, tmp_path):
+    """Test concurrent, resumed downloads of many issuance dates over one session."""
+    session = get_session(pool_size=4)
+    session.cookies.set("__dlauth_id", "key")
+    downloader = iri_downloader(session=session, staging_dir=str(tmp_path), max_workers=4)
+    downloader.backoff = 0.01
+    downloader.chunk_size = 256
+
+    names = [f"{date:%Y%m%d}.nc" for date in DATES]
+    paths = run_concurrently(lambda name: downloader.fetch(f"{iri_server}/{name}", name), names, max_workers=4)
+
+    # Every file was resumed after being cut off
+    assert sum(r is not None for r in _IRIHandler.ranges) == len(DATES)
+    for date, path in zip(DATES, paths):
+        ds = xr.open_dataset(path, engine="scipy")
+        assert (ds["2t"] == date.day).all()
+        ds.close()
+
+    # Per-file latency is recorded
+    assert set(downloader.stats.keys()) == set(names)
+    assert all(stat['seconds'] >= 0 and stat['bytes'] > 0 for stat in downloader.stats.values())
+
+    # Staged files are not downloaded again, and missing dates raise rather than being dropped
+    downloader.stats.clear()
+    assert downloader.fetch(f"{iri_server}/{names[0]}", names[0]) == paths[0]
+    assert downloader.stats == {}
+    with pytest.raises(requests.exceptions.HTTPError):
+        run_concurrently(lambda name: downloader.fetch(f"{iri_server}/{name}", name), ["19990101.nc"])
+
+
+def test_iri_downloader_rejects_html(iri_server, tmp_path):
+    """Test that error pages served with a 200 aren't saved as forecasts."""
+    downloader = iri_downloader(session=get_session(), staging_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        downloader.fetch(f"{iri_server}/{DATES[0]:%Y%m%d}.nc")
@@ -0,0 +1,93 @@
+"""Test the ingestion ledger."""
+import pandas as pd
+import pytest
+
+from sheerwater.utils import IngestionLedger
+
+pytestmark = pytest.mark.default
+
+
+def test_ingestion_ledger(tmp_path):
+    """Test that only pending dates are fetched and that revalidation marks changed data stale."""
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    fetched = []
+    failed = []
+
+    def fetch(date):
+        fetched.append(date)
+        if date == pd.Timestamp("2020-01-03"):
+            return None
+        if date == pd.Timestamp("2020-01-04") and not failed:
+            failed.append(date)
+            raise RuntimeError("transient failure")
+        path = data_dir / f"{date:%Y%m%d}.bin"
+        path.write_bytes(b"x" * date.day)
+        return str(path)
+
+    ledger = IngestionLedger("test", path=str(tmp_path / "ledger.sqlite"))
+    dates = pd.date_range("2020-01-01", "2020-01-05")
+
+    # The failed date is raised after every other date has been ingested
+    with pytest.raises(RuntimeError, match="2020-01-04"):
+        ledger.run(dates, fetch)
+    assert len(fetched) == 5
+    entries = ledger.entries()
+    assert entries.loc["2020-01-01", "location"] == str(data_dir / "20200101.bin")
+    assert entries.loc["2020-01-02", "bytes"] == 2
+    assert entries.loc["2020-01-03", "status"] == "missing"
+    assert entries.loc["2020-01-04", "status"] == "failed"
+
+    # Only the missing and failed dates are fetched again
+    fetched.clear()
+    locations = ledger.run(dates, fetch, retry_missing=False)
+    assert fetched == [pd.Timestamp("2020-01-04")]
+    assert locations[2] is None
+    assert locations[3] == str(data_dir / "20200104.bin")
+
+    # Data deleted from where it was recorded is fetched again, even before revalidation
+    (data_dir / "20200105.bin").unlink()
+    assert ledger.pending(dates, retry_missing=False) == ["2020-01-05"]
+    fetched.clear()
+    ledger.run(dates, fetch, retry_missing=False)
+    assert fetched == [pd.Timestamp("2020-01-05")]
+
+    # The ledger persists, and revalidation catches changed and deleted data without fetching
+    ledger = IngestionLedger("test", path=str(tmp_path / "ledger.sqlite"))
+    (data_dir / "20200101.bin").write_bytes(b"changed")
+    (data_dir / "20200102.bin").unlink()
+    fetched.clear()
+    assert ledger.revalidate(dates) == ["2020-01-01", "2020-01-02"]
+    assert fetched == []
+    assert ledger.pending(dates, retry_missing=False) == ["2020-01-01", "2020-01-02"]
+    assert ledger.pending(dates, max_age=-1, retry_missing=False) == ["2020-01-01", "2020-01-02", "2020-01-04",
+                                                                      "2020-01-05"]
+
+
+def test_ingestion_ledger_recompute(tmp_path, monkeypatch):
+    """Test that every date is fetched when the cached functions are being recomputed or overwritten."""
+    import nuthatch.nuthatch as nuthatch_core
+
+    monkeypatch.setattr(nuthatch_core, "global_recompute", None)
+    monkeypatch.setattr(nuthatch_core, "global_cache_mode", None)
+    fetched = []
+
+    def fetch(date):
+        fetched.append(date)
+        return str(tmp_path)
+
+    ledger = IngestionLedger("test", path=str(tmp_path / "ledger.sqlite"))
+    dates = pd.date_range("2020-01-01", "2020-01-03")
+    ledger.run(dates, fetch, describe=None)
+    fetched.clear()
+
+    monkeypatch.setattr(nuthatch_core, "global_recompute", ["other_fn"])
+    ledger.run(dates, fetch, describe=None, functions=["raw_fn"])
+    assert fetched == []
+
+    for recompute, cache_mode in [(["raw_fn"], None), ("_all", None), (False, "overwrite")]:
+        monkeypatch.setattr(nuthatch_core, "global_recompute", recompute)
+        monkeypatch.setattr(nuthatch_core, "global_cache_mode", cache_mode)
+        fetched.clear()
+        ledger.run(dates, fetch, describe=None, functions=["raw_fn"])
+        assert fetched == list(dates)
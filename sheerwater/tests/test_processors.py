@@ -1,7 +1,12 @@
 """Lightweight tests for event registration and basic event behavior."""
+import logging
+
+import numpy as np
+import pandas as pd
 import pytest
 import xarray as xr
 
+from sheerwater.interfaces import datasets
 from sheerwater.interfaces.processors import get_processor_fn, regrid, processor
 from sheerwater.forecasts import ecmwf_ifs_er, ecmwf_ifs_er_debiased
 
@@ -25,3 +30,58 @@ def test_basic_processor(remote_dask_cluster): #noqa: ARG001
     ds2 = ecmwf_ifs_er("2021-01-01", "2021-01-05")
 
     xr.testing.assert_equal(ds.drop_attrs(), ds2.drop_attrs())
+
+
+def test_pushdown_selects_region_and_time(monkeypatch, caplog):
+    """A sliceable dataset is cut to the region bounding box and time window before processing."""
+    lats, lons = np.arange(-90, 90.1, 1.5), np.arange(-180, 180, 1.5)
+    times = pd.date_range("2020-01-01", "2020-12-31")
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], np.zeros((len(times), len(lats), len(lons))))},
+                    coords={"time": times, "lat": lats, "lon": lons}).chunk({"time": 30})
+    # The Kenya bounding box on the 1.5 degree grid, without reading the region geometries
+    monkeypatch.setattr(datasets.spatial_subdivisions, "region_bounds",
+                        lambda *args: (-4.5, 4.5, 33.0, 42.0))  # noqa: ARG005
+
+    proc = datasets.data(sliceable=True)
+    proc.func_name, proc.processors, proc.region, proc.grid = "synthetic", [], "kenya", "global1_5"
+    proc.start_time, proc.end_time = "2020-03-01", "2020-03-31"
+    with caplog.at_level(logging.INFO, logger=datasets.logger.name):
+        result = proc.pushdown(ds)
+    expected = ds.sel(time=slice("2020-03-01", "2020-03-31"), lat=slice(-4.5, 4.5), lon=slice(33.0, 42.0))
+    xr.testing.assert_identical(result, expected)
+    assert f"{ds.nbytes} bytes before, {expected.nbytes} bytes after" in caplog.text
+
+    # Datasets that are not declared sliceable, or that run processors, are left whole
+    assert datasets.data().pushdown(ds) is ds
+    proc.processors = ["regrid"]
+    assert proc.pushdown(ds) is ds
+
+
+def test_valid_time_store_only_read_on_request(monkeypatch):
+    """The valid time store is only looked up when a read passes valid_time_store=True, keyed on its arguments."""
+    calls = []
+
+    def _valid_time_fcst(*args, **kwargs):  # noqa: ARG001
+        calls.append(kwargs)
+        return None
+    monkeypatch.setattr(datasets, "valid_time_fcst", _valid_time_fcst)
+
+    init_times = pd.date_range("2020-01-02", periods=3, freq="7D")
+    leads = pd.timedelta_range("0D", periods=5, freq="D")
+    ds = xr.Dataset({"precip": (["init_time", "prediction_timedelta"], np.zeros((3, 5)))},
+                    coords={"init_time": init_times, "prediction_timedelta": leads})
+
+    proc = datasets.forecast(valid_time_store=True)
+    proc.func_name, proc.processors, proc.event, proc.densify = "synthetic", [], None, False
+    proc.variable, proc.prob_type, proc.agg_days, proc.grid = "precip", "deterministic", 7, "global1_5"
+    proc.mask, proc.region, proc.lookback_source, proc.missing_thresh = None, "global", "era5", 0.5
+
+    # Not requested by the read: the store is never consulted
+    assert proc.read_valid_time_store(ds) is None
+    assert calls == []
+
+    # Requested: every argument that changes the result is part of the lookup
+    proc.read_valid_time = True
+    assert proc.read_valid_time_store(ds) is None
+    assert calls[0]["lookback_source"] == "era5"
+    assert calls[0]["missing_thresh"] == 0.5
@@ -0,0 +1,65 @@
+"""Test the virtual reference index builder on locally generated HDF5 files."""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from sheerwater.utils.reference_utils import (build_reference_index, open_reference_index, read_reference_index,
+                                              referenced_urls, write_reference_index)
+
+pytestmark = pytest.mark.default
+
+
+def _write_day(path, day, with_zeros=False):
+    """Write a single day IMERG-like netCDF4 file with a chunked, compressed precip variable."""
+    lats = np.arange(-4.5, 5, 1.0)
+    lons = np.arange(-9.5, 10, 1.0)
+    rng = np.random.default_rng(day.dayofyear)
+    precip = rng.gamma(0.5, 2.0, size=(1, len(lons), len(lats))).astype(np.float32)
+    precip[0, 0, 0] = np.nan
+    if with_zeros:
+        precip[0, 1, :] = 0.0
+    count = (precip > 0).astype(np.int16)
+    ds = xr.Dataset(
+        {"precipitation": (["time", "lon", "lat"], precip, {"units": "mm/day"}),
+         "precipitation_cnt": (["time", "lon", "lat"], count)},
+        coords={"time": [day], "lon": lons, "lat": lats},
+        attrs={"title": "synthetic imerg"},
+    )
+    ds.to_netcdf(path, engine="h5netcdf", encoding={
+        "precipitation": {"zlib": True, "shuffle": True, "chunksizes": (1, 10, 5), "_FillValue": -9999.9},
+        "time": {"units": "seconds since 1970-01-01", "dtype": "int64"},
+    })
+    return ds
+
+
+def test_reference_index_matches_mfdataset(tmp_path):
+    """Test that the virtual dataset opened from the index matches opening every file."""
+    days = pd.date_range("2020-01-01", periods=5)
+    paths = [str(tmp_path / f"{day:%Y%m%d}.nc") for day in days]
+    for i, (day, path) in enumerate(zip(days, paths)):
+        _write_day(path, day, with_zeros=(i == 2))
+
+    index = build_reference_index(paths, concat_dim="time")
+    assert referenced_urls(index) == set(paths)
+    # Scanning the files concurrently or one at a time builds the same index
+    assert build_reference_index(paths, concat_dim="time", max_workers=1) == index
+
+    # Round trip the index through JSON, in a folder that doesn't exist yet
+    index_path = str(tmp_path / "refs" / "v2" / "index.json")
+    write_reference_index(index, index_path)
+    ds = open_reference_index(read_reference_index(index_path))
+    expected = xr.open_mfdataset(paths, engine="h5netcdf")
+
+    assert ds.attrs["title"] == "synthetic imerg"
+    assert ds.precipitation.dims == ("time", "lon", "lat")
+    np.testing.assert_array_equal(ds.time.values, days.values)
+    np.testing.assert_array_equal(ds.lat.values, expected.lat.values)
+    xr.testing.assert_allclose(ds.precipitation.load(), expected.precipitation.load())
+    # Every variable is indexed unless a subset is requested
+    xr.testing.assert_equal(ds.precipitation_cnt.load(), expected.precipitation_cnt.load())
+    subset = open_reference_index(build_reference_index(paths, concat_dim="time", variables=["precipitation"]))
+    assert list(subset.data_vars) == ["precipitation"]
+    # Valid zeros survive and fill values are masked
+    assert (ds.precipitation.isel(time=2, lon=1) == 0).all()
+    assert np.isnan(ds.precipitation.isel(lon=0, lat=0)).all()
@@ -0,0 +1,51 @@
+"""Test the vectorized all-lead reforecast bias on synthetic data."""
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from dateutil.relativedelta import relativedelta
+
+from sheerwater.forecasts.ecmwf_er import reforecast_bias, reforecast_valid_dates
+
+pytestmark = pytest.mark.default
+
+
+def _loop_bias(ds_deb, ds_truth, lead):
+    """The bias of a single lead, one issuance date at a time."""
+    ds_lead = ds_deb.sel(lead_time=lead)
+
+    def get_bias(ds_sub):
+        dates = [np.datetime64(pd.Timestamp(ds_sub['model_issuance_date'].values[0]) + relativedelta(years=int(x)))
+                 for x in ds_sub.start_year.values]
+        truth = ds_truth.sel(time=[x + lead for x in dates])
+        truth = truth.assign_coords(time=ds_sub.start_year.values).rename(time='start_year')
+        return (truth - ds_sub).mean(dim='start_year')
+
+    return ds_lead.groupby('model_issuance_date').map(get_bias)
+
+
+def test_reforecast_bias_matches_per_lead_loop():
+    """Test that the all-lead bias matches computing each lead and issuance date separately."""
+    rng = np.random.default_rng(0)
+    issuance = pd.to_datetime(["2020-02-27", "2020-02-29", "2020-03-02"])
+    start_years = np.arange(-4, 0)
+    leads = np.array([0, 7, 14], dtype='timedelta64[D]').astype('timedelta64[ns]')
+    ds_deb = xr.Dataset(
+        {"precip": (["model_issuance_date", "start_year", "lead_time", "lat", "lon"],
+                    rng.random((3, 4, 3, 2, 3)))},
+        coords={"model_issuance_date": issuance, "start_year": start_years, "lead_time": leads,
+                "lat": [0.0, 1.0], "lon": [0.0, 1.0, 2.0]})
+    times = pd.date_range("2015-01-01", "2020-12-31")
+    ds_truth = xr.Dataset({"precip": (["time", "lat", "lon"], rng.random((len(times), 2, 3)))},
+                          coords={"time": times, "lat": [0.0, 1.0], "lon": [0.0, 1.0, 2.0]})
+
+    # Leap day issuances fall back to February 28th in non-leap hindcast years
+    valid = reforecast_valid_dates(issuance, start_years, leads)
+    assert valid.shape == (3, 4, 3)
+    assert valid[1, 0, 0] == np.datetime64("2016-02-29")
+    assert valid[1, 1, 1] == np.datetime64("2017-03-07")
+
+    bias = reforecast_bias(ds_deb.chunk({"lead_time": 1}), ds_truth.chunk({"time": 365})).compute()
+    for lead in leads:
+        expected = _loop_bias(ds_deb, ds_truth, lead)
+        xr.testing.assert_allclose(bias.sel(lead_time=lead), expected.transpose("model_issuance_date", ...))
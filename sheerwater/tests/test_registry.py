@@ -0,0 +1,57 @@
+"""Tests for the registry manifest and lazy loading of forecasts and data sources."""
+import json
+import subprocess
+import sys
+import types
+
+import pytest
+
+from sheerwater.interfaces import datasets
+
+pytestmark = pytest.mark.default
+
+
+def test_registry_manifest_parity(tmp_path):
+    """The shipped manifest lists exactly the sources registered by importing every source module."""
+    path = tmp_path / "registry_manifest.json"
+    datasets.write_registry_manifest(path)
+    generated = json.loads(path.read_text())
+    shipped = datasets.registry_manifest()
+    for kind in ["forecast", "data"]:
+        # Ignore sources registered by the tests themselves
+        package_sources = {name: entry for name, entry in generated[kind].items()
+                           if not entry.startswith("sheerwater.tests")}
+        assert package_sources == shipped[kind], f"Regenerate the registry manifest: {kind} sources differ"
+
+
+def test_lookup_imports_only_the_source_module():
+    """Getting a source imports its module and not the modules of the other sources."""
+    code = ("import sys; from sheerwater.interfaces import get_data; get_data('chirps'); "
+            "print(','.join(m for m in sys.modules if m.startswith('sheerwater.')))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    modules = out.strip().splitlines()[-1].split(",")
+    assert "sheerwater.data.chirps" in modules
+    assert "sheerwater.data.imerg" not in modules
+    assert not any(module.startswith("sheerwater.forecasts.") for module in modules)
+
+
+
+def test_lookup_skips_heavy_dependencies():
+    """Getting a source doesn't import the plotting, geospatial, regridding or cluster dependencies."""
+    code = ("import sys; from sheerwater.interfaces import datasets; datasets.get_forecast_or_data('era5'); "
+            "print(','.join(sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    modules = set(out.strip().splitlines()[-1].split(","))
+    for heavy in ["geopandas", "matplotlib", "plotly", "xarray_regrid", "coiled", "sklearn"]:
+        assert heavy not in modules, f"{heavy} is imported by a source lookup"
+
+def test_lazy_exports_bind_functions():
+    """Exported functions are bound over their modules of the same name, however they were imported."""
+    from sheerwater.data.chirps import chirps_manifest  # noqa: F401
+    from sheerwater.data import chirps, chirps_v2
+    from sheerwater.forecasts import ecmwf_ifs_er
+    assert not isinstance(chirps, types.ModuleType) and callable(chirps)
+    assert callable(chirps_v2) and callable(ecmwf_ifs_er)
+    assert "imerg" in dir(sys.modules["sheerwater.data"])
+    with pytest.raises(AttributeError):
+        sys.modules["sheerwater.data"].not_a_source
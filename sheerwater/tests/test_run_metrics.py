@@ -0,0 +1,100 @@
+"""Tests for the scheduling of metric runs in jobs/run_metrics.py."""
+import json
+import time
+
+import pytest
+
+from jobs.run_metrics import combo_key, find_pending_combos, load_run_costs, plan_combos, run_in_parallel
+
+pytestmark = pytest.mark.default
+
+
+def _sleep(seconds, fail=False):
+    """A stand-in for a metric run."""
+    time.sleep(seconds)
+    if fail:
+        raise RuntimeError("metric failed")
+    return seconds
+
+
+def test_run_in_parallel_without_batch_barriers(tmp_path):
+    """Runs are topped up as others finish, so a slow run does not hold back the rest."""
+    combos = [{"seconds": 1.0}] + [{"seconds": 0.1}] * 6 + [{"seconds": 0.1, "fail": True}]
+    log_path = tmp_path / "runs.jsonl"
+
+    start = time.perf_counter()
+    records = run_in_parallel(_sleep, combos, parallelism=2, name="test", log_path=str(log_path))
+    elapsed = time.perf_counter() - start
+
+    # With batches of two, every batch would wait for its slowest run: 1.0 + 3 * 0.1 seconds
+    assert elapsed < 1.25
+    assert records[-1]["index"] == 0
+    assert [r["status"] for r in sorted(records, key=lambda r: r["index"])] == ["succeeded"] * 7 + ["failed"]
+    assert "metric failed" in next(r["error"] for r in records if r["index"] == 7)
+    assert all(r["duration"] >= r["combo"]["seconds"] for r in records)
+
+    logged = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [r["index"] for r in logged] == [r["index"] for r in records]
+
+    # Skipped runs are not run, and runs in order are recorded the same way
+    records = run_in_parallel(_sleep, combos, parallelism=1, skip=6)
+    assert [r["index"] for r in records] == [6, 7]
+
+
+def test_plan_combos(tmp_path):
+    """Each shared upstream is warmed once before its dependents, with the longest work first."""
+    base = {"truth": "era5", "variable": "precip", "grid": "global1_5", "agg_days": 7,
+            "start_time": "2016-01-01", "end_time": "2022-12-31"}
+    combos = [
+        {**base, "forecast": "ecmwf_ifs_er", "metric": "mae"},
+        {**base, "forecast": "ecmwf_ifs_er", "metric": "crps"},
+        {**base, "forecast": "ecmwf_ifs_er", "metric": "rmse"},
+        {**base, "forecast": "climatology_2015", "metric": "mae"},
+        {**base, "forecast": "ecmwf_ifs_er", "metric": "mae"},
+    ]
+
+    log_path = tmp_path / "runs.jsonl"
+    records = [
+        {"combo": {**combos[0], "recompute": False}, "status": "succeeded", "duration": 10.0},
+        {"combo": combos[1], "status": "succeeded", "duration": 30.0},
+        {"combo": combos[2], "status": "failed", "duration": 1.0},
+        {"combo": combos[3], "status": "succeeded", "duration": 50.0},
+    ]
+    log_path.write_text("\n".join(json.dumps(r) for r in records) + "\n")
+    costs = load_run_costs([str(log_path), str(tmp_path / "missing.jsonl")])
+    assert costs == {combo_key(combos[0]): 10.0, combo_key(combos[1]): 30.0, combo_key(combos[3]): 50.0}
+
+    order, after = plan_combos(combos, costs)
+    # The duplicate run is dropped. The ecmwf group costs 10 + 30 + 20 and runs first, warmed by its
+    # cheapest run, then the rest by decreasing cost, with the unknown rmse run at the group mean.
+    assert order == [0, 1, 2, 3]
+    assert after == {1: 0, 2: 0}
+
+    # Without costs the runs keep their order within each group
+    order, after = plan_combos(combos)
+    assert order == [0, 1, 2, 3]
+    assert after == {1: 0, 2: 0}
+
+
+def test_find_pending_combos(tmp_path):
+    """Cached runs and runs that succeeded before are dropped, without computing anything."""
+    cached = {1, 3}
+    computed = []
+
+    def _cached(n, recompute=False, filepath_only=False, fail_if_no_cache=False):  # noqa: ARG001
+        """A stand-in for a cached metric function."""
+        if n in cached and not recompute:
+            return f"caches/_cached/{n}.zarr"
+        if fail_if_no_cache:
+            raise RuntimeError("no cache")
+        computed.append(n)
+        return n
+
+    combos = [{"n": n, "recompute": False} for n in range(5)] + [{"n": 3, "recompute": True}]
+    log_path = tmp_path / "runs.jsonl"
+    log_path.write_text(json.dumps({"combo": {"n": 2, "recompute": False}, "status": "succeeded"}) + "\n"
+                        + json.dumps({"combo": {"n": 4}, "status": "failed"}) + "\n")
+
+    pending = find_pending_combos(_cached, combos, [str(log_path)])
+    assert pending == [{"n": 0, "recompute": False}, {"n": 4, "recompute": False}, {"n": 3, "recompute": True}]
+    assert computed == []
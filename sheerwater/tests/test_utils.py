@@ -1,11 +1,17 @@
 """Test the utility functions in the utils module."""
+import json
+
 import numpy as np
 import xarray as xr
 import pandas as pd
 import pytest
 
-from sheerwater.utils import base180_to_base360, base360_to_base180, get_dates, get_grid
+from sheerwater.utils import (GraphTooLargeError, base180_to_base360, base360_to_base180, check_graph,
+                              convert_init_time_to_pred_time, extract_at_stations, get_dates, get_grid, get_grid_ds,
+                              graph_limits, nearest_grid_index, plan_chunks, run_concurrently, select_pred_time, span,
+                              to_chrome_trace, traced)
 from sheerwater.utils.data_utils import regrid, roll_and_agg
+from sheerwater.utils.regrid_utils import cached_conservative_regrid, can_coarsen, coarsen_regrid
 
 pytestmark = pytest.mark.default
 
@@ -120,3 +126,238 @@ def test_roll_and_agg_stride_selection():
         "2024-01-08",
     ]
     assert rolled_stride_weekdays["precip"].values.tolist() == [6.0, 15.0, 27.0]
+
+
+def test_nearest_grid_index():
+    """Test nearest grid lookup, including unsorted grids and the tolerance cutoff."""
+    coords = np.array([0.5, 0.0, 1.0, 1.5])
+    idx = nearest_grid_index(coords, [0.1, 0.74, 1.6, 5.0, np.nan], tolerance=0.25)
+    assert idx.tolist() == [1, 0, 3, -1, -1]
+
+
+def test_extract_at_stations(caplog):
+    """Test that point extraction matches nearest selection for every product and logs dropped stations."""
+    times = pd.date_range("2020-01-01", periods=4)
+    lats = np.arange(-2.0, 2.5, 0.5)
+    lons = np.arange(30.0, 35.0, 0.5)
+    data = np.random.rand(len(times), len(lats), len(lons))
+    products = {
+        "a": xr.DataArray(data, dims=["time", "lat", "lon"], coords={"time": times, "lat": lats, "lon": lons}),
+        "b": xr.DataArray(data * 2, dims=["time", "lat", "lon"],
+                          coords={"time": times, "lat": lats, "lon": lons}).chunk({"time": 2}),
+    }
+    station_ids = ["s1", "s2", "far"]
+    st_lats = [-1.1, 0.7, 40.0]
+    st_lons = [31.2, 34.4, 31.0]
+
+    table = extract_at_stations(products, station_ids, st_lats, st_lons, tolerance=0.25 + 1e-6)
+    assert "Dropped 1 stations outside the grid of a: far." in caplog.text
+    df = table.to_pandas()
+    assert set(df.columns) == {"station_id", "time", "product", "value"}
+    assert len(df) == 2 * len(times) * 2
+    assert "far" not in df["station_id"].values
+
+    for name, da in products.items():
+        for sid, lat, lon in zip(station_ids[:2], st_lats[:2], st_lons[:2]):
+            expected = da.sel(lat=lat, lon=lon, method="nearest").values
+            got = df[(df["product"] == name) & (df["station_id"] == sid)].sort_values("time")["value"].values
+            np.testing.assert_allclose(got, expected)
+
+
+def test_select_pred_time():
+    """Test that subsetting a valid time store matches converting the same init times."""
+    rng = np.random.default_rng(0)
+    init_times = pd.date_range("2020-01-01", periods=20, freq="3D")
+    leads = pd.timedelta_range("0D", "9D", freq="D")
+    ds = xr.Dataset({"precip": (["init_time", "prediction_timedelta", "lat"], rng.random((20, 10, 3)))},
+                    coords={"init_time": init_times, "prediction_timedelta": leads, "lat": [0.0, 1.0, 2.0]})
+    store = convert_init_time_to_pred_time(ds)
+
+    subset = ds.isel(init_time=slice(4, 11), prediction_timedelta=slice(2, 8))
+    expected = convert_init_time_to_pred_time(subset)
+    result = select_pred_time(store, subset.init_time.values, subset.prediction_timedelta.values)
+    xr.testing.assert_equal(result.transpose(*expected.precip.dims), expected)
+
+
+def test_plan_chunks():
+    """Test that planned chunks are near the target size and follow the access pattern."""
+    sizes = {"time": 3000, "lat": 721, "lon": 1440, "prediction_timedelta": 46, "member": 50}
+    full = ["prediction_timedelta", "member"]
+    target_bytes = 100 * 2**20
+
+    series = plan_chunks(sizes, dtype="float32", access="timeseries", full_dims=full)
+    assert series["time"] == 3000 and series["member"] == 50 and series["prediction_timedelta"] == 46
+    assert series["lat"] * series["lon"] * 4 * 3000 * 46 * 50 <= target_bytes
+
+    fields = plan_chunks(sizes, access="spatial")
+    assert fields["lat"] == 721 and fields["lon"] == 1440
+    assert fields["time"] == 25 and fields["prediction_timedelta"] == fields["member"] == 1
+
+    sizes = {"time": 3000, "lat": 721, "lon": 1440}
+    for access in ["timeseries", "spatial"]:
+        chunks = plan_chunks(sizes, dtype="float64", access=access)
+        nbytes = 8 * np.prod(list(chunks.values()))
+        assert 0.5 * target_bytes <= nbytes <= target_bytes
+
+    # Small datasets fit in a single chunk
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], np.zeros((10, 4, 5)))})
+    assert plan_chunks(ds, access="spatial") == {"time": 10, "lat": 4, "lon": 5}
+    with pytest.raises(ValueError):
+        plan_chunks(ds, access="diagonal")
+
+
+def test_cached_conservative_regrid(tmp_path):
+    """Test that regridding with cached weights matches xarray-regrid and reuses the stored weights."""
+    rng = np.random.default_rng(0)
+    lats, lons = np.arange(-89.875, 90, 0.25)[200:280], np.arange(-179.875, 180, 0.25)[400:520]
+    precip = rng.random((6, len(lats), len(lons)))
+    precip[rng.random(precip.shape) < 0.1] = np.nan
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)},
+                    coords={"time": pd.date_range("2000-01-01", periods=6), "lat": lats, "lon": lons})
+    ds = ds.chunk({"time": 2, "lat": 40, "lon": 60})
+    target = xr.Dataset(coords={"lat": np.arange(-90, 90.1, 1.5), "lon": np.arange(-180, 180, 1.5)})
+
+    expected = ds.regrid.conservative(target)
+    result = cached_conservative_regrid(ds, target, target_grid="test1_5", weights_dir=str(tmp_path))
+    xr.testing.assert_allclose(result.compute(), expected.compute())
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+
+    # A second year on the same grid is served from the stored weights
+    ds_next = ds.assign_coords(time=pd.date_range("2001-01-01", periods=6)) * 2
+    result = cached_conservative_regrid(ds_next, target, target_grid="test1_5", weights_dir=str(tmp_path),
+                                        output_chunks={"lat": 121, "lon": 240})
+    xr.testing.assert_allclose(result.compute(), ds_next.regrid.conservative(target).compute())
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+
+    # A target grid of the same name and shape but different coordinates gets its own weights
+    shifted = target.assign_coords(lon=target.lon + 0.75)
+    result = cached_conservative_regrid(ds, shifted, target_grid="test1_5", weights_dir=str(tmp_path))
+    xr.testing.assert_allclose(result.compute(), ds.regrid.conservative(shifted).compute())
+    assert len(list(tmp_path.glob("*.npz"))) == 3
+
+
+def test_cached_conservative_regrid_small_grid(tmp_path):
+    """Test cached weights against xarray-regrid on a small grid with a descending, partly uncovered target."""
+    rng = np.random.default_rng(1)
+    lats, lons = np.arange(-3.5, 4), np.arange(10.5, 18)
+    precip = rng.random((2, len(lats), len(lons)))
+    precip[0, 2, 3] = np.nan
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)},
+                    coords={"time": pd.date_range("2000-01-01", periods=2), "lat": lats, "lon": lons})
+    target = xr.Dataset(coords={"lat": np.arange(5, -6, -2.0), "lon": np.arange(9, 20, 2.0)})
+
+    expected = ds.regrid.conservative(target).compute()
+    result = cached_conservative_regrid(ds, target, target_grid="test2_0", weights_dir=str(tmp_path)).compute()
+    xr.testing.assert_allclose(result, expected)
+
+
+def test_coarsen_regrid_matches_conservative():
+    """Test that coarsening global0_25 onto nested grids matches conservative regridding."""
+    rng = np.random.default_rng(0)
+    lons, lats, _, _ = get_grid("global0_25")
+    precip = rng.random((2, len(lats), len(lons))).astype(np.float32)
+    precip[rng.random(precip.shape) < 0.3] = np.nan
+    precip[:, 300:340, 100:200] = np.nan
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], precip)},
+                    coords={"time": pd.date_range("2000-01-01", periods=2), "lat": lats, "lon": lons})
+    ds = ds.chunk({"lat": 240, "lon": 480})
+
+    assert not can_coarsen(ds, get_grid_ds("global0_1"))
+    regional = get_grid_ds("global1_5").sel(lat=slice(-30, 30), lon=slice(10, 60))
+    for target in [get_grid_ds("global1_5"), get_grid_ds("global1_0"), regional]:
+        assert can_coarsen(ds, target)
+        expected = ds.regrid.conservative(target).compute()
+        result = coarsen_regrid(ds, target).compute()
+        assert result.precip.dtype == np.float32
+        xr.testing.assert_allclose(result.transpose(*expected.precip.dims), expected, atol=1e-6)
+
+    result = regrid(ds, "global1_5", output_chunks={"lat": 121, "lon": 240})
+    assert result.precip.chunks[1:] == ((121,), (240,))
+
+
+def test_coarsen_regrid_from_finer_product():
+    """Test that coarsening a 0.25 degree product regridded from 0.1 degrees stays close to a direct regrid."""
+    fine = get_grid_ds("global0_1").sel(lat=slice(-20, 20), lon=slice(0, 40))
+    lat, lon = np.deg2rad(fine.lat), np.deg2rad(fine.lon)
+    field = 5 + np.sin(8 * lat) * np.cos(6 * lon) + 0.5 * np.cos(12 * lat + 4 * lon)
+    ds = xr.Dataset({"precip": (["time", "lat", "lon"], np.stack([field.transpose("lat", "lon").values] * 2))},
+                    coords={"time": pd.date_range("2000-01-01", periods=2), "lat": fine.lat, "lon": fine.lon})
+    mid = xr.Dataset(coords=get_grid_ds("global0_25").sel(lat=slice(-15, 15), lon=slice(5, 35)).coords)
+    target = xr.Dataset(coords=get_grid_ds("global1_5").sel(lat=slice(-12, 12), lon=slice(7.5, 31.5)).coords)
+
+    product = ds.regrid.conservative(mid)
+    assert can_coarsen(product, target)
+    result = coarsen_regrid(product, target).compute()
+    expected = ds.regrid.conservative(target).compute()
+    xr.testing.assert_allclose(result.transpose(*expected.precip.dims), expected, atol=1e-3)
+
+
+def test_tracing(tmp_path, monkeypatch):
+    """Test that traced calls write nested spans with timings, task counts and memory, and nothing otherwise."""
+    @traced("pipeline")
+    def pipeline(n, region="global"):  # noqa: ARG001
+        with span("build", stage=1) as s:
+            ds = xr.Dataset({"x": (["time"], np.arange(n, dtype=float))}).chunk({"time": 10})
+            ds = ds + 1
+            s.record(ds)
+        with span("compute"):
+            return ds.compute()
+
+    pipeline(100)
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setenv("SHEERWATER_TRACE_DIR", str(tmp_path))
+    pipeline(100, region="kenya")
+    traces = list(tmp_path.glob("pipeline_*.jsonl"))
+    assert len(traces) == 1
+    records = {r["name"]: r for r in map(json.loads, traces[0].read_text().splitlines())}
+    assert list(records) == ["pipeline", "build", "compute"]
+    assert records["pipeline"]["attrs"] == {"n": 100, "region": "kenya"}
+    assert records["build"]["parent"] == records["compute"]["parent"] == records["pipeline"]["id"]
+    assert records["build"]["n_tasks"] > 10 and records["build"]["attrs"] == {"stage": 1}
+    assert records["pipeline"]["n_tasks"] == 0
+    assert records["compute"]["compute_time"] > 0
+    assert records["pipeline"]["wall_time"] >= records["build"]["wall_time"] + records["compute"]["wall_time"]
+    assert all(r["peak_rss_mb"] > 0 for r in records.values())
+
+    chrome = json.loads(open(to_chrome_trace(str(traces[0]))).read())
+    assert [e["name"] for e in chrome["traceEvents"]] == ["pipeline", "build", "compute"]
+
+
+def test_check_graph(monkeypatch):
+    """Test that graphs above the size limits are reported with their largest layers, and small ones pass."""
+    ds = xr.Dataset({"x": (["time", "lat"], np.ones((1000, 10)))}).chunk({"time": 1})
+    ds = (ds + 1).chunk({"time": 500}).mean("time")
+
+    stats = check_graph(ds)
+    assert stats["n_tasks"] > 2000
+    assert stats["n_layers"] == len(stats["layers"]) >= 3
+    assert stats["layers"][0]["n_tasks"] >= stats["layers"][-1]["n_tasks"]
+
+    with pytest.warns(UserWarning, match="above the size limits") as record:
+        check_graph(ds, name="test", max_tasks=100)
+    assert stats["layers"][0]["name"] in str(record[0].message)
+
+    with pytest.raises(GraphTooLargeError, match="tasks > 100"):
+        with graph_limits(max_tasks=100, on_exceed="raise"):
+            check_graph(ds)
+
+    monkeypatch.setenv("SHEERWATER_GRAPH_MAX_TASKS", "100")
+    monkeypatch.setenv("SHEERWATER_GRAPH_ON_EXCEED", "raise")
+    with pytest.raises(GraphTooLargeError):
+        check_graph(ds)
+    # Explicit limits take precedence over the environment
+    assert check_graph(ds, on_exceed="ignore")["n_tasks"] == stats["n_tasks"]
+    assert check_graph(ds.compute())["n_tasks"] == 0
+
+
+def test_run_concurrently():
+    """Test that errors are raised unless explicitly skipped, whatever the number of workers."""
+    def invert(x):
+        return 1 / x
+
+    for max_workers in [1, 4]:
+        assert run_concurrently(invert, [1, 2, 4], max_workers=max_workers) == [1, 0.5, 0.25]
+        with pytest.raises(ZeroDivisionError):
+            run_concurrently(invert, [1, 0, 4], max_workers=max_workers)
+        assert run_concurrently(invert, [1, 0, 4], max_workers=max_workers, skip_errors=True) == [1, None, 0.25]
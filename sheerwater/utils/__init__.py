@@ -1,38 +1,79 @@
 """Utility functions for benchmarking."""
-from .data_utils import get_anomalies, regrid, roll_and_agg
-from .forecaster_utils import convert_init_time_to_pred_time, convert_pred_time_to_init_time, get_variable, densify_fcst
-from .general_utils import load_netcdf, load_object, load_zarr, plot_ds, plot_ds_map, run_in_parallel, write_zarr
-from .grouping_utils import groupby_region, groupby_time, latitude_weights, detect_in_time
-from .plotting_utils import plot_by_region
-from .remote import dask_remote, start_remote
-from .secrets import cdsapi_secret, ecmwf_secret, gap_secret, salient_secret, tahmo_secret, huggingface_read_token
-from .space_utils import (
-    get_grid_ds,
-    get_globe_slice,
-    get_grid,
-    is_wrapped,
-    lon_base_change,
-    snap_point_to_grid,
-    base180_to_base360,
-    base360_to_base180,
-    check_bases,
-    add_spatial_attrs,
-    check_spatial_attr,
-    is_station_grid,
-)
-from .task_utils import first_satisfied_date
-from .time_utils import (
-    add_dayofyear,
-    assign_grouping_coordinates,
-    convert_group_to_time,
-    date_mean,
-    doy_mean,
-    generate_dates_in_between,
-    get_dates,
-    is_valid_forecast_date,
-    pad_with_leapdays,
-    shift_by_days,
-)
+from .lazy_utils import lazy_exports
+
+# Utility modules are imported when one of their functions is first used, so that importing one
+# function doesn't pull in the plotting, geospatial and cluster dependencies of the others
+lazy_exports(__name__, {
+    "plan_chunks": ".chunk_utils",
+    "get_anomalies": ".data_utils",
+    "regrid": ".data_utils",
+    "roll_and_agg": ".data_utils",
+    "StagedDownloader": ".download_utils",
+    "download_url": ".download_utils",
+    "get_session": ".download_utils",
+    "list_directory": ".download_utils",
+    "run_concurrently": ".download_utils",
+    "convert_init_time_to_pred_time": ".forecaster_utils",
+    "convert_pred_time_to_init_time": ".forecaster_utils",
+    "get_variable": ".forecaster_utils",
+    "densify_fcst": ".forecaster_utils",
+    "select_pred_time": ".forecaster_utils",
+    "GraphTooLargeError": ".graph_utils",
+    "check_graph": ".graph_utils",
+    "graph_limits": ".graph_utils",
+    "graph_stats": ".graph_utils",
+    "load_netcdf": ".general_utils",
+    "load_object": ".general_utils",
+    "load_zarr": ".general_utils",
+    "plot_ds": ".general_utils",
+    "plot_ds_map": ".general_utils",
+    "run_in_parallel": ".general_utils",
+    "write_zarr": ".general_utils",
+    "IngestionLedger": ".ledger_utils",
+    "groupby_region": ".grouping_utils",
+    "groupby_time": ".grouping_utils",
+    "latitude_weights": ".grouping_utils",
+    "detect_in_time": ".grouping_utils",
+    "plot_by_region": ".plotting_utils",
+    "finer_grid_cache": ".regrid_utils",
+    "dask_remote": ".remote",
+    "start_remote": ".remote",
+    "cdsapi_secret": ".secrets",
+    "ecmwf_secret": ".secrets",
+    "gap_secret": ".secrets",
+    "salient_secret": ".secrets",
+    "tahmo_secret": ".secrets",
+    "huggingface_read_token": ".secrets",
+    "get_grid_ds": ".space_utils",
+    "get_globe_slice": ".space_utils",
+    "get_grid": ".space_utils",
+    "is_wrapped": ".space_utils",
+    "lon_base_change": ".space_utils",
+    "snap_point_to_grid": ".space_utils",
+    "base180_to_base360": ".space_utils",
+    "base360_to_base180": ".space_utils",
+    "check_bases": ".space_utils",
+    "add_spatial_attrs": ".space_utils",
+    "check_spatial_attr": ".space_utils",
+    "is_station_grid": ".space_utils",
+    "nearest_grid_index": ".space_utils",
+    "extract_at_stations": ".space_utils",
+    "first_satisfied_date": ".task_utils",
+    "span": ".trace_utils",
+    "to_chrome_trace": ".trace_utils",
+    "trace_call": ".trace_utils",
+    "traced": ".trace_utils",
+    "add_dayofyear": ".time_utils",
+    "assign_grouping_coordinates": ".time_utils",
+    "convert_group_to_time": ".time_utils",
+    "date_mean": ".time_utils",
+    "doy_mean": ".time_utils",
+    "generate_dates_in_between": ".time_utils",
+    "get_dates": ".time_utils",
+    "is_valid_forecast_date": ".time_utils",
+    "pad_with_leapdays": ".time_utils",
+    "shift_by_days": ".time_utils",
+})
 
 # Use __all__ to define what is part of the public API.
 __all__ = [
@@ -47,6 +88,13 @@ __all__ = [
     "roll_and_agg",
     "get_anomalies",
     "regrid",
+    "finer_grid_cache",
+    "StagedDownloader",
+    "download_url",
+    "get_session",
+    "list_directory",
+    "run_concurrently",
+    "IngestionLedger",
     "load_netcdf",
     "load_zarr",
     "write_zarr",
@@ -80,10 +128,22 @@ __all__ = [
     "get_variable",
     "convert_init_time_to_pred_time",
     "convert_pred_time_to_init_time",
+    "select_pred_time",
     "first_satisfied_date",
     "add_spatial_attrs",
     "check_spatial_attr",
     "is_station_grid",
+    "nearest_grid_index",
+    "extract_at_stations",
     "densify_fcst",
-    "detect_in_time"
+    "detect_in_time",
+    "plan_chunks",
+    "span",
+    "trace_call",
+    "traced",
+    "to_chrome_trace",
+    "check_graph",
+    "graph_limits",
+    "graph_stats",
+    "GraphTooLargeError",
 ]
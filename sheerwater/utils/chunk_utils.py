@@ -0,0 +1,86 @@
+"""Chunk planning for xarray datasets.
+
+Rather than hard-coding chunk sizes for each grid and ensemble size, callers describe
+how the data will be accessed and get chunks of roughly a target size in memory.
+"""
+import math
+
+import numpy as np
+import xarray as xr
+
+# Default target size of a chunk, in MB
+DEFAULT_CHUNK_MB = 100
+
+TIME_DIMS = ('time', 'init_time', 'dayofyear', 'model_issuance_date', 'start_date')
+SPACE_DIMS = ('lat', 'lon', 'region')
+
+
+def _fill(dims, sizes, budget, chunks):
+    """Give the dims as large chunks as fit in the budget, split evenly between them.
+
+    Returns the budget left over for other dims.
+    """
+    total = math.prod(sizes[d] for d in dims)
+    if total <= budget:
+        for d in dims:
+            chunks[d] = sizes[d]
+        return budget // max(total, 1)
+
+    # Smaller dims are taken whole first, so the larger ones get the rest of the budget
+    remaining = len(dims)
+    for d in sorted(dims, key=lambda d: sizes[d]):
+        side = max(int(budget ** (1 / remaining)), 1)
+        chunks[d] = min(sizes[d], side)
+        budget = max(budget // chunks[d], 1)
+        remaining -= 1
+    return 1
+
+
+def plan_chunks(ds, dtype=None, target_mb=DEFAULT_CHUNK_MB, access='timeseries', full_dims=None):
+    """Plan chunk sizes of roughly target_mb for a dataset.
+
+    Args:
+        ds (xr.Dataset, xr.DataArray or dict): The dataset or array to chunk, or a dict of dimension sizes.
+        dtype (str or np.dtype): The dtype of the data. Defaults to the largest dtype of the dataset,
+            or float32 for a dict of sizes.
+        target_mb (float): The target chunk size in MB.
+        access (str): How the data will be accessed downstream. One of:
+            - timeseries: long time series over small spatial tiles, e.g. for events and time reductions
+            - spatial: whole spatial fields over few times, e.g. for maps and spatial aggregation
+        full_dims (list): Dimensions always kept in a single chunk, e.g. member for ensemble statistics.
+
+    Returns:
+        dict: The chunk size of every dimension.
+    """
+    if isinstance(ds, xr.Dataset):
+        sizes = dict(ds.sizes)
+        if dtype is None and len(ds.data_vars) > 0:
+            dtype = max((ds[var].dtype for var in ds.data_vars), key=lambda d: d.itemsize)
+    elif isinstance(ds, xr.DataArray):
+        sizes = dict(ds.sizes)
+        dtype = ds.dtype if dtype is None else dtype
+    else:
+        sizes = dict(ds)
+    itemsize = np.dtype(dtype if dtype is not None else 'float32').itemsize
+    budget = max(int(target_mb * 2**20) // itemsize, 1)
+
+    chunks = {}
+    for d in full_dims or []:
+        if d in sizes:
+            chunks[d] = sizes[d]
+            budget = max(budget // max(sizes[d], 1), 1)
+
+    time_dims = [d for d in sizes if d in TIME_DIMS and d not in chunks]
+    space_dims = [d for d in sizes if d in SPACE_DIMS and d not in chunks]
+    other_dims = [d for d in sizes if d not in chunks and d not in time_dims and d not in space_dims]
+    if access == 'timeseries':
+        order = [time_dims, space_dims, other_dims]
+    elif access == 'spatial':
+        order = [space_dims, time_dims, other_dims]
+    else:
+        raise ValueError(f"Unsupported access pattern: {access}")
+
+    for dims in order:
+        if len(dims) > 0:
+            budget = _fill(dims, sizes, budget, chunks)
+    return chunks
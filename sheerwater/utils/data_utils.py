@@ -3,13 +3,12 @@
 These utility functions take as input an xarray dataset and return a modified
 dataset.
 """
-import dask
 import warnings
 import numpy as np
-import xarray_regrid  # noqa: F401, import needed for regridding
 
+from .climatology_utils import doy_lookup
 from .space_utils import get_grid_ds
-from .time_utils import add_dayofyear, get_dates
+from .time_utils import get_dates
 
 
 def roll_and_agg(ds, agg, agg_col, agg_fn="mean", align="left", stride=None, agg_thresh=None):
@@ -100,20 +99,32 @@ def regrid(ds, output_grid, method='conservative', base="base180", output_chunks
             'linear', 'nearest', 'cubic', 'conservative', 'most_common'.
         base (str): The base of the longitudes. One of 'base180', 'base360'.
         output_chunks (dict): Chunks for the output dataset (optional).
-            Only used for conservative regridding.
+            Only used for conservative regridding, which reuses cached weights, or coarsens the
+            dataset directly when the output grid nests within its grid.
         region (str): The region to clip the data to.
         regridder_kwargs (dict): Additional keyword arguments for the regridder.
     """
+    # Imported here so that the other data utilities don't pull in the regridding dependencies
+    import xarray_regrid  # noqa: F401, import needed for regridding
+    from .regrid_utils import cached_conservative_regrid, can_coarsen, coarsen_regrid
+
     # Interpret the grid
     ds_out = get_grid_ds(output_grid, base=base)
     if region != 'global':
         from sheerwater.spatial_subdivisions import clip_region
         ds_out = clip_region(ds_out, region=region, grid=output_grid)
-    # Output chunks only for conservative regridding
-    kwargs = {'output_chunks': output_chunks} if method == 'conservative' else {}
-    kwargs.update(regridder_kwargs)
+    if method == 'conservative' and not regridder_kwargs and can_coarsen(ds, ds_out):
+        # Grids that nest within the source grid are derived by area weighted coarsening
+        ds = coarsen_regrid(ds, ds_out)
+        if output_chunks:
+            ds = ds.chunk({dim: size for dim, size in output_chunks.items() if dim in ds.dims})
+        return ds
+    if method == 'conservative':
+        # Conservative weights are cached per source grid, so they are reused across years and variables
+        return cached_conservative_regrid(ds, ds_out, target_grid=f"{output_grid}_{base}_{region}",
+                                          output_chunks=output_chunks, **regridder_kwargs)
     regridder = getattr(ds.regrid, method)
-    ds = regridder(ds_out, **kwargs)
+    ds = regridder(ds_out, **regridder_kwargs)
     return ds
 
 
@@ -130,14 +141,8 @@ def get_anomalies(ds, clim, var, time_dim='time'):
         var (str): Variable to calculate anomalies for.
         time_dim (str): The name of the time dimension.
     """
-    # Create a day of year timeseries
-    ds = add_dayofyear(ds, time_dim=time_dim)
-    with dask.config.set(**{'array.slicing.split_large_chunks': True}):
-        clim_ds = clim.sel(dayofyear=ds.dayofyear)
-        clim_ds = clim_ds.drop('dayofyear')
-
-    # Drop day of year coordinates
-    ds = ds.drop('dayofyear')
+    # Gather the climatology for the day of year of each time
+    clim_ds = doy_lookup(clim, ds[time_dim].values, time_dim=time_dim)
 
     # Ensure that the climatology and dataset have the same dimensions
     if not all([dim in ds.dims for dim in clim_ds.dims]):
@@ -0,0 +1,265 @@
+"""Download utility functions for fetching remote files over HTTP.
+
+These helpers share a pooled requests session across threads and retry transient
+failures with jittered exponential backoff, so that bulk downloads don't overwhelm
+upstream servers.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes that indicate a transient failure worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Directory listings fetched by list_directory, keyed by url: (fetch time, filenames)
+LISTING_TTL = 3600
+_listing_cache = {}
+_listing_lock = threading.Lock()
+
+
+def get_session(pool_size=10, adapter=None, auth=None, headers=None):
+    """Create a requests session with a connection pool sized for concurrent use.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+        adapter (requests.adapters.HTTPAdapter): A custom transport adapter to mount. If None,
+            a standard HTTPAdapter is created with the requested pool size.
+        auth (tuple): Optional (username, password) for basic authentication.
+        headers (dict): Optional headers to send with every request.
+    """
+    session = requests.Session()
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if auth is not None:
+        session.auth = auth
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def backoff_delay(attempt, backoff=1.0, max_delay=60.0):
+    """Exponential backoff with full jitter for the given (zero-indexed) attempt."""
+    return random.uniform(0, min(max_delay, backoff * 2 ** attempt))
+
+
+def download_url(session, url, retry=3, backoff=1.0, timeout=600, **kwargs):
+    """GET a URL, retrying timeouts, connection errors and transient status codes.
+
+    Args:
+        session (requests.Session): The session to issue the request with.
+        url (str): The URL to fetch.
+        retry (int): Total number of attempts.
+        backoff (float): Base backoff in seconds, doubled on each attempt and jittered.
+        timeout (float): Request timeout in seconds.
+        kwargs: Additional keyword arguments passed to session.get.
+
+    Returns:
+        The requests.Response of the first non-transient attempt. Responses with non-transient
+        error codes (e.g. 404) are returned for the caller to handle.
+    """
+    for attempt in range(retry):
+        try:
+            r = session.get(url, timeout=timeout, **kwargs)
+            if r.status_code not in RETRY_STATUS_CODES:
+                return r
+            error = requests.exceptions.HTTPError(f"Status {r.status_code} from {url}", response=r)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = e
+
+        if attempt == retry - 1:
+            raise error
+        delay = backoff_delay(attempt, backoff)
+        logger.info(f"Request to {url} failed ({error}). Retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+
+class StagedDownloader:
+    """Download files concurrently into a local staging directory over a shared session.
+
+    Downloads are written to a '.part' file and renamed when complete. If a download is
+    interrupted, the next attempt resumes the partial file with an HTTP range request.
+    The session is injected, so any authenticated requests session can be reused across
+    all downloads.
+
+    Args:
+        session (requests.Session): The session to download with.
+        staging_dir (str): The local directory to download into.
+        max_workers (int): Maximum number of concurrent downloads in fetch_all.
+        retry (int): Number of attempts per file.
+        backoff (float): Base backoff in seconds between attempts.
+        timeout (float): Request timeout in seconds.
+        chunk_size (int): Number of bytes to write at a time.
+        content_type (str): If set, responses with any other Content-Type are rejected.
+
+    Attributes:
+        stats (dict): Latency in seconds and size in bytes of each completed download, by filename.
+    """
+
+    def __init__(self, session, staging_dir, max_workers=4, retry=3, backoff=1.0, timeout=600,
+                 chunk_size=8*1024*1024, content_type=None):
+        """Initialize the downloader and create the staging directory."""
+        self.session = session
+        self.staging_dir = staging_dir
+        self.max_workers = max_workers
+        self.retry = retry
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.content_type = content_type
+        self.stats = {}
+        os.makedirs(staging_dir, exist_ok=True)
+
+    def fetch(self, url, filename=None):
+        """Download a single file, resuming any partial download, and return its local path."""
+        if filename is None:
+            filename = unquote(url.split('?')[0].split('/')[-1])
+        path = os.path.join(self.staging_dir, filename)
+        if os.path.exists(path):
+            return path
+
+        partial = path + '.part'
+        start = time.monotonic()
+        for attempt in range(self.retry):
+            offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                r = download_url(self.session, url, retry=self.retry, backoff=self.backoff, timeout=self.timeout,
+                                 headers=headers, stream=True)
+                with r:
+                    # The partial file already holds the whole file
+                    if r.status_code == 416 and offset:
+                        break
+                    r.raise_for_status()
+                    if self.content_type is not None and r.headers.get('Content-Type') != self.content_type:
+                        raise ValueError(f"Unexpected content type {r.headers.get('Content-Type')} from {url}.")
+                    # Servers that ignore the range send the whole file again
+                    mode = 'ab' if r.status_code == 206 else 'wb'
+                    with open(partial, mode) as f:
+                        for chunk in r.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                break
+            except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                if attempt == self.retry - 1:
+                    raise
+                delay = backoff_delay(attempt, self.backoff)
+                logger.info(f"Download of {url} interrupted ({e}). Resuming in {delay:.1f}s...")
+                time.sleep(delay)
+
+        os.replace(partial, path)
+        self.stats[filename] = {'seconds': time.monotonic() - start, 'bytes': os.path.getsize(path)}
+        logger.info(f"Downloaded {filename} ({self.stats[filename]['bytes'] / 1024:.2f} KB) "
+                    f"in {self.stats[filename]['seconds']:.2f}s.")
+        return path
+
+    def fetch_all(self, urls, filenames=None):
+        """Download many files concurrently. Returns local paths in order, raising the first failed download."""
+        if filenames is None:
+            filenames = [None] * len(urls)
+        return run_concurrently(lambda args: self.fetch(*args), list(zip(urls, filenames)),
+                                max_workers=self.max_workers)
+
+
+def run_concurrently(func, iterable, max_workers=8, skip_errors=False):
+    """Run a function over an iterable in a bounded thread pool.
+
+    Args:
+        func (callable): A function to call. Must take one of iterable as an argument.
+        iterable (iterable): Any iterable object to pass to func.
+        max_workers (int): Maximum number of concurrent calls.
+        skip_errors (bool): If True, any item that raises is logged and returns None, so one bad item
+            doesn't sink a whole batch. Otherwise the first error is raised once the pool is shut down.
+
+    Returns:
+        A list of results in the same order as iterable.
+    """
+    items = list(iterable)
+
+    def call(item):
+        try:
+            return func(item)
+        except Exception as e:
+            logger.warning(f"Failed to run {getattr(func, '__name__', func)} on {item}: {e}")
+            if not skip_errors:
+                raise
+            return None
+
+    if max_workers <= 1:
+        return [call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(call, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def parse_directory_listing(html):
+    """Parse the file names linked from an HTML directory index page.
+
+    Subdirectories, parent links and query links (e.g. column sorting) are skipped.
+    """
+    names = set()
+    for href in re.findall(r'href\s*=\s*["\']([^"\'#]+)["\']', html, flags=re.IGNORECASE):
+        if '?' in href or href.endswith('/'):
+            continue
+        name = unquote(href.split('/')[-1])
+        if name and name not in ('.', '..'):
+            names.add(name)
+    return sorted(names)
+
+
+def list_directory(url, pattern=None, ttl=LISTING_TTL, session=None, retry=3, timeout=60):
+    """List the files in a remote HTTP directory from its index page.
+
+    Listings are cached in memory for ttl seconds, so callers can look up many files in the
+    same directory with a single request. A missing directory lists as empty.
+
+    Args:
+        url (str): The URL of the directory.
+        pattern (str): Optional regular expression the file names must fully match.
+        ttl (float): Seconds a cached listing stays valid. Set to 0 to force a refresh.
+        session (requests.Session): Session to reuse. If None, a new session is created.
+        retry (int): Number of attempts to fetch the listing.
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        A sorted list of file names in the directory.
+    """
+    if not url.endswith('/'):
+        url += '/'
+
+    with _listing_lock:
+        entry = _listing_cache.get(url)
+    if entry is None or time.monotonic() - entry[0] > ttl:
+        if session is None:
+            session = get_session(pool_size=1)
+        r = download_url(session, url, retry=retry, timeout=timeout)
+        if r.status_code == 404:
+            names = []
+        else:
+            r.raise_for_status()
+            names = parse_directory_listing(r.text)
+        with _listing_lock:
+            _listing_cache[url] = (time.monotonic(), names)
+    else:
+        names = entry[1]
+
+    if pattern is not None:
+        names = [name for name in names if re.fullmatch(pattern, name)]
+    return names
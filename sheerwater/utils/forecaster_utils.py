@@ -1,6 +1,7 @@
 # ruff: noqa: E501
 
 """Variable-related utility functions for all parts of the data pipeline."""
+import numpy as np
 import xarray as xr
 
 
@@ -28,6 +29,29 @@ def convert_pred_time_to_init_time(ds, time_dim='time',
     return ds
 
 
+def select_pred_time(ds, init_times, lead_times, time_dim='time', lead_time_dim='prediction_timedelta'):
+    """Select the part of a forecast stored in valid time layout that was issued at the given init times.
+
+    The result matches converting the forecast for those init times with convert_init_time_to_pred_time,
+    so a store of the whole forecast can stand in for the conversion of any subset of it.
+
+    Args:
+        ds (xr.Dataset): The forecast, indexed by valid time and prediction timedelta.
+        init_times (array-like): The init times to keep.
+        lead_times (array-like): The prediction timedeltas to keep.
+        time_dim (str): The valid time dimension.
+        lead_time_dim (str): The prediction timedelta dimension.
+    """
+    init_times = np.asarray(init_times)
+    lead_times = np.asarray(lead_times)
+    valid_times = np.unique((init_times[:, None] + lead_times[None, :]).ravel())
+    ds = ds.sel({time_dim: valid_times, lead_time_dim: lead_times})
+    # Values issued at other init times would be missing from the conversion
+    issued = np.isin((ds[time_dim] - ds[lead_time_dim]).values, init_times)
+    issued = xr.DataArray(issued, dims=ds[time_dim].dims + ds[lead_time_dim].dims)
+    return ds.where(issued)
+
+
 def densify_fcst(fcst, start_time=None, end_time=None):
     """Densify the forecast."""
     if not isinstance(fcst, xr.Dataset):
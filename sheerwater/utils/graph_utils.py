@@ -0,0 +1,183 @@
+"""Size checks of dask graphs before they are computed.
+
+Some metric configurations build graphs with hundreds of thousands of tasks, for example with one
+chunk per day, and the scheduler stalls before any work starts. check_graph reports the number of
+tasks and layers in a graph and an estimate of the bytes moved between chunks, and warns or raises
+when they are above the limits, listing the layers responsible so the chunking can be fixed.
+
+The limits are resolved, in order, from the arguments of check_graph, an enclosing graph_limits
+context, the SHEERWATER_GRAPH_MAX_TASKS, SHEERWATER_GRAPH_MAX_TRANSFER_MB and SHEERWATER_GRAPH_ON_EXCEED
+environment variables and the defaults below.
+"""
+import contextvars
+import logging
+import math
+import os
+import warnings
+from contextlib import contextmanager
+
+import dask
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default limits above which a graph is reported
+DEFAULT_MAX_TASKS = 200_000
+DEFAULT_MAX_TRANSFER_MB = 100_000
+# What to do when a graph is above the limits. One of 'warn', 'raise' or 'ignore'
+DEFAULT_ON_EXCEED = 'warn'
+
+MAX_TASKS_ENV = 'SHEERWATER_GRAPH_MAX_TASKS'
+MAX_TRANSFER_MB_ENV = 'SHEERWATER_GRAPH_MAX_TRANSFER_MB'
+ON_EXCEED_ENV = 'SHEERWATER_GRAPH_ON_EXCEED'
+
+# Number of layers listed when a graph is above the limits
+N_REPORTED_LAYERS = 10
+
+# Limits set by the enclosing graph_limits context, if any
+_LIMITS = contextvars.ContextVar('sheerwater_graph_limits', default={})
+
+
+class GraphTooLargeError(RuntimeError):
+    """Raised when a dask graph is above the configured size limits."""
+    pass
+
+
+@contextmanager
+def graph_limits(max_tasks=None, max_transfer_mb=None, on_exceed=None):
+    """Set the graph size limits for the checks made inside the context.
+
+    Args:
+        max_tasks (int): The maximum number of tasks in a graph.
+        max_transfer_mb (float): The maximum estimated transfer between chunks, in MB.
+        on_exceed (str): What to do above the limits. One of 'warn', 'raise' or 'ignore'.
+    """
+    limits = dict(_LIMITS.get())
+    limits.update({k: v for k, v in [('max_tasks', max_tasks), ('max_transfer_mb', max_transfer_mb),
+                                     ('on_exceed', on_exceed)] if v is not None})
+    token = _LIMITS.set(limits)
+    try:
+        yield
+    finally:
+        _LIMITS.reset(token)
+
+
+def _resolve_limit(name, value, env, default, cast):
+    """Resolve a limit from the argument, the graph_limits context, the environment and the default."""
+    if value is not None:
+        return value
+    if name in _LIMITS.get():
+        return _LIMITS.get()[name]
+    if env in os.environ:
+        return cast(os.environ[env])
+    return default
+
+
+def _layer_nbytes(layer):
+    """The bytes of the array output by a layer, from its collection annotations, or 0 if unknown."""
+    annotations = getattr(layer, 'collection_annotations', None) or {}
+    shape, dtype = annotations.get('shape'), annotations.get('dtype')
+    if shape is None or dtype is None or any(isinstance(s, float) and math.isnan(s) for s in shape):
+        return 0
+    return math.prod(shape) * np.dtype(dtype).itemsize
+
+
+def _layer_chunks(layer):
+    """The chunks of the array output by a layer, from its collection annotations, or None if unknown."""
+    annotations = getattr(layer, 'collection_annotations', None) or {}
+    return annotations.get('chunks')
+
+
+def graph_stats(*collections):
+    """Size statistics of the dask graphs of the collections, skipping anything that is not lazy.
+
+    The transfer is estimated per layer as the bytes of the layers it depends on that are chunked
+    differently from it, e.g. for rechunks, reductions and concatenations. Blockwise layers on the same
+    chunks are assumed to run where their inputs are. Layers whose output is not an array with known
+    shape count as no transfer.
+
+    Returns:
+        dict: The number of tasks, layers and estimated transfer bytes of the graph, and the same
+            for each layer, ordered by decreasing number of tasks.
+    """
+    layers = {}
+    for collection in collections:
+        if isinstance(collection, dict):
+            sub = graph_stats(*collection.values())
+            for layer in sub['layers']:
+                layers.setdefault(layer['name'], layer)
+            continue
+        if collection is None or not dask.is_dask_collection(collection):
+            continue
+        graph = collection.__dask_graph__()
+        if not hasattr(graph, 'layers'):
+            name = f"graph-{id(graph)}"
+            layers.setdefault(name, {'name': name, 'n_tasks': len(graph), 'transfer_bytes': 0})
+            continue
+        for name, layer in graph.layers.items():
+            if name in layers:
+                continue
+            chunks = _layer_chunks(layer)
+            transfer = 0
+            for dep in graph.dependencies.get(name, set()):
+                dep_layer = graph.layers.get(dep)
+                if dep_layer is not None and chunks is not None and _layer_chunks(dep_layer) != chunks:
+                    transfer += _layer_nbytes(dep_layer)
+            layers[name] = {'name': name, 'n_tasks': len(layer), 'transfer_bytes': transfer}
+
+    ordered = sorted(layers.values(), key=lambda layer: layer['n_tasks'], reverse=True)
+    return {
+        'n_tasks': sum(layer['n_tasks'] for layer in ordered),
+        'n_layers': len(ordered),
+        'transfer_bytes': sum(layer['transfer_bytes'] for layer in ordered),
+        'layers': ordered,
+    }
+
+
+def check_graph(collection, name='graph', max_tasks=None, max_transfer_mb=None, on_exceed=None):
+    """Report the size of the dask graph of a collection before it is computed.
+
+    Args:
+        collection: The lazy result, e.g. an xarray dataset, or a dict of them.
+        name (str): The name of the result, used in the report.
+        max_tasks (int): The maximum number of tasks in the graph.
+        max_transfer_mb (float): The maximum estimated transfer between chunks, in MB.
+        on_exceed (str): What to do above the limits. One of 'warn', 'raise' or 'ignore'.
+
+    Returns:
+        dict: The graph statistics, as returned by graph_stats.
+
+    Raises:
+        GraphTooLargeError: If the graph is above the limits and on_exceed is 'raise'.
+    """
+    max_tasks = _resolve_limit('max_tasks', max_tasks, MAX_TASKS_ENV, DEFAULT_MAX_TASKS, int)
+    max_transfer_mb = _resolve_limit('max_transfer_mb', max_transfer_mb, MAX_TRANSFER_MB_ENV,
+                                     DEFAULT_MAX_TRANSFER_MB, float)
+    on_exceed = _resolve_limit('on_exceed', on_exceed, ON_EXCEED_ENV, DEFAULT_ON_EXCEED, str)
+    if on_exceed not in ['warn', 'raise', 'ignore']:
+        raise ValueError(f"Unsupported on_exceed {on_exceed}. Must be one of 'warn', 'raise' or 'ignore'.")
+
+    stats = graph_stats(collection)
+    transfer_mb = stats['transfer_bytes'] / 2**20
+    logger.info(f"Graph of {name}: {stats['n_tasks']} tasks in {stats['n_layers']} layers, "
+                f"estimated transfer {transfer_mb:.1f} MB.")
+
+    exceeded = []
+    if stats['n_tasks'] > max_tasks:
+        exceeded.append(f"{stats['n_tasks']} tasks > {max_tasks}")
+    if transfer_mb > max_transfer_mb:
+        exceeded.append(f"estimated transfer {transfer_mb:.1f} MB > {max_transfer_mb} MB")
+    if len(exceeded) == 0 or on_exceed == 'ignore':
+        return stats
+
+    by_tasks = stats['layers'][:N_REPORTED_LAYERS]
+    by_transfer = sorted((layer for layer in stats['layers'] if layer['transfer_bytes'] > 0),
+                         key=lambda layer: layer['transfer_bytes'], reverse=True)[:N_REPORTED_LAYERS]
+    lines = [f"  {layer['name']}: {layer['n_tasks']} tasks" for layer in by_tasks]
+    lines += [f"  {layer['name']}: {layer['transfer_bytes'] / 2**20:.1f} MB transfer" for layer in by_transfer]
+    message = (f"The graph of {name} is above the size limits ({', '.join(exceeded)}). "
+               f"Consider larger chunks for these layers:\n" + '\n'.join(lines))
+    if on_exceed == 'raise':
+        raise GraphTooLargeError(message)
+    warnings.warn(message)
+    return stats
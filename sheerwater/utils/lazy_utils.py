@@ -0,0 +1,60 @@
+"""Lazy exports for packages that re-export the functions of their modules.
+
+Importing all of the modules eagerly pulls in the dependencies of every one of them, e.g. earthaccess or
+the CDS client for the sources, or geopandas and matplotlib for the utilities, so the packages instead
+import a module the first time one of its functions is accessed.
+"""
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class LazyPackage(types.ModuleType):
+    """A package whose exported functions are imported from their modules on first access.
+
+    Many modules share their name with the function they export, e.g. sheerwater.data.chirps. Importing
+    such a module binds it as an attribute of the package, so binding a module to an exported name binds
+    the function of that module instead, as an eager `from .chirps import chirps` would.
+    """
+
+    def _export_module(self, name):
+        """The absolute name of the module exporting name, or None if name is not exported."""
+        exports = self.__dict__.get('_EXPORTS', {})
+        if name not in exports:
+            return None
+        return importlib.util.resolve_name(exports[name], self.__name__)
+
+    def __getattr__(self, name):
+        """Import the module of an exported function and return the function."""
+        module_name = self._export_module(name)
+        if module_name is None:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module_name), name)
+        types.ModuleType.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        """Bind exported functions over the modules of the same name."""
+        if isinstance(value, types.ModuleType) and value.__name__ == self._export_module(name):
+            value = getattr(value, name)
+        types.ModuleType.__setattr__(self, name, value)
+
+    def __dir__(self):
+        """List the exported functions along with the attributes already bound."""
+        return sorted(set(self.__dict__) | set(self.__dict__.get('_EXPORTS', {})))
+
+
+def lazy_exports(package_name, exports):
+    """Make a package import the modules of its exported functions on first access.
+
+    Call from the package's __init__ in place of importing the functions.
+
+    Args:
+        package_name (str): The name of the package, i.e. __name__ in its __init__.
+        exports (dict): The module exporting each function, relative to the package, e.g.
+            {'chirps': '.chirps'}.
+    """
+    package = sys.modules[package_name]
+    package._EXPORTS = dict(exports)
+    package.__class__ = LazyPackage
@@ -0,0 +1,256 @@
+"""An ingestion ledger recording which dates of a data source have been fetched.
+
+Each source gets a small SQLite table with one row per date: its status, the
+location of the fetched data, its size in bytes, a checksum and when it was
+last recorded. Ingestion loops ask the ledger for the dates that are missing
+or stale and fetch only those, and already good dates are served from the
+ledger after a single listing of where they were recorded.
+
+The ledger only decides which dates to skip. When nuthatch is recomputing the
+cached functions a fetch calls, or overwriting caches, every date is fetched so
+the cache settings still reach the upstream caches.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import fsspec
+import nuthatch.nuthatch as nuthatch_core
+import pandas as pd
+
+from .download_utils import run_concurrently
+
+# Statuses a date can have in the ledger
+OK = 'ok'
+MISSING = 'missing'
+FAILED = 'failed'
+STALE = 'stale'
+
+LEDGER_DIR = os.path.join(os.path.expanduser('~'), '.sheerwater', 'ledgers')
+
+
+def describe_path(path):
+    """Get the size in bytes and a checksum of a local or remote file or directory.
+
+    The checksum is computed from the file listing (names, sizes and etags or modification
+    times), so nothing is downloaded.
+    """
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    files = fs.find(fs_path, detail=True)
+    if not files:
+        raise FileNotFoundError(path)
+
+    digest = hashlib.md5()
+    nbytes = 0
+    for name in sorted(files):
+        info = files[name]
+        size = info.get('size') or 0
+        nbytes += size
+        version = info.get('etag') or info.get('md5Hash') or info.get('mtime') or info.get('updated') or ''
+        digest.update(f"{os.path.relpath(name, fs_path)}:{size}:{version};".encode())
+    return nbytes, digest.hexdigest()
+
+
+def existing_locations(locations):
+    """Get the locations that exist, listing each parent directory once rather than checking each location."""
+    parents = {}
+    for location in set(locations):
+        fs, fs_path = fsspec.core.url_to_fs(location)
+        fs_path = fs_path.rstrip('/')
+        parents.setdefault((fs, os.path.dirname(fs_path)), {})[fs_path] = location
+
+    existing = set()
+    for (fs, parent), paths in parents.items():
+        try:
+            listed = {name.rstrip('/') for name in fs.ls(parent, detail=False)}
+        except FileNotFoundError:
+            continue
+        existing.update(location for path, location in paths.items() if path in listed)
+    return existing
+
+
+def refreshing_caches(functions=None):
+    """Whether the running cached call recomputes or overwrites the caches of the given functions.
+
+    Args:
+        functions (list): Names of the cached functions to check. If None, recomputing any
+            function counts.
+    """
+    if nuthatch_core.global_cache_mode in ('overwrite', 'local_overwrite'):
+        return True
+    recompute = nuthatch_core.global_recompute
+    if recompute == '_all':
+        return True
+    if isinstance(recompute, list) and len(recompute) > 0:
+        return functions is None or any(fn in recompute for fn in functions)
+    return False
+
+
+def _key(date):
+    """Normalize a date to the ledger key."""
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+
+class IngestionLedger:
+    """A per-source ledger of ingested dates, stored in SQLite.
+
+    Args:
+        source (str): The name of the data source, e.g. 'rain_over_africa'.
+        path (str): The SQLite file to store the ledger in. Defaults to <LEDGER_DIR>/<source>.sqlite.
+    """
+
+    def __init__(self, source, path=None):
+        """Open the ledger, creating its table if needed."""
+        self.source = source
+        if path is None:
+            os.makedirs(LEDGER_DIR, exist_ok=True)
+            path = os.path.join(LEDGER_DIR, f'{source}.sqlite')
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS ledger (
+                date TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                location TEXT,
+                bytes INTEGER,
+                checksum TEXT,
+                timestamp REAL NOT NULL
+            )""")
+
+    def record(self, date, status, location=None, nbytes=None, checksum=None):
+        """Record the outcome of fetching a date."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+                               (_key(date), status, location, nbytes, checksum, time.time()))
+
+    def entries(self, dates=None):
+        """Get the ledger rows as a dataframe, optionally limited to the given dates."""
+        with self._lock:
+            df = pd.read_sql_query("SELECT * FROM ledger ORDER BY date", self._conn)
+        if dates is not None:
+            df = df[df['date'].isin([_key(d) for d in dates])]
+        return df.set_index('date')
+
+    def pending(self, dates, max_age=None, retry_missing=True, check_exists=True):
+        """Get the dates that need to be fetched.
+
+        Args:
+            dates (list): The dates of interest.
+            max_age (float): Dates recorded longer ago than this many seconds are stale and pending.
+            retry_missing (bool): Whether dates recorded as missing at the source are pending.
+            check_exists (bool): Whether good dates whose recorded location no longer exists are pending.
+                The ledger is local to the machine while the data is usually in a shared cache, so the
+                data may have been deleted since it was recorded.
+
+        Returns:
+            A list of the pending dates, as ledger keys, in the order given.
+        """
+        entries = self.entries(dates)
+        if check_exists:
+            good = entries[entries['status'] == OK]
+            existing = existing_locations(good['location'].dropna())
+        now = time.time()
+        pending = []
+        for date in dates:
+            key = _key(date)
+            if key not in entries.index:
+                pending.append(key)
+                continue
+            row = entries.loc[key]
+            if row['status'] == MISSING and not retry_missing:
+                continue
+            if row['status'] != OK or (max_age is not None and now - row['timestamp'] > max_age):
+                pending.append(key)
+            elif check_exists and row['location'] not in existing:
+                pending.append(key)
+        return pending
+
+    def run(self, dates, fetch, max_workers=8, max_age=None, retry_missing=True, describe=describe_path,
+            functions=None):
+        """Fetch the pending dates and return the data location of every date.
+
+        Args:
+            dates (list): The dates to ingest.
+            fetch (callable): Fetches a single date, passed as given in dates, and returns the location
+                of the fetched data, or None if the source has no data for that date.
+            max_workers (int): Maximum number of dates to fetch at once.
+            max_age (float): Refetch dates recorded longer ago than this many seconds.
+            retry_missing (bool): Whether to retry dates that were missing at the source.
+            describe (callable): Returns (bytes, checksum) for a location. If None, neither is recorded.
+            functions (list): Names of the cached functions fetch calls. If nuthatch is recomputing any
+                of them, or overwriting caches, every date is fetched rather than only the pending ones.
+
+        Returns:
+            A list with the location of each date, or None where no data is available, in the order given.
+
+        Raises:
+            RuntimeError: If any date failed to fetch. Every pending date is attempted first and the
+                failures are recorded, so the next run retries only those.
+        """
+        if refreshing_caches(functions):
+            pending = list(dates)
+        else:
+            pending = set(self.pending(dates, max_age=max_age, retry_missing=retry_missing))
+            pending = [date for date in dates if _key(date) in pending]
+
+        def ingest(date):
+            try:
+                location = fetch(date)
+            except Exception as e:
+                self.record(date, FAILED)
+                raise e
+            if location is None:
+                self.record(date, MISSING)
+                return
+            nbytes, checksum = describe(location) if describe is not None else (None, None)
+            self.record(date, OK, location=location, nbytes=nbytes, checksum=checksum)
+
+        if len(pending) > 0:
+            print(f"Ingesting {len(pending)} of {len(dates)} dates for {self.source}.")
+        run_concurrently(ingest, pending, max_workers=max_workers, skip_errors=True)
+
+        entries = self.entries(dates)
+        failed = [_key(date) for date in dates if _key(date) in entries.index
+                  and entries.loc[_key(date), 'status'] == FAILED]
+        if len(failed) > 0:
+            raise RuntimeError(f"Failed to ingest {len(failed)} of {len(dates)} dates for {self.source}: "
+                               f"{', '.join(failed)}. Rerun to retry them.")
+
+        locations = []
+        for date in dates:
+            key = _key(date)
+            if key in entries.index and entries.loc[key, 'status'] == OK:
+                locations.append(entries.loc[key, 'location'])
+            else:
+                locations.append(None)
+        return locations
+
+    def revalidate(self, dates, describe=describe_path):
+        """Check that good dates still match what was recorded, without re-downloading anything.
+
+        Dates whose data has disappeared or whose checksum changed are marked stale, so the
+        next run refetches them.
+
+        Returns:
+            A list of the dates marked stale.
+        """
+        entries = self.entries(dates)
+        entries = entries[entries['status'] == OK]
+
+        def check(key):
+            row = entries.loc[key]
+            try:
+                nbytes, checksum = describe(row['location'])
+            except FileNotFoundError:
+                nbytes, checksum = None, None
+            # Dates recorded without a checksum only need to still exist
+            if checksum is None or (not pd.isna(row['checksum']) and checksum != row['checksum']):
+                self.record(key, STALE, location=row['location'], nbytes=nbytes, checksum=checksum)
+                return key
+            self.record(key, OK, location=row['location'], nbytes=nbytes, checksum=checksum)
+
+        stale = run_concurrently(check, list(entries.index))
+        return [key for key in stale if key is not None]
@@ -0,0 +1,245 @@
+"""Virtual reference indexes for collections of HDF5/netCDF4 files.
+
+A reference index maps every chunk of every variable in a set of files to a
+(url, byte offset, length) triple, in the kerchunk version 1 JSON format. The
+chunk layout of each file is scanned once, after which the whole collection
+can be opened as a single virtual zarr store that only reads the chunks it
+needs, without opening or reading metadata from every file.
+"""
+import base64
+import json
+
+import fsspec
+import h5py
+import numpy as np
+import xarray as xr
+
+from .download_utils import run_concurrently
+
+# HDF5 and netCDF4 bookkeeping attributes that shouldn't become zarr attributes
+_INTERNAL_ATTRS = {'DIMENSION_LIST', 'REFERENCE_LIST', 'CLASS', 'NAME', '_Netcdf4Dimid', '_Netcdf4Coordinates',
+                   '_nc3_strict', '_NCProperties', '_FillValue'}
+
+# Datasets smaller than this many bytes are inlined in the index rather than referenced
+INLINE_THRESHOLD = 500
+
+
+def _json_value(value):
+    """Convert an HDF5 attribute value to something JSON serializable."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, np.ndarray):
+        if value.size == 1:
+            return _json_value(value.reshape(-1)[0])
+        return [_json_value(v) for v in value.tolist()]
+    if isinstance(value, np.generic):
+        return _json_value(value.item())
+    if isinstance(value, float) and not np.isfinite(value):
+        # Zarr's JSON encoding of non-finite floats
+        return 'NaN' if np.isnan(value) else ('Infinity' if value > 0 else '-Infinity')
+    return value
+
+
+def _chunk_key(name, index):
+    """Get the zarr key of a chunk from its chunk indices."""
+    return f"{name}/{'.'.join(map(str, index)) or '0'}"
+
+
+def _dataset_dims(dset):
+    """Get the dimension names of an HDF5 dataset from its attached dimension scales."""
+    if h5py.h5ds.is_scale(dset.id):
+        return [dset.name.split('/')[-1]]
+    dims = []
+    for i, dim in enumerate(dset.dims):
+        if len(dim) > 0:
+            dims.append(dim[0].name.split('/')[-1])
+        else:
+            dims.append(f'phony_dim_{i}')
+    return dims
+
+
+def _dataset_codecs(dset):
+    """Map the HDF5 filter pipeline of a dataset to zarr filters and compressor."""
+    filters = []
+    compressor = None
+    if dset.shuffle:
+        filters.append({'id': 'shuffle', 'elementsize': dset.dtype.itemsize})
+    if dset.compression == 'gzip':
+        compressor = {'id': 'zlib', 'level': dset.compression_opts}
+    elif dset.compression is not None:
+        raise NotImplementedError(f"Compression {dset.compression} of {dset.name} is not supported.")
+    if dset.fletcher32:
+        filters.append({'id': 'fletcher32'})
+    return filters, compressor
+
+
+def _scan_dataset(dset, url):
+    """Scan the chunk layout of a single HDF5 dataset.
+
+    Returns:
+        A tuple of (metadata, chunks), where chunks maps a tuple of chunk indices to a reference.
+    """
+    filters, compressor = _dataset_codecs(dset)
+    # Only declare a fill value where the file does, so valid zeros aren't masked
+    fill_value = dset.attrs['_FillValue'] if '_FillValue' in dset.attrs else None
+    meta = {
+        'dims': _dataset_dims(dset),
+        'shape': list(dset.shape),
+        'chunks': list(dset.chunks or dset.shape),
+        'dtype': dset.dtype.str,
+        'fill_value': _json_value(fill_value),
+        'filters': filters or None,
+        'compressor': compressor,
+        'attrs': {k: _json_value(v) for k, v in dset.attrs.items() if k not in _INTERNAL_ATTRS},
+    }
+
+    chunks = {}
+    if dset.size == 0:
+        return meta, chunks
+    if dset.chunks is None:
+        offset = dset.id.get_offset()
+        if offset is not None:
+            nbytes = dset.id.get_storage_size()
+            if nbytes <= INLINE_THRESHOLD:
+                chunks[(0,) * dset.ndim] = 'base64:' + base64.b64encode(dset[...].tobytes()).decode()
+            else:
+                chunks[(0,) * dset.ndim] = [url, offset, nbytes]
+    else:
+        for i in range(dset.id.get_num_chunks()):
+            info = dset.id.get_chunk_info(i)
+            index = tuple(o // c for o, c in zip(info.chunk_offset, dset.chunks))
+            chunks[index] = [url, info.byte_offset, info.size]
+    return meta, chunks
+
+
+def _scan_file(url, fs, path, variables=None):
+    """Scan every numeric dataset in the root group of an HDF5 file, referencing chunks by url."""
+    scanned = {}
+    with fs.open(path, 'rb') as f, h5py.File(f, 'r') as h5:
+        attrs = {k: _json_value(v) for k, v in h5.attrs.items() if k not in _INTERNAL_ATTRS}
+        for name, dset in h5.items():
+            if not isinstance(dset, h5py.Dataset) or dset.dtype.kind not in 'biuf':
+                continue
+            if variables is not None and name not in variables and not h5py.h5ds.is_scale(dset.id):
+                continue
+            # netCDF4 stores dimensions without coordinate variables as empty scales
+            if 'This is a netCDF dimension but not a netCDF variable' in str(dset.attrs.get('NAME', b'')):
+                continue
+            scanned[name] = _scan_dataset(dset, url)
+    return attrs, scanned
+
+
+def build_reference_index(urls, concat_dim='time', variables=None, storage_options=None, max_workers=8):
+    """Build a virtual zarr reference index over a collection of HDF5/netCDF4 files.
+
+    Each file is scanned once for its chunk layout, max_workers files at a time. Variables
+    along concat_dim are concatenated across the files in the order given; all other
+    variables are taken from the first file.
+
+    Args:
+        urls (list): The file URLs or paths, in concatenation order.
+        concat_dim (str): The dimension to concatenate the files along.
+        variables (list): The variables to index. If None, all numeric variables are indexed.
+            Coordinate variables are always indexed.
+        storage_options (dict): Options passed to fsspec to open the files.
+        max_workers (int): The number of files to scan concurrently.
+
+    Returns:
+        A kerchunk version 1 reference dict.
+    """
+    if len(urls) == 0:
+        raise ValueError("Cannot build a reference index without any files.")
+
+    def scan(url):
+        fs, path = fsspec.core.url_to_fs(url, **(storage_options or {}))
+        return _scan_file(url, fs, path, variables=variables)
+
+    # Scan the files concurrently; the scans come back in the order of urls
+    scans = run_concurrently(scan, urls, max_workers=max_workers)
+
+    refs = {}
+    metas = {}
+    concat_offsets = {}
+    root_attrs = None
+    for url, (attrs, scanned) in zip(urls, scans):
+        if root_attrs is None:
+            root_attrs = attrs
+
+        for name, (meta, chunks) in scanned.items():
+            if name not in metas:
+                metas[name] = meta
+                concat_offsets[name] = 0
+            elif concat_dim not in meta['dims']:
+                continue
+
+            base = metas[name]
+            if meta['chunks'] != base['chunks'] or meta['dtype'] != base['dtype']:
+                raise ValueError(f"Chunking of {name} in {url} is inconsistent with the first file.")
+
+            if concat_dim in meta['dims']:
+                axis = meta['dims'].index(concat_dim)
+                offset = concat_offsets[name]
+                if offset % base['chunks'][axis] != 0:
+                    raise ValueError(f"Files along {concat_dim} must align with the chunks of {name}.")
+                for index, ref in chunks.items():
+                    index = list(index)
+                    index[axis] += offset // base['chunks'][axis]
+                    refs[_chunk_key(name, index)] = ref
+                concat_offsets[name] = offset + meta['shape'][axis]
+            else:
+                for index, ref in chunks.items():
+                    refs[_chunk_key(name, index)] = ref
+
+    refs['.zgroup'] = json.dumps({'zarr_format': 2})
+    refs['.zattrs'] = json.dumps(root_attrs)
+    for name, meta in metas.items():
+        shape = list(meta['shape'])
+        if concat_dim in meta['dims']:
+            shape[meta['dims'].index(concat_dim)] = concat_offsets[name]
+        refs[f'{name}/.zarray'] = json.dumps({
+            'zarr_format': 2,
+            'shape': shape,
+            'chunks': meta['chunks'],
+            'dtype': meta['dtype'],
+            'fill_value': meta['fill_value'],
+            'order': 'C',
+            'filters': meta['filters'],
+            'compressor': meta['compressor'],
+        })
+        refs[f'{name}/.zattrs'] = json.dumps({**meta['attrs'], '_ARRAY_DIMENSIONS': meta['dims']})
+
+    return {'version': 1, 'refs': refs}
+
+
+def referenced_urls(index):
+    """Get the set of file URLs referenced by a reference index."""
+    return {ref[0] for ref in index['refs'].values() if isinstance(ref, list)}
+
+
+def write_reference_index(index, url, storage_options=None):
+    """Write a reference index to a JSON file, creating its folder if needed."""
+    fs, path = fsspec.core.url_to_fs(url, **(storage_options or {}))
+    fs.makedirs(fs._parent(path), exist_ok=True)
+    with fs.open(path, 'w') as f:
+        json.dump(index, f)
+
+
+def read_reference_index(url, storage_options=None):
+    """Read a reference index from a JSON file."""
+    with fsspec.open(url, 'r', **(storage_options or {})) as f:
+        return json.load(f)
+
+
+def open_reference_index(index, remote_protocol=None, remote_options=None, chunks={}):
+    """Open a reference index as a single virtual zarr dataset.
+
+    Args:
+        index (dict, str): A reference dict or the path to a reference JSON file.
+        remote_protocol (str): The protocol of the referenced files, e.g. 'gcs'. If None,
+            it is inferred from the references.
+        remote_options (dict): Options for the filesystem of the referenced files.
+        chunks (dict): Chunks to open the dataset with.
+    """
+    fs = fsspec.filesystem('reference', fo=index, remote_protocol=remote_protocol,
+                           remote_options=remote_options or {})
+    return xr.open_dataset(fs.get_mapper(''), engine='zarr', consolidated=False, chunks=chunks)
@@ -0,0 +1,317 @@
+"""Conservative regridding with cached weights, and by coarsening nested grids.
+
+Conservative regridding between rectilinear grids factorizes into one weight matrix per
+dimension. xarray-regrid recomputes these matrices on every call, for example for every year
+of a dataset regridded a year at a time. Here the weights are computed once per source grid,
+target grid and method, stored on disk as sparse matrices, and applied as a blockwise sparse
+matrix product.
+
+When the target grid nests within the source grid, as global1_0 and global1_5 do within
+global0_25, no weight matrix is needed at all: each coarse cell is an area weighted sum over
+a fixed window of fine cells, computed with strided slices.
+"""
+import hashlib
+import os
+
+import dask.array
+import numpy as np
+import scipy.sparse
+import xarray as xr
+# Internal xarray-regrid functions, so its version is pinned in pyproject.toml
+from xarray_regrid import utils as regrid_utils
+from xarray_regrid.methods import conservative
+from xarray_regrid.regrid import validate_input
+
+try:
+    import sparse
+except ImportError:
+    sparse = None
+
+WEIGHTS_DIR = os.path.join(os.path.expanduser('~'), '.sheerwater', 'regrid_weights')
+
+# Weights already loaded in this process
+_WEIGHTS = {}
+
+# Finer grids that each coarse grid nests within, in order of preference
+FINER_GRIDS = {
+    'global1_0': ['global0_25'],
+    'global1_5': ['global0_25'],
+}
+
+
+def grid_hash(values):
+    """A short, stable hash of the values of a grid coordinate."""
+    values = np.round(np.asarray(values, dtype=np.float64), 8)
+    return hashlib.sha1(values.tobytes()).hexdigest()[:16]
+
+
+def _conservative_weights(source, target, spherical):
+    """The conservative weights from source to target cells along one dimension, as in xarray-regrid."""
+    weights = conservative.get_weights(source, target)
+    if spherical:
+        latitude_res = np.median(np.diff(source, 1))
+        lat_weights = conservative.lat_weight(source, latitude_res)
+        weights = regrid_utils.normalize_overlap(weights * lat_weights[:, np.newaxis])
+    return weights
+
+
+def regrid_weights(source, target, coord, target_grid, method='conservative', weights_dir=WEIGHTS_DIR):
+    """Get the sparse regridding weights along one dimension, from the cache if they exist.
+
+    Weights are keyed on hashes of both the source and the target coordinates, so a change to
+    either grid never reuses stale weights.
+
+    Args:
+        source (np.ndarray): The sorted source coordinates.
+        target (np.ndarray): The sorted target coordinates.
+        coord (str): The name of the coordinate. Latitude weights get the spherical correction.
+        target_grid (str): The name of the target grid, including any base and region.
+        method (str): The regridding method. Only 'conservative' is supported.
+        weights_dir (str): The directory the weights are stored in.
+
+    Returns:
+        scipy.sparse.csr_matrix: The weights, of shape (len(source), len(target)).
+    """
+    if method != 'conservative':
+        raise NotImplementedError(f"Cached weights are not implemented for {method} regridding.")
+
+    key = f"{grid_hash(source)}_{grid_hash(target)}_{target_grid}_{method}_{coord}"
+    if key in _WEIGHTS:
+        return _WEIGHTS[key]
+
+    path = os.path.join(weights_dir, f"{key}.npz")
+    weights = scipy.sparse.load_npz(path) if os.path.exists(path) else None
+    if weights is None:
+        weights = scipy.sparse.csr_matrix(_conservative_weights(source, target, spherical=coord in ['lat', 'latitude']))
+        os.makedirs(weights_dir, exist_ok=True)
+        # Write and rename so that concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        scipy.sparse.save_npz(tmp_path, weights)
+        os.replace(tmp_path, path)
+
+    _WEIGHTS[key] = weights
+    return weights
+
+
+def _format_weights(weights, coord, source, target, dtype, input_chunks, output_chunks):
+    """Wrap the weights for xr.dot, chunked 1:1 with the source data and as requested in the target."""
+    weights = weights.astype(np.result_type(np.float32, dtype))
+    data = sparse.COO.from_scipy_sparse(weights) if sparse is not None else weights.toarray()
+
+    if input_chunks is not None and output_chunks is None:
+        output_chunks = max(input_chunks)
+    if input_chunks is not None or output_chunks is not None:
+        chunks = (input_chunks if input_chunks is not None else -1,
+                  output_chunks if output_chunks is not None else -1)
+        data = dask.array.from_array(data, chunks=chunks, asarray=False)
+
+    return xr.DataArray(data, dims=[coord, f"target_{coord}"],
+                        coords={coord: source, f"target_{coord}": target})
+
+
+def cached_conservative_regrid(ds, ds_target_grid, target_grid, time_dim='time', skipna=True, nan_threshold=1.0,
+                               output_chunks=None, weights_dir=WEIGHTS_DIR):
+    """Conservatively regrid a dataset, reusing cached weights.
+
+    Gives the same result as ds.regrid.conservative from xarray-regrid.
+
+    Args:
+        ds (xr.Dataset): Dataset to regrid.
+        ds_target_grid (xr.Dataset): Dataset with the target coordinates.
+        target_grid (str): The name of the target grid, used to key the weights.
+        time_dim (str): The name of the time dimension.
+        skipna (bool): Whether to handle NaN values.
+        nan_threshold (float): The fraction of NaN inputs above which output points are NaN.
+        output_chunks (dict): Chunks for the output dataset (optional).
+        weights_dir (str): The directory the weights are stored in.
+    """
+    if not 0.0 <= nan_threshold <= 1.0:
+        raise ValueError("nan_threshold must be between 0 and 1.")
+
+    ds_target_grid = validate_input(ds, ds_target_grid, time_dim)
+    data = regrid_utils.format_for_regrid(ds, ds_target_grid)
+
+    # Make sure the regridding coordinates are sorted
+    coord_names = [coord for coord in ds_target_grid.coords if coord in data.coords]
+    target_sorted = xr.Dataset(coords=ds_target_grid.coords)
+    for coord in coord_names:
+        target_sorted = regrid_utils.ensure_monotonic(target_sorted, coord)
+        data = regrid_utils.ensure_monotonic(data, coord)
+
+    weights = {}
+    covered = {}
+    for coord in coord_names:
+        source = data[coord].to_numpy()
+        target = target_sorted[coord].to_numpy()
+        covered[coord] = (target_sorted[coord] <= source.max()) & (target_sorted[coord] >= source.min())
+        weights[coord] = regrid_weights(source, target, coord, target_grid, weights_dir=weights_dir)
+
+    data_vars = {}
+    for name, da in data.data_vars.items():
+        var_weights = {}
+        for coord in coord_names:
+            var_output_chunks = output_chunks.get(coord) if output_chunks else None
+            var_weights[coord] = _format_weights(weights[coord], coord, data[coord].to_numpy(),
+                                                 target_sorted[coord].to_numpy(), da.dtype,
+                                                 da.chunksizes.get(coord), var_output_chunks)
+        regridded = conservative.apply_weights(da=da, weights=var_weights, skipna=skipna,
+                                               nan_threshold=nan_threshold)
+        # Mask out any regridded points outside the original domain
+        var_covered = xr.DataArray(True)
+        for coord in var_weights:
+            var_covered = var_covered & covered[coord]
+        regridded = regridded.where(var_covered)
+        regridded.attrs = da.attrs
+        data_vars[name] = regridded
+
+    # Rebuild the results preserving attributes and other coordinates
+    ds_regridded = xr.Dataset(data_vars=data_vars, attrs=data.attrs)
+    for coord in data.coords:
+        if coord not in ds_regridded.coords:
+            ds_regridded[coord] = data.coords[coord]
+        ds_regridded[coord].attrs = data.coords[coord].attrs
+
+    return ds_regridded.reindex_like(ds_target_grid, copy=False)
+
+
+def _coarsen_plan(source, target):
+    """The coarsening factor and the index of the first target center in the source, or None if not nested.
+
+    The target nests within the source if both are evenly spaced, the target spacing is an integer
+    multiple of at least two source spacings and every target center is also a source center.
+    """
+    if len(source) < 2 or len(target) < 2:
+        return None
+    dx = np.diff(source)
+    dt = np.diff(target)
+    if not (np.allclose(dx, dx[0]) and np.allclose(dt, dt[0])):
+        return None
+    factor = int(round(dt[0] / dx[0]))
+    if factor < 2 or not np.isclose(dt[0], factor * dx[0]):
+        return None
+    idx = np.rint((target - source[0]) / dx[0]).astype(int)
+    if idx.min() < 0 or idx.max() >= len(source) or not np.allclose(source[idx], target):
+        return None
+    return factor, int(idx[0])
+
+
+def _coarsen_kernel(factor):
+    """The overlap of the fine cells at each offset from a coarse cell center, in units of fine cells.
+
+    For an even factor the coarse cell edges fall on fine cell centers, so the end cells count for half.
+    """
+    kernel = {}
+    for m in range(-factor, factor + 1):
+        overlap = min(m + 0.5, factor / 2) - max(m - 0.5, -factor / 2)
+        if overlap > 0:
+            kernel[m] = overlap
+    return kernel
+
+
+def _window_sum(da, dim, factor, start, count, wrap):
+    """Sum da over the kernel window of each of count coarse cells along dim, starting at fine index start."""
+    kernel = _coarsen_kernel(factor)
+    half = max(kernel)
+    da = da.drop_vars(dim, errors='ignore')
+    if wrap:
+        da = da.pad({dim: (half, half)}, mode='wrap')
+    else:
+        da = da.pad({dim: (half, half)}, mode='constant', constant_values=0)
+    total = None
+    for m, overlap in kernel.items():
+        first = start + half + m
+        term = overlap * da.isel({dim: slice(first, first + factor * (count - 1) + 1, factor)})
+        total = term if total is None else total + term
+    return total
+
+
+def can_coarsen(ds, ds_target_grid):
+    """Whether the target grid nests within the lat/lon grid of the dataset."""
+    return all(coord in ds.coords and coord in ds_target_grid.coords
+               and _coarsen_plan(ds[coord].to_numpy(), ds_target_grid[coord].to_numpy()) is not None
+               for coord in ['lat', 'lon'])
+
+
+def coarsen_regrid(ds, ds_target_grid, nan_threshold=1.0):
+    """Conservatively regrid a dataset to a grid that nests within its own by area weighted coarsening.
+
+    Gives the same result as ds.regrid.conservative from xarray-regrid, without building weight
+    matrices. Check that the grids nest with can_coarsen first.
+
+    Args:
+        ds (xr.Dataset): Dataset to regrid.
+        ds_target_grid (xr.Dataset): Dataset with the target coordinates.
+        nan_threshold (float): The fraction of NaN inputs above which output points are NaN.
+    """
+    ds = ds.sortby(['lat', 'lon'])
+    ds_target_grid = ds_target_grid.sortby(['lat', 'lon'])
+    lat = ds['lat'].to_numpy()
+    plans = {coord: _coarsen_plan(ds[coord].to_numpy(), ds_target_grid[coord].to_numpy()) for coord in ['lat', 'lon']}
+    if any(plan is None for plan in plans.values()):
+        raise ValueError("The target grid does not nest within the grid of the dataset.")
+    counts = {coord: ds_target_grid.sizes[coord] for coord in ['lat', 'lon']}
+    dlon = ds['lon'].diff('lon').max().item()
+    wrap = {'lat': False, 'lon': np.isclose(len(ds['lon']) * dlon, 360)}
+
+    def coarsen(da):
+        for coord in ['lat', 'lon']:
+            if coord in da.dims:
+                factor, start = plans[coord]
+                da = _window_sum(da, coord, factor, start, counts[coord], wrap[coord])
+        return da
+
+    valid_threshold = conservative.get_valid_threshold(nan_threshold)
+    data_vars = {}
+    for name, da in ds.data_vars.items():
+        if 'lat' not in da.dims and 'lon' not in da.dims:
+            data_vars[name] = da
+            continue
+        # Latitude bands are weighted by their area on the sphere, as in xarray-regrid
+        dtype = np.result_type(np.float32, da.dtype)
+        area = xr.DataArray(conservative.lat_weight(lat, np.median(np.diff(lat))).astype(dtype),
+                            dims=['lat'], coords={'lat': lat})
+        area = area if 'lat' in da.dims else xr.DataArray(dtype.type(1))
+        lon_ones = xr.DataArray(np.ones(ds.sizes['lon'], dtype=dtype), dims=['lon']) if 'lon' in da.dims else 1
+
+        weighted_sum = coarsen(da.fillna(0) * area)
+        valid_sum = coarsen(da.notnull() * area)
+        total = coarsen(area * lon_ones)
+        regridded = (weighted_sum / valid_sum.where(valid_sum > 0)).where(valid_sum / total >= valid_threshold)
+        regridded.attrs = da.attrs
+        data_vars[name] = regridded.transpose(*da.dims)
+
+    ds_regridded = xr.Dataset(data_vars=data_vars, attrs=ds.attrs)
+    ds_regridded = ds_regridded.assign_coords({coord: ds_target_grid[coord] for coord in ['lat', 'lon']})
+    for coord in ds.coords:
+        if coord not in ds_regridded.coords and not set(ds[coord].dims) & {'lat', 'lon'}:
+            ds_regridded[coord] = ds.coords[coord]
+    return ds_regridded
+
+
+def finer_grid_cache(fn, grid, start_time, end_time, **kwargs):
+    """Read the cached product of fn on a finer grid that grid nests within, if one has been cached.
+
+    The product is read on the global grid with no mask, and only used if it covers the requested
+    period. It records the grid it was read on in its derived_from_grid attribute, so products
+    coarsened from a finer grid can be told apart from those regridded from the source.
+
+    Args:
+        fn (callable): A cached function with start_time, end_time and grid arguments.
+        grid (str): The grid the product is wanted on.
+        start_time (str): The start date of the product.
+        end_time (str): The end date of the product.
+        **kwargs: The other arguments to fn.
+
+    Returns:
+        xr.Dataset: The product on the finer grid, or None if no finer cache exists.
+    """
+    for fine_grid in FINER_GRIDS.get(grid, []):
+        try:
+            ds = fn(start_time, end_time, grid=fine_grid, mask=None, region='global', fail_if_no_cache=True, **kwargs)
+        except RuntimeError:
+            continue
+        if ds is None or 'time' not in ds.dims or ds.sizes['time'] == 0:
+            continue
+        if ds.time.values[0] <= np.datetime64(start_time) and ds.time.values[-1] >= np.datetime64(end_time):
+            return ds.assign_attrs(derived_from_grid=fine_grid)
+    return None
@@ -4,10 +4,10 @@ import os
 import pwd
 from functools import wraps
 
-import coiled
-from coiled.credentials.google import send_application_default_credentials
 from dask.distributed import Client, LocalCluster, get_client
 
+from .graph_utils import graph_limits
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -65,6 +65,9 @@ config_options = {
 
 def start_remote(remote_name=None, remote_config=None):
     """Generic function to start a remote cluster."""
+    import coiled
+    from coiled.credentials.google import send_application_default_credentials
+
     default_name = 'sheerwater_' + pwd.getpwuid(os.getuid())[0]
 
     coiled_default_options = {
@@ -114,7 +117,11 @@ def start_remote(remote_name=None, remote_config=None):
 
 
 def dask_remote(func):
-    """Decorator to run a function on a remote dask cluster."""
+    """Decorator to run a function on a remote dask cluster.
+
+    The graph size limits of checks made during the call can be set with the max_graph_tasks,
+    max_graph_transfer_mb and on_graph_exceed keyword arguments. See check_graph.
+    """
     @wraps(func)
     def remote_wrapper(*args, **kwargs):
         # See if there are extra function args to run this remotely
@@ -151,5 +158,10 @@ def dask_remote(func):
         if 'local_dask' in kwargs:
             del kwargs['local_dask']
 
-        return func(*args, **kwargs)
+        limits = {key: kwargs.pop(key) for key in ['max_graph_tasks', 'max_graph_transfer_mb', 'on_graph_exceed']
+                  if key in kwargs}
+        with graph_limits(max_tasks=limits.get('max_graph_tasks'),
+                          max_transfer_mb=limits.get('max_graph_transfer_mb'),
+                          on_exceed=limits.get('on_graph_exceed')):
+            return func(*args, **kwargs)
     return remote_wrapper
@@ -1,5 +1,8 @@
 """Space utility functions for all parts of the data pipeline."""
+import dask
 import numpy as np
+import pandas as pd
+import pyarrow as pa
 import xarray as xr
 import logging
 
@@ -153,6 +156,98 @@ def is_station_grid(ds):
     return 'station_id' in ds.dims
 
 
+def nearest_grid_index(coords, points, tolerance=None):
+    """Find the index of the nearest grid coordinate for each point.
+
+    Args:
+        coords (array-like): The 1D grid coordinates. Need not be sorted.
+        points (array-like): The point coordinates to look up.
+        tolerance (float): If set, points farther than this from their nearest grid
+            coordinate get index -1.
+
+    Returns:
+        An integer array of grid indices, one per point.
+    """
+    coords = np.asarray(coords, dtype=float)
+    points = np.asarray(points, dtype=float)
+    if len(coords) == 1:
+        idx = np.zeros(len(points), dtype=int)
+    else:
+        order = np.argsort(coords)
+        sorted_coords = coords[order]
+        pos = np.searchsorted(sorted_coords, points).clip(1, len(coords) - 1)
+        # Step back to the left neighbor if it is at least as close
+        pos = pos - ((points - sorted_coords[pos - 1]) <= (sorted_coords[pos] - points))
+        idx = order[pos]
+
+    dist = np.abs(coords[idx] - points)
+    valid = ~np.isnan(dist)
+    if tolerance is not None:
+        valid &= dist <= tolerance
+    return np.where(valid, idx, -1)
+
+
+def extract_at_stations(products, station_ids, lats, lons, tolerance=None, dropna=True):
+    """Extract gridded products at station locations into a tidy Arrow table.
+
+    Integer (lat, lon) indices are computed once per distinct grid, and every product is
+    gathered with a vectorized isel in a single compute, so the full grids are never stacked.
+
+    Args:
+        products (dict): Mapping of product name to a DataArray with lat, lon and time dimensions.
+        station_ids (array-like): The station identifiers.
+        lats (array-like): The station latitudes.
+        lons (array-like): The station longitudes.
+        tolerance (float): Maximum distance from a station to its grid cell center. Stations
+            farther than this from every grid cell are dropped, with a warning naming them.
+        dropna (bool): Whether to drop rows with missing values.
+
+    Returns:
+        A pyarrow Table with columns station_id, time, product and value.
+    """
+    station_ids = np.asarray(station_ids)
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+
+    grid_indices = {}
+    selected = {}
+    for name, da in products.items():
+        key = (da['lat'].values.tobytes(), da['lon'].values.tobytes())
+        if key not in grid_indices:
+            lat_idx = nearest_grid_index(da['lat'].values, lats, tolerance)
+            lon_idx = nearest_grid_index(da['lon'].values, lons, tolerance)
+            valid = (lat_idx >= 0) & (lon_idx >= 0)
+            if not valid.all():
+                logger.warning(f"Dropped {(~valid).sum()} stations outside the grid of {name}: "
+                               f"{', '.join(str(station) for station in station_ids[~valid])}.")
+            grid_indices[key] = (lat_idx[valid], lon_idx[valid], station_ids[valid])
+        lat_idx, lon_idx, ids = grid_indices[key]
+
+        da = da.isel(lat=xr.DataArray(lat_idx, dims='station_id'), lon=xr.DataArray(lon_idx, dims='station_id'))
+        selected[name] = (da.drop_vars(['lat', 'lon']).transpose('time', 'station_id'), ids)
+
+    # Gather every product in one pass
+    values = dask.compute(*[da for da, _ in selected.values()])
+
+    tables = []
+    for (name, (da, ids)), vals in zip(selected.items(), values):
+        vals = np.asarray(vals.values, dtype=float)
+        table = {
+            'station_id': np.tile(ids, vals.shape[0]),
+            'time': np.repeat(da['time'].values, vals.shape[1]),
+            'product': pd.Categorical([name] * vals.size),
+            'value': vals.ravel(),
+        }
+        df = pd.DataFrame(table)
+        if dropna:
+            df = df.dropna(subset=['value'])
+        tables.append(pa.Table.from_pandas(df, preserve_index=False))
+
+    if len(tables) == 0:
+        return pa.table({'station_id': [], 'time': [], 'product': [], 'value': []})
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
 def base360_to_base180(lons):
     """Converts a list of longitudes from base 360 to base 180.
 
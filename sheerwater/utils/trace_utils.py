@@ -0,0 +1,251 @@
+"""Opt-in per-stage tracing of wall time, dask graph size and memory.
+
+Tracing is enabled by setting the SHEERWATER_TRACE_DIR environment variable, or by passing
+trace_dir to trace_call. Each traced call then writes one JSONL file with a record per span:
+its wall time, the time spent in local dask computes and building graphs, the number of tasks
+in the dask graph of its result and the peak resident memory of the process. Spans nest, so a
+trace can be converted with to_chrome_trace and viewed as a flame chart in Perfetto or
+chrome://tracing.
+
+When tracing is not enabled, spans do nothing.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+import dask
+from dask.callbacks import Callback
+
+TRACE_DIR_ENV = 'SHEERWATER_TRACE_DIR'
+
+# The trace of the call currently running, if tracing is enabled
+_TRACE = contextvars.ContextVar('sheerwater_trace', default=None)
+
+
+def _peak_rss_mb():
+    """The peak resident memory of this process, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def count_tasks(*results):
+    """The number of tasks in the dask graphs of the results, skipping anything that is not lazy."""
+    n_tasks = 0
+    for result in results:
+        if isinstance(result, dict):
+            n_tasks += count_tasks(*result.values())
+        elif result is not None and dask.is_dask_collection(result):
+            n_tasks += len(result.__dask_graph__())
+    return n_tasks
+
+
+class Span:
+    """A traced stage of a call."""
+
+    def __init__(self, trace, name, parent, attrs):
+        """Open a span as a child of parent."""
+        self.trace = trace
+        self.name = name
+        self.id = trace.n_spans
+        trace.n_spans += 1
+        self.parent = parent.id if parent is not None else None
+        self.depth = len(trace.stack)
+        self.attrs = attrs
+        self.n_tasks = None
+        self.compute_time = 0.0
+        self.start = time.perf_counter()
+
+    def record(self, *results):
+        """Record the number of tasks in the dask graphs of the results of the span."""
+        self.n_tasks = count_tasks(*results)
+
+    def finish(self):
+        """Close the span and add its record to the trace."""
+        wall_time = time.perf_counter() - self.start
+        self.trace.records.append({
+            'name': self.name,
+            'id': self.id,
+            'parent': self.parent,
+            'depth': self.depth,
+            'start': self.start - self.trace.start,
+            'wall_time': wall_time,
+            'compute_time': self.compute_time,
+            'graph_build_time': wall_time - self.compute_time,
+            'n_tasks': self.n_tasks,
+            'peak_rss_mb': _peak_rss_mb(),
+            'attrs': self.attrs,
+        })
+
+
+class _NullSpan:
+    """A span that records nothing, used when tracing is not enabled."""
+
+    def record(self, *results):
+        """Do nothing."""
+        pass
+
+
+class _ComputeTimer(Callback):
+    """Attribute the time of local dask computes to all open spans.
+
+    Computes on a distributed cluster do not run these callbacks, so their time counts as graph building.
+    """
+
+    def __init__(self, trace):
+        super().__init__()
+        self.trace = trace
+        self.started = None
+
+    def _start(self, dsk):  # noqa: ARG002
+        self.started = time.perf_counter()
+
+    def _finish(self, dsk, state, errored):  # noqa: ARG002
+        if self.started is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        for span in self.trace.stack:
+            span.compute_time += elapsed
+        self.started = None
+
+
+class Trace:
+    """The spans of one traced call, written to a JSONL file when the call finishes."""
+
+    def __init__(self, path):
+        """Start a trace to be written to path."""
+        self.path = path
+        self.records = []
+        self.stack = []
+        self.n_spans = 0
+        self.start = time.perf_counter()
+
+    def write(self):
+        """Write the span records, in the order they started."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w') as f:
+            for record in sorted(self.records, key=lambda r: r['start']):
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextmanager
+def span(name, **attrs):
+    """Trace a stage of the current call.
+
+    Args:
+        name (str): The name of the stage.
+        **attrs: Attributes to record with the span.
+
+    Yields:
+        The span. Call span.record(result) to record the dask graph size of the result of the stage.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        yield _NullSpan()
+        return
+
+    parent = trace.stack[-1] if trace.stack else None
+    current = Span(trace, name, parent, attrs)
+    trace.stack.append(current)
+    try:
+        yield current
+    finally:
+        trace.stack.pop()
+        current.finish()
+
+
+@contextmanager
+def trace_call(name, trace_dir=None, **attrs):
+    """Trace a call, writing its spans to a JSONL file if tracing is enabled.
+
+    Calls made inside an already traced call are recorded as spans of the outer trace.
+
+    Args:
+        name (str): The name of the call.
+        trace_dir (str): The directory to write the trace to. Defaults to SHEERWATER_TRACE_DIR.
+        **attrs: Attributes to record with the root span.
+
+    Yields:
+        The root span of the call.
+    """
+    trace_dir = trace_dir or os.environ.get(TRACE_DIR_ENV)
+    if trace_dir is None or _TRACE.get() is not None:
+        with span(name, **attrs) as root:
+            yield root
+        return
+
+    path = os.path.join(trace_dir, f"{name}_{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{time.time_ns()}.jsonl")
+    trace = Trace(path)
+    token = _TRACE.set(trace)
+    timer = _ComputeTimer(trace)
+    timer.register()
+    try:
+        with span(name, **attrs) as root:
+            yield root
+    finally:
+        timer.unregister()
+        _TRACE.reset(token)
+        trace.write()
+
+
+def traced(name):
+    """Decorator tracing each call of a function with trace_call.
+
+    Placed above a cache decorator, the trace also covers the cache read or write. Scalar arguments
+    of the call are recorded as attributes of the root span.
+    """
+    def decorator(func):
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def traced_wrapper(*args, **kwargs):
+            try:
+                arguments = sig.bind_partial(*args, **kwargs).arguments
+            except TypeError:
+                arguments = kwargs
+            attrs = {k: v for k, v in arguments.items() if isinstance(v, (str, int, float, bool)) or v is None}
+            with trace_call(name, **attrs) as s:
+                result = func(*args, **kwargs)
+                s.record(result)
+            return result
+        return traced_wrapper
+    return decorator
+
+
+def to_chrome_trace(trace_path, output_path=None):
+    """Convert a JSONL trace to the Chrome trace event format, to view as a flame chart.
+
+    Args:
+        trace_path (str): The JSONL trace written by trace_call.
+        output_path (str): Where to write the Chrome trace. Defaults to the trace path with a .json suffix.
+
+    Returns:
+        str: The path of the Chrome trace.
+    """
+    with open(trace_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    events = []
+    for record in records:
+        args = {key: record[key] for key in ['compute_time', 'graph_build_time', 'n_tasks', 'peak_rss_mb']}
+        args.update(record['attrs'])
+        events.append({
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start'] * 1e6,
+            'dur': record['wall_time'] * 1e6,
+            'pid': 0,
+            'tid': 0,
+            'args': args,
+        })
+
+    output_path = output_path or os.path.splitext(trace_path)[0] + '.json'
+    with open(output_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return output_path
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""Regenerate the registry manifest and measure the import time of a source lookup.
+
+The import time of get_forecast/get_data is measured in fresh interpreters, once loading only the
+module of the source from the manifest, and once importing every source first as lookups did before
+the manifest existed.
+"""
+
+import argparse
+import subprocess
+import sys
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--write", action="store_true", help="Regenerate the manifest shipped with the package")
+parser.add_argument("-s", "--source", type=str, default="era5", help="The forecast or data source to look up")
+parser.add_argument("-r", "--repeats", type=int, default=3, help="The number of fresh interpreters to time")
+args = parser.parse_args()
+
+if args.write:
+    from sheerwater.interfaces.datasets import REGISTRY_MANIFEST_PATH, write_registry_manifest
+    write_registry_manifest()
+    print(f"Wrote {REGISTRY_MANIFEST_PATH}")
+
+lookup = ("import sys, time; start = time.perf_counter(); "
+          "from sheerwater.interfaces import datasets{setup}; "
+          f"datasets.get_forecast_or_data({args.source!r}); "
+          "print(time.perf_counter() - start, len([m for m in sys.modules if m.startswith('sheerwater.')]))")
+
+for label, setup in [("all sources", "; datasets.import_all_sources()"), ("manifest", "")]:
+    times = []
+    for _ in range(args.repeats):
+        out = subprocess.run([sys.executable, "-c", lookup.format(setup=setup)],
+                             capture_output=True, text=True, check=True).stdout
+        elapsed, n_modules = out.strip().splitlines()[-1].split()
+        times.append(float(elapsed))
+    print(f"{label}: best {min(times):.2f}s over {args.repeats} runs, {n_modules} sheerwater modules imported")